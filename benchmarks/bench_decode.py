@@ -0,0 +1,158 @@
+##
+## Created : Sun Oct 18 22:03:37 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Decoding of contact elements: the tag dispatch tables of Item and
+## Contact against the regular expression unQName() and if/elif chain they
+## replaced, a copy of which is kept below for reference. Only the walk
+## over the child elements is timed; the rest of Contact construction is
+## the same either way. Run from the top level directory as:
+##
+##   python benchmarks/bench_decode.py [num_items] [rounds]
+##
+
+import os, re, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from   bench_suite                  import getitem_response, measure
+from   pyews.pyews                  import ExchangeService
+from   pyews.soap                   import SoapClient, QName_T, unQName
+from   pyews.ews.contact            import Contact
+from   pyews.ews.item               import Item, ParentFolderId, ItemClass
+from   pyews.ews.item               import ParentFolderChangeKey
+from   pyews.ews.item               import DateTimeCreated, LastModifiedTime
+
+def legacy_unQName (name):
+    res = re.match('{.*}(.*)', name)
+    return name if res is None else res.group(1)
+
+def legacy_decode (c, rnode):
+    for child in rnode:
+        tag = legacy_unQName(child.tag)
+
+        if tag == 'ItemId':
+            c.itemid.value = child.attrib['Id']
+            c.change_key.value = child.attrib['ChangeKey']
+        elif tag == 'ParentFolderId':
+            c.parent_fid = ParentFolderId(child.attrib['Id'])
+            c.parent_fck = ParentFolderChangeKey(child.attrib['ChangeKey'])
+        elif tag == 'ItemClass':
+            c.item_class = ItemClass(child.text)
+        elif tag == 'LastModifiedTime':
+            c.last_modified_time = LastModifiedTime(child.text)
+        elif tag == 'DateTimeCreated':
+            c.created_time = DateTimeCreated(child.text)
+
+    for child in rnode:
+        tag = legacy_unQName(child.tag)
+
+        if tag == 'FileAs':
+            c.file_as.value = child.text
+        elif tag == 'Alias':
+            c.alias.value = child.text
+        elif tag == 'SpouseName':
+            c.spouse_name.value = child.text
+        elif tag == 'JobTitle':
+            c.job_title.value = child.text
+        elif tag == 'CompanyName':
+            c.company_name.value = child.text
+        elif tag == 'Department':
+            c.department.value = child.text
+        elif tag == 'Manager':
+            c.manager.value = child.text
+        elif tag == 'AssistantName':
+            c.assistant_name.value = child.text
+        elif tag == 'Birthday':
+            c.birthday.value = child.text
+        elif tag == 'WeddingAnniversary':
+            c.anniversary.value = child.text
+        elif tag == 'GivenName':
+            c.complete_name.given_name.value = child.text
+        elif tag == 'Surname':
+            c.complete_name.surname.value = child.text
+        elif tag == 'Initials':
+            c.complete_name.initials.value = child.text
+        elif tag == 'DisplayName':
+            c.display_name.value = child.text
+        elif tag == 'Body':
+            c.notes.value = child.text
+        elif tag == 'EmailAddresses':
+            c.emails.populate_from_node(child)
+        elif tag == 'ImAddresses':
+            c.ims.populate_from_node(child)
+        elif tag == 'PhoneNumbers':
+            c.phones.populate_from_node(child)
+        elif tag == 'BusinessHomePage':
+            c.business_home_page.value = child.text
+        elif tag == 'ExtendedProperty':
+            c.add_extended_property(node=child)
+
+def table_decode (c, rnode):
+    c._decode_children(rnode, Item.base_decoders)
+    c._decode_children(rnode, Contact.decoders)
+
+def summary (c):
+    return (c.itemid.value, c.change_key.value, c.display_name.value,
+            c.complete_name.given_name.value, c.complete_name.surname.value,
+            c.company_name.value, c.job_title.value, c.notes.value,
+            str(c.emails), str(c.phones), c.gender.value)
+
+def main (argv):
+    n = int(argv[1]) if len(argv) > 1 else 10000
+    rounds = int(argv[2]) if len(argv) > 2 else 5
+
+    ews = ExchangeService()
+    node = SoapClient.parse_xml(getitem_response(n))
+    cnodes = list(node.iter(QName_T('Contact')))
+    tags = [child.tag for cnode in cnodes for child in cnode]
+
+    def setup ():
+        return [Contact(ews) for i in range(n)]
+
+    def decoder (fn):
+        def run (cons):
+            for c, cnode in zip(cons, cnodes):
+                fn(c, cnode)
+        return run
+
+    t_legacy = measure(decoder(legacy_decode), rounds, setup)
+    t_table = measure(decoder(table_decode), rounds, setup)
+
+    t_re = measure(lambda s: [legacy_unQName(t) for t in tags], rounds)
+    t_un = measure(lambda s: [unQName(t) for t in tags], rounds)
+
+    cons_legacy = setup()
+    decoder(legacy_decode)(cons_legacy)
+    cons_table = setup()
+    decoder(table_decode)(cons_table)
+    same = ([summary(c) for c in cons_legacy] ==
+            [summary(c) for c in cons_table])
+
+    print 'Decoding %d contacts (%d elements), best of %d rounds' % (
+        n, len(tags), rounds)
+    print '  %-22s %9.2f ms' % ('if/elif + regex', t_legacy * 1000)
+    print '  %-22s %9.2f ms' % ('tag table', t_table * 1000)
+    print '  %-22s %9.2fx' % ('speedup', t_legacy / t_table)
+    print '  %-22s %9.2f ms -> %.2f ms' % ('unQName', t_re * 1000, t_un * 1000)
+    print '  %-22s %9s' % ('same fields', same)
+
+if __name__ == '__main__':
+    main(sys.argv)
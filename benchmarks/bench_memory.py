@@ -0,0 +1,204 @@
+##
+## Created : Sun Oct 18 22:41:09 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Memory held per Contact, for contacts decoded from a GetItem response and
+## for contacts built up locally. Two figures are given for each:
+##
+##   reachable   sys.getsizeof() of every object reachable from the
+##               contacts, not counting the service and the parsed response
+##               elements they point to, nor anything counted already
+##   rss         growth of the resident set size of the process while the
+##               contacts were made
+##
+## Run from the top level directory as:
+##
+##   python benchmarks/bench_memory.py [num_items] [--baseline REV]
+##
+## With --baseline the same figures are worked out in a process of its own
+## for the pyews of git revision REV, and shown next to the present ones.
+## For instance, to see what keeping item fields in __slots__ saved, give
+## the revision from before that change.
+##
+
+import argparse, gc, json, os, resource, shutil, subprocess, sys, tarfile
+import tempfile
+
+TOP = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+KINDS = ['decoded', 'built']
+
+def rss ():
+    """Resident set size of this process in bytes."""
+
+    try:
+        with open('/proc/self/statm') as inf:
+            return int(inf.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        ## Peak rather than present, but it only grows here anyway
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def reachable (roots, skip):
+    """
+    Return the total sys.getsizeof() of the objects reachable from roots,
+    each counted once. Types, and objects for which skip(obj) is True, are
+    neither counted nor followed.
+    """
+
+    seen = set()
+    todo = list(roots)
+    total = 0
+
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen or isinstance(obj, type) or skip(obj):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        todo.extend(gc.get_referents(obj))
+
+    return total
+
+def measure_contacts (make, n, skip, keep):
+    """
+    Make n contacts with make(i) and return the bytes per contact. The
+    contacts are appended to keep, so that the memory of one run is not
+    reused by the next one and hidden from the rss figure.
+    """
+
+    gc.collect()
+    before = rss()
+    cons = [make(i) for i in range(n)]
+    gc.collect()
+    grown = rss() - before
+    keep.append(cons)
+
+    return reachable(cons, skip) / n, grown / n
+
+def getitem_response (n):
+    """
+    A GetItem response with n synthetic contacts, as bench_suite makes it.
+    bench_suite is not imported for it as it needs much of the present
+    pyews, and this has to run against older revisions too.
+    """
+
+    from   pyews.mock.mailbox  import Mailbox, PR_GENDER
+    from   pyews.mock.mailbox  import PR_LAST_MODIFICATION_TIME
+    from   pyews.mock.server   import ItemShape, contact_xml, response_xml
+    from   pyews.mock.server   import success_xml
+
+    mb = Mailbox.synthetic(contacts=n)
+    shape = ItemShape()
+    shape.eprops = [(PR_GENDER, 'Short'), (PR_LAST_MODIFICATION_TIME,
+                                           'SystemTime')]
+    items = mb.get_folder(distinguished='contacts').items.values()
+
+    return response_xml('GetItem', [success_xml('GetItem',
+                                                '<m:Items>%s</m:Items>' %
+                                                contact_xml(x, shape))
+                                    for x in items])
+
+def measure (n):
+    """
+    Return a dictionary with the (reachable, rss) bytes per contact of n
+    contacts of each of the KINDS, for the pyews first on sys.path.
+    """
+
+    ## pyews first, as bench_render puts the top level directory at the
+    ## front of sys.path
+    from   pyews.pyews                  import ExchangeService
+    from   pyews.soap                   import SoapClient, QName_T
+    from   pyews.ews.contact            import Contact
+    from   bench_render                 import make_contact
+
+    ews = ExchangeService()
+    node = SoapClient.parse_xml(getitem_response(n))
+    cnodes = list(node.iter(QName_T('Contact')))
+    etype = type(node)
+
+    def skip (obj):
+        return obj is ews or isinstance(obj, etype)
+
+    def decoded (i):
+        return Contact(ews, resp_node=cnodes[i])
+
+    def built (i):
+        return make_contact(ews, i)
+
+    keep = []
+    makers = {'decoded' : decoded, 'built' : built}
+    return dict((kind, measure_contacts(makers[kind], n, skip, keep))
+                for kind in KINDS)
+
+def measure_revision (rev, n):
+    """
+    Run this benchmark in a process of its own against the pyews of git
+    revision rev, and return its results as measure() does.
+    """
+
+    tmp = tempfile.mkdtemp(prefix='pyews-bench-')
+    try:
+        git = subprocess.Popen(['git', 'archive', rev, 'pyews'], cwd=TOP,
+                               stdout=subprocess.PIPE)
+        try:
+            tarfile.open(fileobj=git.stdout, mode='r|').extractall(tmp)
+        except tarfile.TarError:
+            pass
+        if git.wait() != 0:
+            sys.exit('bench_memory: cannot get pyews of revision %s' % rev)
+
+        out = subprocess.check_output([sys.executable,
+                                       os.path.abspath(__file__), str(n),
+                                       '--json', '--pyews', tmp])
+        return dict((k, tuple(v)) for k, v in json.loads(out).iteritems())
+    finally:
+        shutil.rmtree(tmp)
+
+def main (argv):
+    parser = argparse.ArgumentParser(description='Memory held per Contact')
+    parser.add_argument('num_items', type=int, nargs='?', default=10000)
+    parser.add_argument('--baseline', default=None,
+                        help='git revision of pyews to compare with')
+    parser.add_argument('--json', action='store_true',
+                        help='Write the results as JSON')
+    parser.add_argument('--pyews', default=TOP, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv[1:])
+
+    n = args.num_items
+    sys.path.insert(0, args.pyews)
+    base = measure_revision(args.baseline, n) if args.baseline else None
+    now = measure(n)
+
+    if args.json:
+        json.dump(now, sys.stdout)
+        return
+
+    print 'Bytes per contact, %d contacts' % n
+    print '  %-10s %-10s %12s %12s %8s' % ('', '', 'baseline', 'now',
+                                           'ratio')
+    for kind in KINDS:
+        for i, figure in enumerate(['reachable', 'rss']):
+            b = '%d' % base[kind][i] if base is not None else '-'
+            r = ('%.2fx' % (float(now[kind][i]) / base[kind][i])
+                 if base is not None and base[kind][i] else '-')
+            print '  %-10s %-10s %12s %12d %8s' % (kind, figure, b,
+                                                   now[kind][i], r)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,99 @@
+##
+## Created : Sun Oct 18 13:02:44 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Render time of CreateItem requests: the tornado templates against the
+## direct envelope builder. No server is needed. Run from the top level
+## directory as:
+##
+##   python benchmarks/bench_render.py [num_items] [rounds]
+##
+
+import gc, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from   pyews.pyews                  import ExchangeService
+from   pyews.ews.contact            import Contact
+from   pyews.ews.data               import GenderType
+from   pyews.ews.request_response   import CreateItemsRequest
+
+def make_contact (ews, i):
+    c = Contact(ews, 'folder-id')
+    c.complete_name.given_name.value = 'Given%d' % i
+    c.complete_name.surname.value = 'Surname & Co %d' % i
+    c.display_name.value = 'Given%d Surname %d' % (i, i)
+    c.company_name.value = 'Company %d' % i
+    c.job_title.value = 'Engineer'
+    c.emails.add('EmailAddress1', 'user%d@example.com' % i)
+    c.phones.add('MobilePhone', '+91 98450 %05d' % i)
+    c.notes.value = 'Notes for contact number %d' % i
+    c.gender.val.value = str(GenderType.Female)
+    return c
+
+def best_of (rounds, fns):
+    """
+    Run each of fns rounds times, interleaved so that they see the same
+    machine conditions, and return the best time and the last result of
+    each. The garbage collector is off while timing, as in timeit.
+    """
+
+    best = [None] * len(fns)
+    rets = [None] * len(fns)
+
+    gc.disable()
+    try:
+        for r in range(rounds):
+            for i, fn in enumerate(fns):
+                start = time.time()
+                rets[i] = fn()
+                t = time.time() - start
+                if best[i] is None or t < best[i]:
+                    best[i] = t
+    finally:
+        gc.enable()
+
+    return zip(best, rets)
+
+def main (argv):
+    n = int(argv[1]) if len(argv) > 1 else 1000
+    rounds = int(argv[2]) if len(argv) > 2 else 10
+
+    ews = ExchangeService()
+    items = [make_contact(ews, i) for i in range(n)]
+    req = CreateItemsRequest(ews, folder_id='folder-id', items=items)
+
+    def render (use_templates):
+        ews.use_templates = use_templates
+        return req.render()
+
+    ((t_tmpl, body_tmpl),
+     (t_env,  body_env)) = best_of(rounds, [lambda: render(True),
+                                            lambda: render(False)])
+
+    print 'CreateItem with %d contacts, best of %d rounds' % (n, rounds)
+    print '  %-10s %8.2f ms %10d bytes' % ('template', t_tmpl * 1000,
+                                           len(body_tmpl))
+    print '  %-10s %8.2f ms %10d bytes' % ('envelope', t_env * 1000,
+                                           len(body_env))
+    print '  speedup    %8.2fx' % (t_tmpl / t_env)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,153 @@
+##
+## Created : Mon Oct 19 00:12:47 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Finding the faults, response messages, paging attributes, sync state and
+## items of large GetItem, FindItem and SyncFolderItems responses: a single
+## ResponseScan against the walk per lookup the Response classes used to
+## make, a copy of which is kept below for reference. Decoding the items
+## themselves is not included. Run from the top level directory as:
+##
+##   python benchmarks/bench_response.py [num_items] [rounds]
+##
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from   bench_suite                  import getitem_response, measure
+from   pyews.soap                   import SoapClient, QName_M, QName_S
+from   pyews.soap                   import QName_T
+from   pyews.ews.request_response   import ResponseScan
+from   pyews.mock.mailbox           import Mailbox
+from   pyews.mock.server            import ItemShape, contact_xml
+from   pyews.mock.server            import response_xml, success_xml
+
+CONTACT = QName_T('Contact')
+
+def finditem_response (n):
+    mb = Mailbox.synthetic(contacts=n)
+    items = mb.get_folder(distinguished='contacts').items.values()
+    shape = ItemShape()
+
+    return response_xml('FindItem', [success_xml(
+        'FindItem',
+        '<m:RootFolder IndexedPagingOffset="%d" TotalItemsInView="%d" '
+        'IncludesLastItemInRange="true"><t:Items>%s</t:Items>'
+        '</m:RootFolder>' % (n, n, ''.join(contact_xml(x, shape)
+                                          for x in items)))])
+
+def sync_response (n):
+    mb = Mailbox.synthetic(contacts=n)
+    items = mb.get_folder(distinguished='contacts').items.values()
+    shape = ItemShape()
+
+    return response_xml('SyncFolderItems', [success_xml(
+        'SyncFolderItems',
+        '<m:SyncState>state</m:SyncState>'
+        '<m:IncludesLastItemInRange>true</m:IncludesLastItemInRange>'
+        '<m:Changes>%s</m:Changes>' % ''.join('<t:Create>%s</t:Create>' %
+                                              contact_xml(x, shape)
+                                              for x in items))])
+
+##
+## The lookups as they were made before, one walk over the tree each
+##
+
+def legacy_messages (node, tag):
+    list(node.iter(QName_S('Fault')))
+    return [m.attrib['ResponseClass'] for m in node.iter(tag)]
+
+def legacy_getitem (node):
+    legacy_messages(node, QName_M('GetItemResponseMessage'))
+    return list(node.iter(CONTACT))
+
+def legacy_finditem (node):
+    gna = SoapClient.get_node_attribute
+    gna(node, 'RootFolder', 'IncludesLastItemInRange')
+    gna(node, 'RootFolder', 'TotalItemsInView')
+    legacy_messages(node, QName_M('FindItemResponseMessage'))
+    return list(node.iter(CONTACT))
+
+def legacy_sync (node):
+    find_child = SoapClient.find_first_child
+    legacy_messages(node, QName_M('SyncFolderItemsResponseMessage'))
+    find_child(node, QName_M('SyncState'))
+    find_child(node, QName_M('IncludesLastItemInRange'))
+    return [child for tag in ('Create', 'Update', 'Delete')
+            for change in node.iter(QName_T(tag)) for child in change]
+
+##
+## The same with a ResponseScan
+##
+
+def scan_messages (scan, tag):
+    scan.find_all(QName_S('Fault'))
+    return [m.attrib['ResponseClass'] for m in scan.find_all(tag)]
+
+def scan_getitem (node):
+    scan = ResponseScan(node)
+    scan_messages(scan, QName_M('GetItemResponseMessage'))
+    return scan.find_all(CONTACT)
+
+def scan_finditem (node):
+    scan = ResponseScan(node)
+    root = scan.find_all(QName_M('RootFolder'))[0]
+    root.attrib.get('IncludesLastItemInRange')
+    root.attrib.get('TotalItemsInView')
+    scan_messages(scan, QName_M('FindItemResponseMessage'))
+    return scan.find_all(CONTACT)
+
+def scan_sync (node):
+    scan = ResponseScan(node)
+    scan_messages(scan, QName_M('SyncFolderItemsResponseMessage'))
+    scan.find_all(QName_M('SyncState'))
+    scan.find_all(QName_M('IncludesLastItemInRange'))
+    return [child for tag in ('Create', 'Update', 'Delete')
+            for change in scan.find_all(QName_T(tag)) for child in change]
+
+def main (argv):
+    n = int(argv[1]) if len(argv) > 1 else 10000
+    rounds = int(argv[2]) if len(argv) > 2 else 5
+
+    cases = [
+        ('GetItem',         getitem_response,  legacy_getitem,  scan_getitem),
+        ('FindItem',        finditem_response, legacy_finditem, scan_finditem),
+        ('SyncFolderItems', sync_response,     legacy_sync,     scan_sync),
+    ]
+
+    print 'Responses with %d items, best of %d rounds' % (n, rounds)
+    print '  %-16s %10s %10s %10s %8s' % ('', 'parse_xml', 'walks', 'scan',
+                                          'speedup')
+    for name, make, legacy, scan in cases:
+        data = make(n)
+        node = SoapClient.parse_xml(data)
+        assert legacy(node) == scan(node)
+
+        t_parse = measure(lambda s: SoapClient.parse_xml(data), rounds)
+        t_legacy = measure(lambda s: legacy(node), rounds)
+        t_scan = measure(lambda s: scan(node), rounds)
+
+        print '  %-16s %8.1fms %8.1fms %8.1fms %7.1fx' % (
+            name, t_parse * 1000, t_legacy * 1000, t_scan * 1000,
+            t_legacy / t_scan)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,329 @@
+##
+## Created : Sun Oct 18 14:52:10 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Times each layer of pyews separately, for a range of folder sizes:
+##
+##   render_template     CreateItem request for N contacts, from templates
+##   render_envelope     The same, built by ews.envelope
+##   write_to_xml        Field.write_to_xml() of N contacts
+##   parse_xml           SoapClient.parse_xml() of a GetItem response
+##   parse_for_faults    Response() of that response, which is one walk over
+##                       it by ResponseScan and parse_for_faults()
+##   parse_for_errors    A fresh ResponseScan of that response and
+##                       Response.parse_for_errors() from it
+##   contact_init        Contact._init_from_resp() of the N contacts in it
+##   contact_lazy        Lazy Contacts of them, reading only their ItemIds,
+##                       ChangeKeys and display names
+##   item_columns        ItemColumns.add_all() of the response, all columns
+##   find_items          ExchangeService.FindItems() against the mock server
+##
+## Results are written as JSON so that runs can be compared across
+## releases. Run from the top level directory as:
+##
+##   python benchmarks/bench_suite.py [--sizes 100,10000] [--stages ...]
+##                                    [--output results.json]
+##                                    [--compare baseline.json]
+##
+
+import argparse, gc, json, os, platform, subprocess, sys, time
+
+TOP = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, TOP)
+
+from   bench_render                 import make_contact
+from   pyews.pyews                  import ExchangeService, WebCredentials
+from   pyews.soap                   import SoapClient, SessionPool
+from   pyews.soap                   import QName_M, QName_T
+from   pyews.ews.columns            import ItemColumns
+from   pyews.ews.contact            import Contact
+from   pyews.ews.folder             import Folder
+from   pyews.ews.request_response   import CreateItemsRequest
+from   pyews.ews.request_response   import GetItemsRequest, Response
+from   pyews.ews.request_response   import ResponseScan
+from   pyews.mock.mailbox           import Mailbox, PR_GENDER
+from   pyews.mock.mailbox           import PR_LAST_MODIFICATION_TIME
+from   pyews.mock.server            import MockEWSServer, ItemShape
+from   pyews.mock.server            import contact_xml, response_xml
+from   pyews.mock.server            import success_xml
+
+DEFAULT_SIZES = [100, 10000, 100000]
+
+STAGES = ['render_template', 'render_envelope', 'write_to_xml', 'parse_xml',
+          'parse_for_faults', 'parse_for_errors', 'contact_init',
+          'contact_lazy', 'item_columns', 'find_items']
+
+def measure (fn, rounds, setup=None):
+    """
+    Return the best of rounds timings of fn(state), where state is what
+    setup() returns (None if there is no setup). setup is not timed. The
+    garbage collector is off while timing, as in timeit.
+    """
+
+    best = None
+    for i in range(rounds):
+        state = setup() if setup is not None else None
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.time()
+            fn(state)
+            t = time.time() - start
+        finally:
+            gc.enable()
+        if best is None or t < best:
+            best = t
+
+    return best
+
+def getitem_response (n):
+    """A GetItem response with n synthetic contacts, as the server would
+    send it to pyews."""
+
+    mb = Mailbox.synthetic(contacts=n)
+    shape = ItemShape()
+    shape.eprops = [(PR_GENDER, 'Short'), (PR_LAST_MODIFICATION_TIME,
+                                           'SystemTime')]
+    items = mb.get_folder(distinguished='contacts').items.values()
+
+    return response_xml('GetItem', [success_xml('GetItem',
+                                                '<m:Items>%s</m:Items>' %
+                                                contact_xml(x, shape))
+                                    for x in items])
+
+class Suite(object):
+    def __init__ (self, rounds):
+        self.rounds = rounds
+        self.ews = ExchangeService()
+
+    ##
+    ## Stages. Each returns the time taken for n items and a dictionary of
+    ## any extra information worth recording.
+    ##
+
+    def render_template (self, n):
+        return self._render(n, True)
+
+    def render_envelope (self, n):
+        return self._render(n, False)
+
+    def write_to_xml (self, n):
+        items = [make_contact(self.ews, i) for i in range(n)]
+
+        def run (state):
+            for item in items:
+                item.write_to_xml()
+
+        return measure(run, self.rounds), {}
+
+    def parse_xml (self, n):
+        data = getitem_response(n)
+        t = measure(lambda s: SoapClient.parse_xml(data), self.rounds)
+        return t, {'bytes' : len(data)}
+
+    def parse_for_faults (self, n):
+        ## The elements parse_for_faults() looks at are found by the scan
+        ## made when the Response is built, so that has to be timed too
+        req, node = self._response(n)
+        return measure(lambda s: Response(req, node), self.rounds), {}
+
+    def parse_for_errors (self, n):
+        req, node = self._response(n)
+        tag = QName_M('GetItemResponseMessage')
+
+        def setup ():
+            return Response(req, node)
+
+        def run (resp):
+            resp.scan = ResponseScan(node)
+            resp.parse_for_errors(tag)
+
+        return measure(run, self.rounds, setup), {}
+
+    def contact_init (self, n):
+        node = SoapClient.parse_xml(getitem_response(n))
+        cnodes = list(node.iter(QName_T('Contact')))
+
+        def setup ():
+            cons = []
+            for cnode in cnodes:
+                c = Contact(self.ews)
+                c.resp_node = cnode
+                cons.append(c)
+            return cons
+
+        def run (cons):
+            for c in cons:
+                c._init_from_resp()
+
+        return measure(run, self.rounds, setup), {}
+
+    def contact_lazy (self, n):
+        node = SoapClient.parse_xml(getitem_response(n))
+        cnodes = list(node.iter(QName_T('Contact')))
+
+        def run (state):
+            for cnode in cnodes:
+                c = Contact(self.ews, resp_node=cnode, lazy=True)
+                c.itemid.value, c.change_key.value, c.display_name.value
+
+        return measure(run, self.rounds), {}
+
+    def item_columns (self, n):
+        node = SoapClient.parse_xml(getitem_response(n))
+        return measure(lambda s: ItemColumns().add_all(node), self.rounds), {}
+
+    def find_items (self, n):
+        ## Anything more than a couple of rounds at the larger sizes just
+        ## takes too long
+        rounds = self.rounds if n <= 1000 else 1
+
+        srv = MockEWSServer(Mailbox.synthetic(contacts=n))
+        srv.start()
+        ## A pool of our own, so that its keep-alive connections can be
+        ## closed before the server is stopped
+        pool = SessionPool()
+        try:
+            ews = ExchangeService()
+            ews.credentials = WebCredentials('user', 'password')
+            ews.Url = srv.url
+            ews.init_soap_client(pool=pool)
+            folder = Folder.bind(ews, 'contacts')
+
+            def run (state):
+                items = ews.FindItems(folder)
+                assert len(items) == n
+
+            reqs, sent = srv.stats.requests, srv.stats.bytes_out
+            t = measure(run, rounds)
+            return t, {'requests'  : (srv.stats.requests - reqs) / rounds,
+                       'bytes_out' : (srv.stats.bytes_out - sent) / rounds}
+        finally:
+            pool.close()
+            srv.stop()
+
+    ##
+    ## Internal methods
+    ##
+
+    def _render (self, n, use_templates):
+        items = [make_contact(self.ews, i) for i in range(n)]
+        req = CreateItemsRequest(self.ews, folder_id='folder-id', items=items)
+
+        def run (state):
+            self.ews.use_templates = use_templates
+            req.render()
+
+        try:
+            return measure(run, self.rounds), {}
+        finally:
+            self.ews.use_templates = False
+
+    def _response (self, n):
+        """Return a GetItemsRequest and the parsed response to it."""
+
+        node = SoapClient.parse_xml(getitem_response(n))
+        req = GetItemsRequest(self.ews, itemids=[], custom_eprops_xml=[])
+        return req, node
+
+def git_revision ():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=TOP,
+                                       stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare (results, baseline_file):
+    with open(baseline_file) as inf:
+        baseline = json.load(inf)
+
+    base = dict(((r['stage'], r['size']), r['seconds'])
+                for r in baseline['results'])
+
+    err = sys.stderr
+    err.write('%-18s %8s %12s %12s %8s\n' % ('stage', 'size', 'baseline',
+                                             'now', 'ratio'))
+    for r in results:
+        b = base.get((r['stage'], r['size']))
+        if b is None:
+            continue
+        err.write('%-18s %8d %11.4fs %11.4fs %7.2fx\n' % (
+            r['stage'], r['size'], b, r['seconds'], r['seconds'] / b))
+
+def main (argv):
+    parser = argparse.ArgumentParser(description='pyews benchmark suite')
+    parser.add_argument('--sizes', default=','.join(str(x) for x in
+                                                    DEFAULT_SIZES),
+                        help='Comma separated list of folder sizes')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help='Comma separated list of stages to run')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--output', default=None,
+                        help='File to write the JSON results to')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of an earlier run to compare with')
+    args = parser.parse_args(argv[1:])
+
+    sizes = [int(x) for x in args.sizes.split(',')]
+    stages = args.stages.split(',')
+    for stage in stages:
+        if stage not in STAGES:
+            parser.error('Unknown stage: %s' % stage)
+
+    suite = Suite(args.rounds)
+    results = []
+    for size in sizes:
+        for stage in stages:
+            t, extra = getattr(suite, stage)(size)
+            r = {
+                'stage'       : stage,
+                'size'        : size,
+                'seconds'     : t,
+                'us_per_item' : t * 1e6 / size,
+            }
+            r.update(extra)
+            results.append(r)
+            gc.collect()
+
+            sys.stderr.write('%-18s %8d %10.4fs %10.2f us/item\n' % (
+                stage, size, t, r['us_per_item']))
+
+    out = {
+        'meta' : {
+            'time'     : time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'revision' : git_revision(),
+            'python'   : platform.python_version(),
+            'platform' : platform.platform(),
+            'rounds'   : args.rounds,
+        },
+        'results' : results,
+    }
+
+    if args.output is not None:
+        with open(args.output, 'w') as outf:
+            json.dump(out, outf, indent=2, sort_keys=True)
+    else:
+        json.dump(out, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main(sys.argv)
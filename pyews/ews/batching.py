@@ -0,0 +1,337 @@
+##
+## Created : Sun Oct 18 19:05:21 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Adaptive batch sizes. How many items are best asked for in one request
+## depends on the server, the mailbox and the network, none of which we
+## know up front. So the BatchSizer below starts from a conservative size
+## for each operation and adjusts it from what it sees of every request
+## sent with that size:
+##
+##  - Requests that come back quickly and are not too large let the size
+##    grow by a fixed step (additive increase)
+##
+##  - Requests that are throttled, or fail for being too large, halve it
+##    (multiplicative decrease)
+##
+##  - Requests that are slow, or whose responses are too large, scale it
+##    down in proportion to how far over the target they were
+##
+## The size of each operation stays within configured bounds, and never
+## goes beyond the most the server allows.
+##
+
+import logging, threading
+
+from   pyews.soap      import SoapConnectionError, SoapHTTPError, QName_M
+from   pyews.soap      import QName_S
+from   pyews.ews.retry import SERVER_BUSY
+
+## The operations whose batch sizes are managed. These are the names of the
+## EWS operations.
+OP_FIND_ITEM   = 'FindItem'
+OP_GET_ITEM    = 'GetItem'
+OP_CREATE_ITEM = 'CreateItem'
+OP_UPDATE_ITEM = 'UpdateItem'
+OP_DELETE_ITEM = 'DeleteItem'
+OP_SYNC_FOLDER = 'SyncFolderItems'
+
+DEFAULT_BATCH_SIZE = 100
+
+## The most the server will do in one request. Exchange caps the number of
+## items returned by a FindItem (EWSFindCountLimit) and refuses
+## MaxChangesReturned values over 512.
+SERVER_MAXIMA = {
+    OP_FIND_ITEM   : 1000,
+    OP_SYNC_FOLDER : 512,
+}
+
+## The largest request body bulk operations put together. Exchange refuses
+## requests beyond its maxRequestLength, which is tens of MB depending on
+## the version; staying well under that also keeps a failed request cheap
+## to resend.
+MAX_REQUEST_BYTES = 8 * 1024 * 1024
+
+## (initial, minimum, maximum, step) for each operation
+DEFAULT_LIMITS = {
+    OP_FIND_ITEM   : (DEFAULT_BATCH_SIZE, 10, 1000, 50),
+    OP_GET_ITEM    : (DEFAULT_BATCH_SIZE, 10,  500, 25),
+    OP_CREATE_ITEM : (DEFAULT_BATCH_SIZE,  1,  500, 25),
+    OP_UPDATE_ITEM : (DEFAULT_BATCH_SIZE,  1,  500, 25),
+    OP_DELETE_ITEM : (DEFAULT_BATCH_SIZE,  1,  500, 25),
+    OP_SYNC_FOLDER : (DEFAULT_BATCH_SIZE, 10,  512, 50),
+}
+
+## Response codes which mean the request was too much for the server to
+## handle in one go.
+SIZE_ERRORS = set([
+    'ErrorBatchProcessingStopped',
+    'ErrorExceededFindCountLimit',
+    'ErrorInsufficientResources',
+    'ErrorMessageSizeExceeded',
+    'ErrorTimeoutExpired',
+    'ErrorQuotaExceeded',
+])
+
+## HTTP status codes with the same meaning
+SIZE_HTTP_CODES = (413, 504)
+
+class OpState(object):
+    """
+    The batch size of one operation, its bounds, and some counters of how
+    it got there.
+    """
+
+    def __init__ (self, op, initial, minimum, maximum, step):
+        self.op = op
+        self.minimum = minimum
+        self.maximum = min(maximum, SERVER_MAXIMA.get(op, maximum))
+        self.step = step
+        self.size = self.clamp(initial)
+
+        self.observations = 0
+        self.increases = 0
+        self.decreases = 0
+        self.throttled = 0
+        self.size_errors = 0
+        self.last_latency = None
+        self.last_bytes = None
+
+    def clamp (self, size):
+        return max(self.minimum, min(self.maximum, int(size)))
+
+    def as_dict (self):
+        return {
+            'size'         : self.size,
+            'minimum'      : self.minimum,
+            'maximum'      : self.maximum,
+            'observations' : self.observations,
+            'increases'    : self.increases,
+            'decreases'    : self.decreases,
+            'throttled'    : self.throttled,
+            'size_errors'  : self.size_errors,
+            'last_latency' : self.last_latency,
+            'last_bytes'   : self.last_bytes,
+        }
+
+class BatchSizer(object):
+    """
+    Chooses the number of items to put in each request of an operation, and
+    adapts it to the outcome of the requests sent. Safe to use from many
+    threads at once.
+    """
+
+    def __init__ (self, adaptive=True, target_latency=2.0,
+                  max_response_bytes=4*1024*1024, decrease=0.5, limits=None):
+        """
+        If adaptive is False the sizes stay where they are set, and only the
+        counters are updated.
+
+        target_latency is the round trip time in seconds we are happy to
+        wait for a single request, and max_response_bytes the largest
+        response we are happy to hold in memory. decrease is the factor by
+        which the size is cut when a request is throttled or fails for
+        being too large.
+
+        limits maps operation names to (initial, minimum, maximum, step)
+        tuples that override those in DEFAULT_LIMITS.
+        """
+
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+        self.max_response_bytes = max_response_bytes
+        self.decrease = decrease
+
+        self._lock = threading.Lock()
+        self._ops = {}
+
+        lims = dict(DEFAULT_LIMITS)
+        if limits is not None:
+            lims.update(limits)
+        for op, (initial, minimum, maximum, step) in lims.iteritems():
+            self._ops[op] = OpState(op, initial, minimum, maximum, step)
+
+    ##
+    ## Public methods
+    ##
+
+    def batch_size (self, op):
+        state = self._ops.get(op)
+        return state.size if state is not None else DEFAULT_BATCH_SIZE
+
+    def set_bounds (self, op, minimum=None, maximum=None, size=None):
+        """
+        Change the bounds within which the batch size of op is kept, and
+        optionally set its present size. The maximum cannot go beyond what
+        the server allows. Setting minimum and maximum to the same value
+        pins the size.
+        """
+
+        with self._lock:
+            state = self._get_state(op)
+            if minimum is not None:
+                state.minimum = minimum
+            if maximum is not None:
+                state.maximum = min(maximum, SERVER_MAXIMA.get(op, maximum))
+            state.minimum = min(state.minimum, state.maximum)
+            state.size = state.clamp(size if size is not None else state.size)
+
+    def sizes (self):
+        """Return a dictionary of the present batch size of each operation."""
+
+        with self._lock:
+            return dict((op, s.size) for op, s in self._ops.iteritems())
+
+    def report (self):
+        """
+        Return a dictionary with the batch size, bounds and counters of each
+        operation, for logging or tuning.
+        """
+
+        with self._lock:
+            return dict((op, s.as_dict()) for op, s in self._ops.iteritems())
+
+    def observe (self, op, count, latency=None, response_bytes=None,
+                 node=None, error=None, retry_stats=None, returned=None):
+        """
+        Take note of the outcome of a request of operation op with count
+        items in it. latency is its round trip time in seconds, and
+        response_bytes the size of the response. node is the parsed
+        response, or error the transport error it failed with.
+        retry_stats, if given, tells if the request was throttled on the way.
+
+        returned is the number of items the server sent back, for
+        operations such as FindItem where count is only the most it may
+        send. The size only grows when all of them came back, so that it
+        does not grow past a cap the server puts on them.
+        """
+
+        throttled, too_big = self.classify(node, error, retry_stats)
+
+        with self._lock:
+            state = self._get_state(op)
+            state.observations += 1
+            state.last_latency = latency
+            state.last_bytes = response_bytes
+            if throttled:
+                state.throttled += 1
+            if too_big:
+                state.size_errors += 1
+
+            if not self.adaptive or count is None:
+                return
+
+            old = state.size
+            factor = None
+            if throttled or too_big:
+                factor = self.decrease
+            else:
+                over = 1.0
+                if latency is not None and latency > self.target_latency:
+                    over = max(over, latency / self.target_latency)
+                if (response_bytes is not None and
+                    response_bytes > self.max_response_bytes):
+                    over = max(over, (float(response_bytes) /
+                                      self.max_response_bytes))
+                if over > 1.0:
+                    factor = max(self.decrease, 1.0 / over)
+
+            if factor is not None:
+                ## A request sent with a larger size than the present one
+                ## may have been cut down for already, so scale from
+                ## whichever is larger, but never grow on a bad outcome.
+                state.size = min(old, state.clamp(max(old, count) * factor))
+            elif count >= old and (returned is None or returned >= count):
+                ## Only full batches tell us the present size is fine
+                state.size = state.clamp(old + state.step)
+
+            if state.size > old:
+                state.increases += 1
+            elif state.size < old:
+                state.decreases += 1
+                logging.debug('BatchSizer: %s batch size %d -> %d (%s)', op,
+                              old, state.size,
+                              'throttled' if throttled else
+                              'too large' if too_big else
+                              'latency %.2fs, %s bytes' % (latency or 0,
+                                                           response_bytes))
+
+    def classify (self, node=None, error=None, retry_stats=None):
+        """
+        Returns a tuple (throttled, too_big) of booleans for the outcome of
+        a request.
+        """
+
+        throttled = False
+        too_big = False
+
+        if retry_stats is not None:
+            for reason in retry_stats.reasons:
+                if reason == SERVER_BUSY or reason.startswith('HTTP'):
+                    throttled = True
+
+        if isinstance(error, SoapHTTPError):
+            if error.code in SIZE_HTTP_CODES:
+                too_big = True
+            else:
+                throttled = True
+        elif isinstance(error, SoapConnectionError):
+            throttled = True
+
+        if node is not None:
+            codes = response_codes(node)
+            if SERVER_BUSY in codes:
+                throttled = True
+            if len(codes & SIZE_ERRORS) > 0:
+                too_big = True
+
+        return throttled, too_big
+
+    ##
+    ## Internal methods
+    ##
+
+    def _get_state (self, op):
+        state = self._ops.get(op)
+        if state is None:
+            state = OpState(op, DEFAULT_BATCH_SIZE, 1, DEFAULT_BATCH_SIZE, 0)
+            self._ops[op] = state
+        return state
+
+def response_codes (node):
+    """
+    Return the set of response codes, other than NoError, in the response
+    messages of the given response node.
+    """
+
+    ret = set()
+    body = node.find(QName_S('Body'))
+    if body is None:
+        return ret
+
+    for child in body:
+        msgs = child.find(QName_M('ResponseMessages'))
+        if msgs is None:
+            continue
+        for msg in msgs:
+            code = msg.find(QName_M('ResponseCode'))
+            if code is not None and code.text != 'NoError':
+                ret.add(code.text)
+
+    return ret
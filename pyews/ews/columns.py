@@ -0,0 +1,247 @@
+##
+## Created : Sun Oct 18 23:32:14 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Items decoded into columns - one list of values per field - for reports
+## and exports that have no use for item objects. The values are taken
+## straight from the item elements of a response without anything else
+## being made of them, and only the columns asked for are decoded:
+##
+##   cols = ews.GetItemColumns(itemids, ['itemid', 'display_name', 'emails'])
+##   for itemid, name, emails in cols.rows():
+##       ...
+##
+## The columns are named after the corresponding Contact attributes.
+##
+
+import itertools
+
+from   collections     import OrderedDict
+from   pyews.soap      import QName_T
+from   pyews.ews       import mapitags
+from   pyews.ews.data  import ews_pt, ews_pid
+
+def _attrib (name):
+    def get (node):
+        return node.get(name)
+
+    return get
+
+def _text (node):
+    return node.text
+
+def _entries (node):
+    return dict((entry.get('Key'), entry.text) for entry in node)
+
+## The columns that come from child elements of the items: the name of
+## each column, and the tag of the element and the function that returns
+## the value from it. The value is None for items without the element.
+ELEMENT_COLUMNS = OrderedDict([
+    ('itemid',             ('ItemId',             _attrib('Id'))),
+    ('change_key',         ('ItemId',             _attrib('ChangeKey'))),
+    ('parent_fid',         ('ParentFolderId',     _attrib('Id'))),
+    ('item_class',         ('ItemClass',          _text)),
+    ('created_time',       ('DateTimeCreated',    _text)),
+    ('display_name',       ('DisplayName',        _text)),
+    ('file_as',            ('FileAs',             _text)),
+    ('given_name',         ('GivenName',          _text)),
+    ('surname',            ('Surname',            _text)),
+    ('initials',           ('Initials',           _text)),
+    ('alias',              ('Alias',              _text)),
+    ('spouse_name',        ('SpouseName',         _text)),
+    ('job_title',          ('JobTitle',           _text)),
+    ('company_name',       ('CompanyName',        _text)),
+    ('department',         ('Department',         _text)),
+    ('manager',            ('Manager',            _text)),
+    ('assistant_name',     ('AssistantName',      _text)),
+    ('birthday',           ('Birthday',           _text)),
+    ('anniversary',        ('WeddingAnniversary', _text)),
+    ('notes',              ('Body',               _text)),
+    ('business_home_page', ('BusinessHomePage',   _text)),
+    ## These map the Key of each entry to its text
+    ('emails',             ('EmailAddresses',     _entries)),
+    ('ims',                ('ImAddresses',        _entries)),
+    ('phones',             ('PhoneNumbers',       _entries)),
+])
+
+## The columns that come from tagged extended properties, with the MAPI
+## property tag of each. The value is the text of the property.
+EPROP_COLUMNS = OrderedDict([
+    ('last_modified_time', mapitags.PR_LAST_MODIFICATION_TIME),
+    ('gender',             mapitags.PR_GENDER),
+    ('personal_home_page', mapitags.PR_PERSONAL_HOME_PAGE),
+])
+
+COLUMNS = ELEMENT_COLUMNS.keys() + EPROP_COLUMNS.keys()
+
+## The extended properties GetItem asks for anyway. See get_item.xml.
+DEFAULT_EPROPS = (mapitags.PR_GENDER, mapitags.PR_LAST_MODIFICATION_TIME)
+
+## The columns that can be had with the IdOnly item shape
+ID_COLUMNS = ('itemid', 'change_key')
+
+EPROP_TAG = QName_T('ExtendedProperty')
+EFURI_TAG = QName_T('ExtendedFieldURI')
+VALUE_TAG = QName_T('Value')
+
+class ItemColumns(object):
+    """
+    A table of items: for each column, the list of the values of that field
+    of each item, in the order the items were added. errors maps the ids of
+    items that could not be fetched to what went wrong, as in ItemList.
+    """
+
+    def __init__ (self, columns=None):
+        """
+        columns is the list of the names of the columns to decode, from
+        COLUMNS. All of them by default.
+        """
+
+        names = list(columns) if columns is not None else list(COLUMNS)
+        for name in names:
+            if name not in ELEMENT_COLUMNS and name not in EPROP_COLUMNS:
+                raise ValueError('Unknown item column: %s' % name)
+
+        self.names = names
+        self.errors = {}
+        self._lists = [[] for name in names]
+        self._count = 0
+
+        ## What to do with each child element of an item: its tag maps to a
+        ## list of (column index, getter) pairs. Extended properties are
+        ## matched on their property id.
+        self._by_tag = {}
+        self._by_pid = {}
+        for i, name in enumerate(names):
+            if name in ELEMENT_COLUMNS:
+                tag, get = ELEMENT_COLUMNS[name]
+                self._by_tag.setdefault(QName_T(tag), []).append((i, get))
+            else:
+                self._by_pid[mapitags.PROP_ID(EPROP_COLUMNS[name])] = i
+
+    ##
+    ## Public methods
+    ##
+
+    def add (self, node):
+        """Decode the item element node into a new row."""
+
+        row = [None] * len(self.names)
+        by_tag = self._by_tag
+        by_pid = self._by_pid
+
+        for child in node:
+            hits = by_tag.get(child.tag)
+            if hits is not None:
+                for i, get in hits:
+                    row[i] = get(child)
+            elif by_pid and child.tag == EPROP_TAG:
+                i = by_pid.get(_prop_id(child))
+                if i is not None:
+                    row[i] = child.findtext(VALUE_TAG)
+
+        for values, v in itertools.izip(self._lists, row):
+            values.append(v)
+        self._count += 1
+
+    def add_all (self, node, tag=QName_T('Contact')):
+        """
+        Add a row for each item element under node, which is a parsed
+        response, or a Response object. Items of streamed responses are no
+        longer in the response by the time it is done; see
+        Request.item_columns for those.
+        """
+
+        node = getattr(node, 'node', node)
+        for child in node.iter(tag):
+            self.add(child)
+
+    def extend (self, other):
+        """Append the rows and errors of other, which has the same columns."""
+
+        for values, more in itertools.izip(self._lists, other._lists):
+            values.extend(more)
+        self._count += len(other)
+        self.errors.update(other.errors)
+
+    def clear (self):
+        for values in self._lists:
+            del values[:]
+        self._count = 0
+        self.errors = {}
+
+    def column (self, name):
+        return self._lists[self.names.index(name)]
+
+    def columns (self):
+        """Return an OrderedDict mapping each column name to its values."""
+
+        return OrderedDict(itertools.izip(self.names, self._lists))
+
+    def rows (self):
+        """Iterate over the rows, each a tuple with a value per column."""
+
+        return itertools.izip(*self._lists)
+
+    def has_errors (self):
+        return len(self.errors) > 0
+
+    def ids_only (self):
+        """True if all the columns can be had with the IdOnly item shape."""
+
+        return all(name in ID_COLUMNS for name in self.names)
+
+    def eprops_xml (self):
+        """
+        Return the ExtendedFieldURIs that GetItem has to ask for, beyond
+        those it always does, to fill in the extended property columns.
+        """
+
+        ret = []
+        for name in self.names:
+            ptag = EPROP_COLUMNS.get(name)
+            if ptag is not None and ptag not in DEFAULT_EPROPS:
+                ret.append('<t:ExtendedFieldURI PropertyType="%s" '
+                           'PropertyTag="%s"/>' % (ews_pt(ptag),
+                                                   ews_pid(ptag)))
+
+        return ret
+
+    def __len__ (self):
+        return self._count
+
+    def __getitem__ (self, name):
+        return self.column(name)
+
+def _prop_id (node):
+    """
+    Return the property id of the tagged extended property element node,
+    or None if it is not a tagged property.
+    """
+
+    uri = node.find(EFURI_TAG)
+    if uri is None:
+        return None
+
+    ptag = uri.get('PropertyTag')
+    if ptag is None:
+        return None
+
+    ## Some servers send these in hex, some in decimal
+    return int(ptag, 16) if ptag[:2] in ('0x', '0X') else int(ptag)
@@ -19,6 +19,7 @@
 
 import logging
 from item    import Item, Field, FieldURI, ExtendedProperty, LastModifiedTime
+from item    import tag_table, text_setter, lazy_table
 from pyews.soap    import SoapClient, unQName, QName_T
 from pyews.utils   import pretty_xml
 from pyews.ews     import mapitags
@@ -27,33 +28,42 @@ from pyews.ews.data import GenderType
 from xml.sax.saxutils import escape
 
 class CField(Field):
-    def __init__ (self, tag=None, text=None):
-        Field.__init__(self, tag, text)
-        self.furi = ('contacts:%s' % tag) if tag else None
+    __slots__ = ()
+
+    furi_prefix = 'contacts'
 
     def write_to_xml_update (self):
-        ats = ['%s="%s"' % (k, v) for k, v in self.attrib.iteritems() if v]
         s = '<t:FieldURI FieldURI="%s"/>' % self.furi
         s += '\n<t:Contact>'
-        s += '\n  <t:%s %s>%s</t:%s>' % (self.tag, ' '.join(ats),
+        s += '\n  <t:%s %s>%s</t:%s>' % (self.tag, self.atts_as_xml(),
                                          escape(self.value), self.tag)
         s += '\n</t:Contact>'
 
         return s
 
 class FileAs(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'FileAs', text)
 
 class Alias(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'Alias', text)
 
 class DisplayName(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'DisplayName', text)
 
 class CompleteName(CField):
+    __slots__ = ('title', 'given_name', 'first_name', 'middle_name',
+                 'last_name', 'surname', 'suffix', 'initials', 'nickname',
+                 'full_name')
+
     ##
     ## Exchnage handling of some of the name fields can, at best, be described
     ## as strange.... Some of these fields can be found outside of this
@@ -61,48 +71,67 @@ class CompleteName(CField):
     ## CompelteName field when possible
     ##
     class Title(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'Title', text)
 
     class FirstName(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'FirstName', text)
 
     class GivenName(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'GivenName', text)
 
     class MiddleName(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'MiddleName', text)
 
     class LastName(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'LastName', text)
 
     class Surname(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'Surname', text)
 
     class Suffix(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'Suffix', text)
 
     class Initials(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'Initials', text)
 
     class Nickname(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'Nickname', text)
 
     class FullName(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'FullName', text)
 
     def __init__ (self, text=None):
         CField.__init__(self, 'CompleteName', text)
-        self.furi = 'contacts:%s' % self.tag
 
         self.title        = self.Title()
         self.given_name   = self.GivenName()
@@ -119,41 +148,86 @@ class CompleteName(CField):
                          self.last_name, self.suffix, self.initials,
                          self.nickname]
 
+    ## The parts of the name that are decoded from a CompleteName element.
+    ## GivenName and Surname are decoded from the elements of the contact
+    ## with those names instead.
+    decoders = tag_table({
+        'Title'      : text_setter('title'),
+        'FirstName'  : text_setter('first_name'),
+        'MiddleName' : text_setter('middle_name'),
+        'LastName'   : text_setter('last_name'),
+        'Suffix'     : text_setter('suffix'),
+        'Initials'   : text_setter('initials'),
+        'FullName'   : text_setter('full_name'),
+        'Nickname'   : text_setter('nickname'),
+    })
+
+    def populate_from_node (self, node):
+        """
+        Set the parts of the name found in the CompleteName element node.
+        The rest are left as they are, so that the Initials of the contact
+        are not lost when the CompleteName has none.
+        """
+
+        get = self.decoders.get
+        for child in node:
+            fn = get(child.tag)
+            if fn is not None:
+                fn(self, child)
+
 class SpouseName(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'SpouseName', text)
 
 class JobTitle(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'JobTitle', text)
 
 class CompanyName(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'CompanyName', text)
 
 class Department(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'Department', text)
 
 class Manager(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'Manager', text)
 
 class AssistantName(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'AssistantName', text)
 
 ## FIXME: The values for these are strings, but might be better represented as
 ## DateTime objects... Hm
 class Birthday(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'Birthday', text)
 
 class WeddingAnniversary(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'WeddingAnniversary', text)
 
 class Notes(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'Body', text)
         self.attrib = {
@@ -163,7 +237,11 @@ class Notes(CField):
         self.furi = FieldURI(text='item:Body')
 
 class EmailAddresses(CField):
+    __slots__ = ('entries',)
+
     class Email(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'Entry', text)
             self.attrib = {
@@ -226,7 +304,11 @@ class EmailAddresses(CField):
         return s
 
 class ImAddresses(CField):
+    __slots__ = ('entries',)
+
     class Im(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'Entry', text)
             self.attrib = {
@@ -286,7 +368,11 @@ class ImAddresses(CField):
         return s
 
 class PhoneNumbers(CField):
+    __slots__ = ('entries',)
+
     class Phone(CField):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             CField.__init__(self, 'Entry', text)
             self.attrib = {
@@ -347,6 +433,8 @@ class PhoneNumbers(CField):
         return s
 
 class BusinessHomePage(CField):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         CField.__init__(self, 'BusinessHomePage', text)
 
@@ -355,6 +443,8 @@ class BusinessHomePage(CField):
 ##
 
 class PersonalHomePage(ExtendedProperty):
+    __slots__ = ()
+
     def __init__ (self, node=None, text=None):
         pid  = mapitags.PROP_ID(mapitags.PR_PERSONAL_HOME_PAGE)
         ptype = mapitags.PROP_TYPE(mapitags.PR_PERSONAL_HOME_PAGE)
@@ -368,10 +458,16 @@ class PersonalHomePage(ExtendedProperty):
         else:
             return ''
 
+    def write_xml (self, out):
+        if self.val.value is not None:
+            ExtendedProperty.write_xml(self, out)
+
     def __str__ (self):
         return self.val.value
 
 class Gender(ExtendedProperty):
+    __slots__ = ()
+
     def __init__ (self, node=None, text=GenderType.Unspecified):
         ptag  = mapitags.PROP_ID(mapitags.PR_GENDER)
         ptype = mapitags.PROP_TYPE(mapitags.PR_GENDER)
@@ -385,6 +481,10 @@ class Gender(ExtendedProperty):
         else:
             return ''
 
+    def write_xml (self, out):
+        if self.val.value is not None:
+            ExtendedProperty.write_xml(self, out)
+
     def __str__ (self):
         v = self.val.value
         if v is None or v == 'None':
@@ -402,8 +502,85 @@ class Contact(Item):
     object of this type is instantiated from a response.
     """
 
-    def __init__ (self, service, parent_fid=None, resp_node=None):
-        Item.__init__(self, service, parent_fid, resp_node, tag='Contact')
+    __slots__ = ('file_as', 'alias', 'complete_name', 'display_name',
+                 'spouse_name', 'job_title', 'company_name', 'department',
+                 'manager', 'assistant_name', 'birthday', 'anniversary',
+                 'notes', 'emails', 'ims', 'phones', 'business_home_page',
+                 'gender', 'personal_home_page', '_firstname', '_lastname',
+                 '_displayname')
+
+    ## Setters for the contact fields. The fields common to all items are
+    ## taken care of by Item.base_decoders.
+    decoders = tag_table({
+        'FileAs'             : text_setter('file_as'),
+        'Alias'              : text_setter('alias'),
+        'SpouseName'         : text_setter('spouse_name'),
+        'JobTitle'           : text_setter('job_title'),
+        'CompanyName'        : text_setter('company_name'),
+        'Department'         : text_setter('department'),
+        'Manager'            : text_setter('manager'),
+        'AssistantName'      : text_setter('assistant_name'),
+        'Birthday'           : text_setter('birthday'),
+        'WeddingAnniversary' : text_setter('anniversary'),
+        'GivenName'          : text_setter('complete_name.given_name'),
+        'Surname'            : text_setter('complete_name.surname'),
+        'Initials'           : text_setter('complete_name.initials'),
+        'CompleteName'       : lambda c, n:
+                                   c.complete_name.populate_from_node(n),
+        'DisplayName'        : text_setter('display_name'),
+        ## FIXME: We are assuming a text body type, but they could contain
+        ## html or other types as well... Oh, well.
+        'Body'               : text_setter('notes'),
+        'BusinessHomePage'   : text_setter('business_home_page'),
+        'EmailAddresses'     : lambda c, n: c.emails.populate_from_node(n),
+        'ImAddresses'        : lambda c, n: c.ims.populate_from_node(n),
+        'PhoneNumbers'       : lambda c, n: c.phones.populate_from_node(n),
+        'ExtendedProperty'   : lambda c, n: c.add_extended_property(node=n),
+    })
+
+    ## The contact fields as decoded for lazy contacts. See lazy_table().
+    field_groups = Item.field_groups + [
+        ([('file_as', FileAs)],                   ['FileAs']),
+        ([('alias', Alias)],                      ['Alias']),
+        ([('complete_name', CompleteName)],       ['GivenName', 'Surname',
+                                                   'Initials',
+                                                   'CompleteName']),
+        ([('display_name', DisplayName)],         ['DisplayName']),
+        ([('spouse_name', SpouseName)],           ['SpouseName']),
+        ([('job_title', JobTitle)],               ['JobTitle']),
+        ([('company_name', CompanyName)],         ['CompanyName']),
+        ([('department', Department)],            ['Department']),
+        ([('manager', Manager)],                  ['Manager']),
+        ([('assistant_name', AssistantName)],     ['AssistantName']),
+        ([('birthday', Birthday)],                ['Birthday']),
+        ([('anniversary', WeddingAnniversary)],   ['WeddingAnniversary']),
+        ([('notes', Notes)],                      ['Body']),
+        ([('emails', EmailAddresses)],            ['EmailAddresses']),
+        ([('ims', ImAddresses)],                  ['ImAddresses']),
+        ([('phones', PhoneNumbers)],              ['PhoneNumbers']),
+        ([('business_home_page', BusinessHomePage)], ['BusinessHomePage']),
+        ([('last_modified_time', lambda: None), ('gender', Gender),
+          ('personal_home_page', PersonalHomePage), ('eprops', list),
+          ('eprops_tagged', dict), ('eprops_named_str', dict),
+          ('eprops_named_int', dict)],
+         ['LastModifiedTime', 'ExtendedProperty']),
+    ]
+
+    lazy_attrs = lazy_table(field_groups, Item.base_decoders, decoders)
+    lazy_attrs.update(dict.fromkeys(['_firstname', '_lastname',
+                                     '_displayname'],
+                                    lambda c: c._init_names()))
+
+    def __init__ (self, service, parent_fid=None, resp_node=None,
+                  lazy=False):
+        """
+        See Item.__init__() for lazy.
+        """
+
+        Item.__init__(self, service, parent_fid, resp_node, tag='Contact',
+                      lazy=lazy)
+        if lazy and resp_node is not None:
+            return
 
         self.file_as      = FileAs()
         self.alias        = Alias()
@@ -435,67 +612,20 @@ class Contact(Item):
         if self.resp_node is None:
             return
 
-        rnode = self.resp_node
-        for child in rnode:
-            tag = unQName(child.tag)
-
-            if tag == 'FileAs':
-                self.file_as.value = child.text
-            elif tag == 'Alias':
-                self.alias.value = child.text
-            elif tag == 'SpouseName':
-                self.spouse_nam.value = child.text
-            elif tag == 'JobTitle':
-                self.job_title.value = child.text
-            elif tag == 'CompanyName':
-                self.company_name.value = child.text
-            elif tag == 'Department':
-                self.department.value = child.text
-            elif tag == 'Manager':
-                self.manager.value = child.text
-            elif tag == 'AssistantName':
-                self.assistant_name.value = child.text
-            elif tag == 'Birthday':
-                self.birthday.value = child.text
-            elif tag == 'WeddingAnniversary':
-                self.anniversary.value = child.text
-            elif tag == 'GivenName':
-                self.complete_name.given_name.value = child.text
-            elif tag == 'Surname':
-                self.complete_name.surname.value = child.text
-            elif tag == 'Initials':
-                self.complete_name.initials.value = child.text
-            elif tag == 'DisplayName':
-                self.display_name.value = child.text
-            elif tag == 'Body':
-                ## FIXME: We are assuming a text body type, but they could
-                ## contain html or other types as well... Oh, well.
-                self.notes.value = child.text
-            elif tag == 'EmailAddresses':
-                self.emails.populate_from_node(child)
-            elif tag == 'ImAddresses':
-                self.ims.populate_from_node(child)
-            elif tag == 'PhoneNumbers':
-                self.phones.populate_from_node(child)
-            elif tag == 'BusinessHomePage':
-                self.business_home_page.value = child.text
-            elif tag == 'ExtendedProperty':
-                self.add_extended_property(node=child)
-
-        n = rnode.find('CompleteName')
-        if n is not None:
-            rnode = n
-
-        fts = self._find_text_safely
-        self.complete_name.title.value = fts(rnode, 'Title')
-        self.complete_name.first_name.value = fts(rnode, 'FirstName')
-        self.complete_name.middle_name.value = fts(rnode, 'MiddleName')
-        self.complete_name.last_name.value = fts(rnode, 'LastName')
-        self.complete_name.suffix.value = fts(rnode, 'Suffix')
-        self.complete_name.initials.value = fts(rnode, 'Initials')
-        self.complete_name.full_name.value = fts(rnode, 'FullName')
-        self.complete_name.nickname.value = fts(rnode, 'Nickname')
+        self._decode_children(self.resp_node, self.decoders)
+        self._init_names()
+
+        ## yet to support following which are really multi-valued properties
+        ## - Companies
+        ## - PhysicalAddresses
+        ## - ImAddresses
 
+        ## yet to support following which are not returned normally and have
+        ## to be dealt with as extended properties.
+        ## - gender
+        ## - LastModifiedTime
+
+    def _init_names (self):
         ## It's a bit hard to understand why the hell they have so many
         ## variants for the same stupid information... Oh well, let's just
         ## have a few handy shortcuts for the information that matters
@@ -522,16 +652,6 @@ class Contact(Item):
         else:
             self._displayname = self._firstname + ' ' + self._lastname
 
-        ## yet to support following which are really multi-valued properties
-        ## - Companies
-        ## - PhysicalAddresses
-        ## - ImAddresses
-
-        ## yet to support following which are not returned normally and have
-        ## to be dealt with as extended properties.
-        ## - gender
-        ## - LastModifiedTime
-
     ##
     ## Inherited methods. For doc see item.py
     ##
@@ -131,6 +131,13 @@ class ConflictResoltion:
     AutoResolve     = 'AutoResolve'
     AlwaysOverwrite = 'AlwaysOverwrite'
 
+class DeleteType:
+    HardDelete         = 'HardDelete'
+    SoftDelete         = 'SoftDelete'
+    MoveToDeletedItems = 'MoveToDeletedItems'
+
+    all = (HardDelete, SoftDelete, MoveToDeletedItems)
+
 def ews_pt (tag):
     """Return the EWS Property Type enumeration for the specific MAPI Property
     Tag. """
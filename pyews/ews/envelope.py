@@ -0,0 +1,250 @@
+##
+## Created : Sun Oct 18 12:31:16 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## A direct SOAP envelope builder. The request is written straight into a
+## byte buffer, using precomputed fragments for everything that does not
+## change from one request to the next. Each body writer below produces the
+## same request as the template of the same name in the templates/
+## directory, and takes the same keyword arguments. The templates remain the
+## fallback for requests that do not have a writer here.
+##
+
+from   xml.sax.saxutils import escape
+
+import pyews.utils as utils
+from   pyews.ews       import mapitags as mt
+from   pyews.ews.data  import ews_pt, ews_pid
+
+class XmlBuffer(object):
+    """
+    Accumulates the bytes of an XML document. Both byte strings and unicode
+    strings can be written; the latter are encoded to utf-8 when the
+    document is assembled by getvalue().
+    """
+
+    def __init__ (self):
+        self.parts = []
+        self.write = self.parts.append
+
+    def getvalue (self):
+        return ''.join([p.encode('utf-8') if isinstance(p, unicode) else p
+                        for p in self.parts])
+
+def attr (v):
+    """Escape v for use as an attribute value within double quotes."""
+
+    return escape(v if isinstance(v, basestring) else str(v),
+                  {'"' : '&quot;'})
+
+##
+## Constant fragments
+##
+
+ENVELOPE_START = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+    ' xmlns:xsd="http://www.w3.org/2001/XMLSchema"'
+    ' xmlns:m="http://schemas.microsoft.com/exchange/services/2006/messages"'
+    ' xmlns:t="http://schemas.microsoft.com/exchange/services/2006/types">')
+
+BODY_START = '<soap:Body>'
+ENVELOPE_END = '</soap:Body></soap:Envelope>'
+
+def _eprop_uri (tag):
+    return '<t:ExtendedFieldURI PropertyType="%s" PropertyTag="%s"/>' % (
+        ews_pt(tag), ews_pid(tag))
+
+EPROP_LMT    = _eprop_uri(mt.PR_LAST_MODIFICATION_TIME)
+EPROP_GENDER = _eprop_uri(mt.PR_GENDER)
+
+FIND_ITEM_SHAPE = (
+    '<m:ItemShape>'
+    '<t:BaseShape>IdOnly</t:BaseShape>'
+    '<t:AdditionalProperties>'
+    '<t:FieldURI FieldURI="contacts:DisplayName"/>' + EPROP_LMT +
+    '</t:AdditionalProperties>'
+    '</m:ItemShape>')
+
+GET_ITEM_SHAPE_START = (
+    '<m:ItemShape>'
+    '<t:BaseShape>AllProperties</t:BaseShape>'
+    '<t:AdditionalProperties>' + EPROP_GENDER + EPROP_LMT)
+GET_ITEM_SHAPE_END = '</t:AdditionalProperties></m:ItemShape>'
+
+ITEM_SHAPE_ID_ONLY = ('<m:ItemShape><t:BaseShape>IdOnly</t:BaseShape>'
+                      '</m:ItemShape>')
+
+FOLDER_SHAPE_ALL = ('<m:FolderShape><t:BaseShape>AllProperties</t:BaseShape>'
+                    '</m:FolderShape>')
+
+##
+## Body writers, one per template.
+##
+
+def write_bind (out, folder_name):
+    out.write('<m:GetFolder>')
+    out.write(FOLDER_SHAPE_ALL)
+    out.write('<m:FolderIds><t:DistinguishedFolderId Id="%s"/></m:FolderIds>'
+              % attr(folder_name))
+    out.write('</m:GetFolder>')
+
+def write_find_folder_id (out, folder_ids, traversal):
+    out.write('<m:FindFolder Traversal="%s">' % attr(traversal))
+    out.write(FOLDER_SHAPE_ALL)
+    out.write('<m:ParentFolderIds>')
+    for fid, ck in folder_ids:
+        out.write('<t:FolderId Id="%s" ChangeKey="%s"/>' % (attr(fid),
+                                                            attr(ck)))
+    out.write('</m:ParentFolderIds>')
+    out.write('</m:FindFolder>')
+
+def _write_page_view (out, batch_size, offset):
+    out.write('<m:IndexedPageItemView MaxEntriesReturned="%s" Offset="%s" '
+              'BasePoint="Beginning"/>' % (attr(batch_size), attr(offset)))
+
+def write_find_item (out, folder_id, batch_size, offset):
+    out.write('<m:FindItem Traversal="Shallow">')
+    out.write(FIND_ITEM_SHAPE)
+    _write_page_view(out, batch_size, offset)
+    out.write('<m:ParentFolderIds><t:FolderId Id="%s"/></m:ParentFolderIds>'
+              % attr(folder_id))
+    out.write('</m:FindItem>')
+
+def write_find_item_lmt (out, folder_id, batch_size, offset, lmt):
+    out.write('<m:FindItem Traversal="Shallow">')
+    out.write(FIND_ITEM_SHAPE)
+    _write_page_view(out, batch_size, offset)
+    out.write('<m:Restriction><t:IsGreaterThan>')
+    out.write(EPROP_LMT)
+    out.write('<t:FieldURIOrConstant><t:Constant Value="%s"/>'
+              '</t:FieldURIOrConstant>' % attr(lmt))
+    out.write('</t:IsGreaterThan></m:Restriction>')
+    out.write('<m:ParentFolderIds><t:FolderId Id="%s"/></m:ParentFolderIds>'
+              % attr(folder_id))
+    out.write('</m:FindItem>')
+
+def write_get_item (out, itemids, custom_eprops_xml=[], ids_only=False):
+    out.write('<m:GetItem>')
+    if ids_only:
+        out.write(ITEM_SHAPE_ID_ONLY)
+    else:
+        out.write(GET_ITEM_SHAPE_START)
+        for eprop_xml in custom_eprops_xml:
+            out.write(eprop_xml)
+        out.write(GET_ITEM_SHAPE_END)
+    out.write('<m:ItemIds>')
+    for iid in itemids:
+        out.write('<t:ItemId Id="%s"/>' % attr(iid))
+    out.write('</m:ItemIds>')
+    out.write('</m:GetItem>')
+
+def write_create_item (out, folder_id, items, items_xml=None):
+    """
+    items_xml, if given, has the already rendered XML of each of items, as
+    from item_xml().
+    """
+
+    out.write('<m:CreateItem>')
+    out.write('<m:SavedItemFolderId><t:FolderId Id="%s"/></m:SavedItemFolderId>'
+              % attr(folder_id))
+    out.write('<m:Items>')
+    if items_xml is not None:
+        for x in items_xml:
+            out.write(x)
+    else:
+        for item in items:
+            item.write_xml(out)
+    out.write('</m:Items>')
+    out.write('</m:CreateItem>')
+
+def write_delete_item (out, itemids, delete_type='MoveToDeletedItems'):
+    out.write('<m:DeleteItem DeleteType="%s">' % attr(delete_type))
+    out.write('<m:ItemIds>')
+    for iid in itemids:
+        out.write('<t:ItemId Id="%s"/>' % attr(iid))
+    out.write('</m:ItemIds>')
+    out.write('</m:DeleteItem>')
+
+def write_update_item (out, items):
+    out.write('<m:UpdateItem ConflictResolution="NeverOverwrite">')
+    out.write('<m:ItemChanges>')
+    for item in items:
+        out.write('<t:ItemChange>')
+        out.write('<t:ItemId Id="%s" ChangeKey="%s"/>' % (
+            attr(item.itemid.value), attr(item.change_key.value)))
+        out.write('<t:Updates>')
+        adds, sets, dels = item.get_updates()
+        for child in sets:
+            out.write('<t:SetItemField>')
+            out.write(child.write_to_xml_update())
+            out.write('</t:SetItemField>')
+        out.write('</t:Updates>')
+        out.write('</t:ItemChange>')
+    out.write('</m:ItemChanges>')
+    out.write('</m:UpdateItem>')
+
+def write_sync_folder (out, folder_id, sync_state, batch_size):
+    out.write('<m:SyncFolderItems>')
+    out.write(ITEM_SHAPE_ID_ONLY)
+    out.write('<m:SyncFolderId><t:FolderId Id="%s"/></m:SyncFolderId>'
+              % attr(folder_id))
+    if sync_state is not None:
+        out.write('<m:SyncState>%s</m:SyncState>' % escape(sync_state))
+    out.write('<m:MaxChangesReturned>%s</m:MaxChangesReturned>'
+              % attr(batch_size))
+    out.write('</m:SyncFolderItems>')
+
+BODY_WRITERS = {
+    utils.REQ_BIND_FOLDER    : write_bind,
+    utils.REQ_FIND_FOLDER_ID : write_find_folder_id,
+    utils.REQ_FIND_ITEM      : write_find_item,
+    utils.REQ_FIND_ITEM_LMT  : write_find_item_lmt,
+    utils.REQ_GET_ITEM       : write_get_item,
+    utils.REQ_CREATE_ITEM    : write_create_item,
+    utils.REQ_DELETE_ITEM    : write_delete_item,
+    utils.REQ_UPDATE_ITEM    : write_update_item,
+    utils.REQ_SYNC_FOLDER    : write_sync_folder,
+}
+
+def item_xml (item):
+    """Return the XML of the given item, as it would go into a CreateItem
+    request, as a utf-8 encoded byte string."""
+
+    out = XmlBuffer()
+    item.write_xml(out)
+    return out.getvalue()
+
+def has_writer (template):
+    return template in BODY_WRITERS
+
+def build (template, **kwargs):
+    """
+    Return the complete request for the given template name and template
+    arguments as a utf-8 encoded byte string.
+    """
+
+    out = XmlBuffer()
+    out.write(ENVELOPE_START)
+    out.write(BODY_START)
+    BODY_WRITERS[template](out, **kwargs)
+    out.write(ENVELOPE_END)
+
+    return out.getvalue()
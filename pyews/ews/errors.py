@@ -37,6 +37,34 @@ class EWSResponseError(Exception):
 
         return s
 
+class EWSBulkError(Exception):
+    """
+    Raised when one or more of a batch of independent operations failed.
+    bulk_res is the executor.BulkResult with the results of the ones that
+    succeeded and the exceptions raised by the others.
+    """
+
+    def __init__ (self, bulk_res):
+        self.bulk_res = bulk_res
+
+    def __str__ (self):
+        s = '%d of %d operations failed: ' % (len(self.bulk_res.errors),
+                                              len(self.bulk_res.results))
+        for i, err in sorted(self.bulk_res.errors.iteritems()):
+            s += '\n  %02d - %s' % (i, str(err))
+
+        return s
+
+class EWSNoResponseError(Exception):
+    """
+    Raised, or reported, for an item of a bulk request that the server sent
+    back no response message for - as when it stops processing a batch
+    part way through.
+    """
+
+    def __str__ (self):
+        return 'No response from the server for this item'
+
 class EWSCreateFolderError(Exception):
     pass
 
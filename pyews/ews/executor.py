@@ -0,0 +1,155 @@
+##
+## Created : Sun Oct 18 11:04:52 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+import logging, threading
+
+from   concurrent.futures import Future, ThreadPoolExecutor
+from   pyews.soap         import EWS_MAX_CONCURRENCY
+from   pyews.ews.errors   import EWSBulkError
+
+class BulkResult(object):
+    """
+    The outcome of a number of independent operations run through a
+    RequestExecutor. results holds the return value of each operation in the
+    order the operations were given, with None for the ones that failed.
+    errors maps the index of each failed operation to the exception it
+    raised.
+    """
+
+    def __init__ (self, n):
+        self.results = [None] * n
+        self.errors = {}
+
+    def has_errors (self):
+        return len(self.errors) > 0
+
+    def raise_for_errors (self):
+        if self.has_errors():
+            raise EWSBulkError(self)
+
+    def __len__ (self):
+        return len(self.results)
+
+    def __iter__ (self):
+        return iter(self.results)
+
+    def __getitem__ (self, i):
+        return self.results[i]
+
+class RequestExecutor(object):
+    """
+    A thread pool for fanning out independent EWS requests, with a cap on
+    the number of requests in flight at any time. The cap defaults to the
+    number of concurrent connections Exchange allows per user; going beyond
+    that only gets us throttled.
+
+    Operations submitted from within one of the executor's own threads are
+    run inline rather than queued, so that a bulk operation running in the
+    executor can use other bulk operations without deadlocking on a full
+    pool.
+    """
+
+    def __init__ (self, max_workers=EWS_MAX_CONCURRENCY):
+        self.max_workers = max_workers
+
+        self._pool = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    ##
+    ## Public methods
+    ##
+
+    def submit (self, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) and return a Future for its result.
+        """
+
+        if self.in_worker():
+            fut = Future()
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+
+        return self._get_pool().submit(self._run, fn, args, kwargs)
+
+    def map (self, fn, args_list):
+        """
+        Call fn on each element of args_list concurrently, and return a
+        BulkResult. An exception raised by any one call does not affect the
+        others.
+        """
+
+        args_list = list(args_list)
+        ret = BulkResult(len(args_list))
+
+        if self.in_worker() or self.max_workers <= 1 or len(args_list) <= 1:
+            for i, arg in enumerate(args_list):
+                try:
+                    ret.results[i] = fn(arg)
+                except Exception as e:
+                    ret.errors[i] = e
+            return ret
+
+        futures = [self.submit(fn, arg) for arg in args_list]
+        for i, fut in enumerate(futures):
+            try:
+                ret.results[i] = fut.result()
+            except Exception as e:
+                logging.debug('RequestExecutor: operation %d failed: %s', i, e)
+                ret.errors[i] = e
+
+        return ret
+
+    def execute (self, requests):
+        """
+        Execute the given Request objects concurrently, and return a
+        BulkResult of their Response objects.
+        """
+
+        return self.map(lambda req: req.execute(), requests)
+
+    def in_worker (self):
+        return getattr(self._local, 'worker', False)
+
+    def shutdown (self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    ##
+    ## Internal methods
+    ##
+
+    def _get_pool (self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    def _run (self, fn, args, kwargs):
+        self._local.worker = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._local.worker = False
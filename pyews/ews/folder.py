@@ -23,6 +23,7 @@ from   pyews.soap import SoapClient, QName_M, QName_T, unQName
 from   pyews.ews.request_response import GetFolderRequest, GetFolderResponse
 from   pyews.ews.request_response import FindFoldersRequest, FindFoldersResponse
 import xml.etree.ElementTree as ET
+from   tornado import gen
 
 import logging
 
@@ -74,16 +75,18 @@ class Folder:
         ews.data.FolderClass
         """
 
-        root_id = self.Id
-        ck = self.ChangeKey
-
-        req = FindFoldersRequest(self.service, folder_ids=[(root_id, ck)],
-                                 traversal='Deep' if recursive else 'Shallow')
+        req = self._find_folders_request(recursive)
         resp = req.execute()
-        if types is not None:
-            return [x for x in resp.folders if x.FolderClass in types]
-        else:
-            return resp.folders
+        return self._filter_folders(resp.folders, types)
+
+    @gen.coroutine
+    def FindFoldersAsync (self, types=None, recursive=False):
+        """Same as FindFolders() but for use with an AsyncExchangeService;
+        returns a Future."""
+
+        req = self._find_folders_request(recursive)
+        resp = yield self.service.execute_request(req)
+        raise gen.Return(self._filter_folders(resp.folders, types))
 
     ##
     ## Class methods
@@ -99,10 +102,31 @@ class Folder:
         resp = req.execute()
         return Folder(service, wkfn, resp.folder_node)
 
+    @classmethod
+    @gen.coroutine
+    def bind_async (self, service, wkfn):
+        """Same as bind() but for use with an AsyncExchangeService; returns
+        a Future."""
+
+        req = GetFolderRequest(service, folder_name=wkfn)
+        resp = yield service.execute_request(req)
+        raise gen.Return(Folder(service, wkfn, resp.folder_node))
+
     ##
     ## Internal methods
     ##
 
+    def _find_folders_request (self, recursive):
+        return FindFoldersRequest(self.service,
+                                  folder_ids=[(self.Id, self.ChangeKey)],
+                                  traversal='Deep' if recursive else 'Shallow')
+
+    def _filter_folders (self, folders, types):
+        if types is not None:
+            return [x for x in folders if x.FolderClass in types]
+        else:
+            return folders
+
     def _init_fields (self, root):
         """root is the parsed XML response pointing to a Folder element"""
 
@@ -131,15 +155,27 @@ class Folder:
     ## External Methods
     ##
 
-    def get_updates (self, sync_state):
+    def get_updates (self, sync_state, checkpoint=None):
         """
         Given a sync_state ID, fetch all the changes since that time. This
         methods returns a tuple (new, mod, del, new_sync_state) -> where each
         element is an array of Contact objects
+
+        All the changes are fetched, however many SyncFolderItems calls
+        that takes. checkpoint is as for ExchangeService.sync_folder_items().
         """
 
-        resp = self.service.SyncFolderItems(self.Id, sync_state)
-        return resp.news, resp.mods, resp.dels, resp.sync_state
+        news, mods, dels = [], [], []
+
+        def collect (n, m, d):
+            news.extend(n)
+            mods.extend(m)
+            dels.extend(d)
+
+        state = self.service.sync_folder_items(self.Id, sync_state,
+                                               on_changes=collect,
+                                               checkpoint=checkpoint)
+        return news, mods, dels, state
 
     def __str__ (self):
         s = 'Name: %s' % self.DisplayName
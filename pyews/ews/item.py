@@ -26,10 +26,85 @@ from    pyews.ews.data  import MapiPropertyTypeType, MapiPropertyTypeTypeInv
 
 import  xml.etree.ElementTree as ET
 from    xml.sax.saxutils import escape
-import  logging
+import  logging, operator
 
 gnd = SoapClient.get_node_detail
 
+##
+## Items are decoded from response elements by looking up the tag of each
+## child element in a table of the item class, which maps the fully
+## qualified tag straight to a function that sets the corresponding field
+## from the element. The tables are built once, when the classes are
+## defined.
+##
+
+def tag_table (setters):
+    """
+    setters maps the names of elements in the EWS types namespace to
+    functions taking (item, node). Return the same keyed by the fully
+    qualified tags, which is what ElementTree gives us.
+    """
+
+    return dict((QName_T(tag), fn) for tag, fn in setters.iteritems())
+
+def text_setter (path):
+    """
+    Return a function taking (item, node) that sets the value of the field
+    at the given dotted attribute path of item to the text of node.
+    """
+
+    get = operator.attrgetter(path)
+
+    def setter (item, node):
+        get(item).value = node.text
+
+    return setter
+
+##
+## Items made with lazy=True hang on to their response element and leave
+## their fields unset. The first lookup of a field then ends up in
+## Item.__getattr__(), which decodes it - along with any other fields that
+## come from the same elements - and sets it, so that later lookups do not
+## come back. The fields of each item class are described by a list of
+## groups for this purpose, each a tuple (fields, tags): fields is a list
+## of (name, default) pairs, default being a function returning the value
+## the attribute has when there is nothing for it in the response, and
+## tags the names of the elements the group is decoded from.
+##
+
+def lazy_table (groups, *decoders):
+    """
+    Return a dictionary mapping the name of each field in groups to a
+    function taking an item, which sets up the fields of its group. The
+    setters for the tags are taken from the decoders tables, which are run
+    in the order given, as when the item is decoded in one go.
+    """
+
+    ret = {}
+    for fields, tags in groups:
+        tables = []
+        for table in decoders:
+            sub = dict((QName_T(t), table[QName_T(t)]) for t in tags
+                       if QName_T(t) in table)
+            if len(sub) > 0:
+                tables.append(sub)
+
+        decode = _group_decoder(fields, tables)
+        for name, default in fields:
+            ret[name] = decode
+
+    return ret
+
+def _group_decoder (fields, tables):
+    def decode (item):
+        for name, default in fields:
+            setattr(item, name, default())
+        if item.resp_node is not None:
+            for table in tables:
+                item._decode_children(item.resp_node, table)
+
+    return decode
+
 class ReadOnly:
     """
     When applied as a Mixin, this class will ensure that no XML is generated
@@ -44,26 +119,41 @@ class ReadOnly:
     of Field class or any its derived classes.
     """
     __metaclass__ = ABCMeta
+    __slots__ = ()
 
     def write_to_xml (self):
         return ''
 
+    def write_xml (self, out):
+        pass
+
 class Field:
     """
     Represents an XML Element
+
+    An item holds a couple of dozen fields, and a mirror of a mailbox can
+    hold a great many items, so fields are kept small: the attributes are
+    in __slots__, the attrib dictionary and the children list are only
+    created once something is put in them, and furi is worked out from the
+    tag unless it is set. Sub classes that add attributes of their own
+    should list them in __slots__ as well; any that are not listed still
+    work, but they cost a __dict__ for the instance.
     """
     __metaclass__ = ABCMeta
+    __slots__ = ('tag', '_value', '_attrib', '_children', '_furi',
+                 '__dict__', '__weakref__')
+
+    ## Prefix of the default furi. See the furi property.
+    furi_prefix = 'items'
+
+    read_only = False
 
     def __init__ (self, tag=None, text=None):
         self.tag = tag
         self.value = text
-        self.attrib = {}
-        self.children = []
-        self.read_only = False
-
-        ## furi is used when this field needs to be used as part of an update
-        ## item method
-        self.furi = ('items:%s' % tag) if tag else None
+        self._attrib = None
+        self._children = None
+        self._furi = None
 
     @property
     def value (self):
@@ -72,20 +162,56 @@ class Field:
     @value.setter
     def value (self, val):
         self._value = val
-        
+
+    @property
+    def attrib (self):
+        if self._attrib is None:
+            self._attrib = {}
+        return self._attrib
+
+    @attrib.setter
+    def attrib (self, val):
+        self._attrib = val
+
+    @property
+    def children (self):
+        if self._children is None:
+            self._children = []
+        return self._children
+
+    @children.setter
+    def children (self, val):
+        self._children = val
+
+    @property
+    def furi (self):
+        """
+        furi is used when this field needs to be used as part of an update
+        item method
+        """
+
+        if self._furi is not None:
+            return self._furi
+        return ('%s:%s' % (self.furi_prefix, self.tag)) if self.tag else None
+
+    @furi.setter
+    def furi (self, val):
+        self._furi = val
+
     def add_attrib (self, key, val):
         self.attrib.update({key: val})
 
     def atts_as_xml (self):
-        ats = ['%s="%s"' % (k, v) for k, v in self.attrib.iteritems() if v]
+        if not self._attrib:
+            return ''
+        ats = ['%s="%s"' % (k, v) for k, v in self._attrib.iteritems() if v]
         return ' '.join(ats)
 
     def value_as_xml (self):
         return escape(self.value) if self.value is not None else ''
 
     def children_as_xml (self):
-        self.children = self.get_children()
-        xmls = [x.write_to_xml() for x in self.children]
+        xmls = [x.write_to_xml() for x in self.get_children()]
         return '\n'.join([y for y in xmls if y is not None])
 
     def write_to_xml (self):
@@ -95,7 +221,7 @@ class Field:
 
         children = self.get_children()
 
-        if ((self.value is not None) or (len(self.attrib) > 0) or
+        if ((self.value is not None) or self._attrib or
             (len(children) > 0)):
 
             text = self.value_as_xml()
@@ -107,6 +233,23 @@ class Field:
         else:
             return ''
 
+    def write_xml (self, out):
+        """
+        Same as write_to_xml() but writes the XML representation to out,
+        which should have a write() method - like envelope.XmlBuffer -
+        instead of building up and returning a string.
+        """
+
+        children = self.get_children()
+        if self.value is None and not self._attrib and not children:
+            return
+
+        out.write('<t:%s %s>%s' % (self.tag, self.atts_as_xml(),
+                                    self.value_as_xml()))
+        for child in children:
+            child.write_xml(out)
+        out.write('</t:%s>' % self.tag)
+
     def write_to_xml_get (self):
         """
         Presently only makes sense for certain ExtendedProperties
@@ -124,7 +267,7 @@ class Field:
                     (isinstance(self.value, list) and len(self.value) == 0))
 
     def get_children (self):
-        return self.children
+        return self._children if self._children is not None else ()
 
     def set (self, value):
         self.value = value
@@ -133,32 +276,46 @@ class Field:
         return self.value if self.value is not None else ""
 
 class FieldURI(Field):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         Field.__init__(self, 'FieldURI', text)
 
 class ItemId(Field):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         Field.__init__(self, 'ItemId', text)
 
 class ChangeKey(Field):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         Field.__init__(self, 'ChangeKey', text)
 
 class ParentFolderId(Field):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         Field.__init__(self, 'ParentFolderId', text)
         self.furi = 'folder:ParentFolderId'
 
 class ParentFolderChangeKey(Field):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         Field.__init__(self, 'ParentFolderChangeKey', text)
 
 class ItemClass(Field):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         Field.__init__(self, 'ItemClass', text)
         self.furi = 'item:ItemClass'
  
 class DateTimeCreated(Field):
+    __slots__ = ()
+
     def __init__ (self, text=None):
         Field.__init__(self, 'DateTimeCreated', text)
 
@@ -169,7 +326,11 @@ class PropVariant:
     NAMED_STR = 3
 
 class ExtendedProperty(Field):
+    __slots__ = ('val', 'efuri')
+
     class ExtendedFieldURI(Field):
+        __slots__ = ()
+
         def __init__ (self, node=None, dis_psetid=None, psetid=None,
                       ptag=None, pname=None, pid=None, ptype=None):
             Field.__init__(self, 'ExtendedFieldURI')
@@ -212,6 +373,8 @@ class ExtendedProperty(Field):
                 self.attrib['PropertyId'] = utils.safe_int(pid)
 
     class Value(Field):
+        __slots__ = ()
+
         def __init__ (self, text=None):
             Field.__init__(self, 'Value')
 
@@ -475,11 +638,30 @@ class ExtendedProperty(Field):
         return dpsetid, psetid, pname
 
 class LastModifiedTime(ReadOnly, ExtendedProperty):
+    __slots__ = ()
+
     def __init__ (self, node=None, text=None):
         ptag  = mapitags.PROP_ID(mapitags.PR_LAST_MODIFICATION_TIME)
         ptype = mapitags.PROP_TYPE(mapitags.PR_LAST_MODIFICATION_TIME)
         ExtendedProperty.__init__(self, node=node, ptag=ptag, ptype=ptype)
 
+def _set_itemid (item, node):
+    item.itemid.value = node.attrib['Id']
+    item.change_key.value = node.attrib['ChangeKey']
+
+def _set_parent_folder (item, node):
+    item.parent_fid = ParentFolderId(node.attrib['Id'])
+    item.parent_fck = ParentFolderChangeKey(node.attrib['ChangeKey'])
+
+def _set_item_class (item, node):
+    item.item_class = ItemClass(node.text)
+
+def _set_last_modified_time (item, node):
+    item.last_modified_time = LastModifiedTime(node.text)
+
+def _set_created_time (item, node):
+    item.created_time = DateTimeCreated(node.text)
+
 class Item(Field):
     """
     Abstract wrapper class around an Exchange Item object. Frequently an
@@ -487,13 +669,54 @@ class Item(Field):
     """
 
     __metaclass__ = ABCMeta
+    __slots__ = ('service', 'resp_node', 'parent_fid', 'parent_fck', 'itemid',
+                 'item_class', 'change_key', 'created_time',
+                 'last_modified_time', 'eprops', 'eprops_tagged',
+                 'eprops_named_str', 'eprops_named_int')
+
+    ## Setters for the fields common to all items. See tag_table().
+    base_decoders = tag_table({
+        'ItemId'           : _set_itemid,
+        'ParentFolderId'   : _set_parent_folder,
+        'ItemClass'        : _set_item_class,
+        'LastModifiedTime' : _set_last_modified_time,
+        'DateTimeCreated'  : _set_created_time,
+    })
+
+    ## The fields common to all items, as decoded for lazy items - see
+    ## lazy_table(). The extended properties are left to the sub classes as
+    ## they decode them differently.
+    field_groups = [
+        ([('itemid', ItemId), ('change_key', ChangeKey)], ['ItemId']),
+        ([('parent_fid', ParentFolderId), ('parent_fck', lambda: None)],
+         ['ParentFolderId']),
+        ([('item_class', ItemClass)], ['ItemClass']),
+        ([('created_time', DateTimeCreated)], ['DateTimeCreated']),
+    ]
+
+    lazy_attrs = lazy_table(field_groups, base_decoders)
+
+    def __init__ (self, service, parent_fid=None, resp_node=None, tag='Item',
+                  lazy=False):
+        """
+        If lazy is True and resp_node is given the fields are decoded from
+        resp_node only as they are first looked up, which makes for cheap
+        items when only a few of their fields are ever read. resp_node
+        should then not be changed until the item is done with.
+        """
 
-    def __init__ (self, service, parent_fid=None, resp_node=None, tag='Item'):
         Field.__init__(self, tag=tag)
 
         self.service = service                       # Exchange service object
         self.resp_node = resp_node
 
+        if lazy and resp_node is not None:
+            ## parent_fid is only a fall back for when the response does not
+            ## have one, so the response has to be looked at right away.
+            if parent_fid is not None and self.parent_fid.value is None:
+                self.parent_fid.value = parent_fid
+            return
+
         self.parent_fid = ParentFolderId(parent_fid)
         self.parent_fck = None
 
@@ -652,6 +875,17 @@ class Item(Field):
     def parent_folder_id (self, val):
         self.parent_folder_id = val
 
+    def __getattr__ (self, name):
+        ## Only called for attributes that are not set, which are either
+        ## fields of a lazy item yet to be decoded, or just not there.
+        decode = self.lazy_attrs.get(name)
+        if decode is None:
+            raise AttributeError("'%s' object has no attribute '%s'" %
+                                 (type(self).__name__, name))
+
+        decode(self)
+        return object.__getattribute__(self, name)
+
     ##
     ## Finally, some internal methods and helper functions
     ##
@@ -661,21 +895,17 @@ class Item(Field):
         return r.value if r else None
 
     def _init_base_fields_from_resp (self, rnode):
-        """Return a reference to the parsed Element object for response after
-        snarfing all the common fields."""
+        """Snarf all the common fields from the parsed Element object for
+        the response."""
+
+        self._decode_children(rnode, self.base_decoders)
+
+    def _decode_children (self, rnode, decoders):
+        """Call the setter for each child of rnode that has one in the
+        decoders table - see tag_table()."""
 
+        get = decoders.get
         for child in rnode:
-            tag = unQName(child.tag)
-
-            if tag == 'ItemId':
-                self.itemid.value = child.attrib['Id']
-                self.change_key.value = child.attrib['ChangeKey']
-            elif tag == 'ParentFolderId':
-                self.parent_fid = ParentFolderId(child.attrib['Id'])
-                self.parent_fck = ParentFolderChangeKey(child.attrib['ChangeKey'])
-            elif tag == 'ItemClass':
-                self.item_class = ItemClass(child.text)
-            elif tag == 'LastModifiedTime':
-                self.last_modified_time = LastModifiedTime(child.text)
-            elif tag == 'DateTimeCreated':
-                self.created_time = DateTimeCreated(child.text)
+            fn = get(child.tag)
+            if fn is not None:
+                fn(self, child)
@@ -17,15 +17,31 @@
 ## You should have a copy of the license in the doc/ directory of pyews.  If
 ## not, see <http://www.gnu.org/licenses/>.
 
-import logging
+import logging, time
 import xml.etree.ElementTree as ET
 import pyews.utils as utils
 
 from   abc            import ABCMeta, abstractmethod
-from   pyews.soap     import SoapClient, QName_S, QName_T, QName_M
-from   pyews.utils    import pretty_xml
+from   collections    import OrderedDict
+from   pyews.soap     import SoapClient, TransferStats
+from   pyews.soap     import SoapConnectionError, SoapHTTPError
+from   pyews.soap     import QName_S, QName_T, QName_M
+from   pyews.ews            import envelope
+from   pyews.ews.batching   import OP_FIND_ITEM, OP_GET_ITEM, OP_SYNC_FOLDER
+from   pyews.ews.batching   import OP_CREATE_ITEM, OP_UPDATE_ITEM
+from   pyews.ews.batching   import OP_DELETE_ITEM
 from   pyews.ews.contact    import Contact
+from   pyews.ews.data       import DeleteType
 from   pyews.ews.errors     import EWSMessageError, EWSResponseError
+from   pyews.ews.retry      import RetryStats, backoff_ms
+
+## Where the RootFolder of a FindItem response is, so that it can be had
+## without a walk over the items
+FIND_ITEM_ROOT_FOLDER = '/'.join([QName_S('Body'),
+                                  QName_M('FindItemResponse'),
+                                  QName_M('ResponseMessages'),
+                                  QName_M('FindItemResponseMessage'),
+                                  QName_M('RootFolder')])
 
 ##
 ## Base classes
@@ -34,12 +50,45 @@ from   pyews.ews.errors     import EWSMessageError, EWSResponseError
 class Request(object):
     __metaclass__ = ABCMeta
 
+    ## Requests whose responses carry a potentially large number of items set
+    ## this to the tag of the item elements. When the soap client is in
+    ## streaming mode those elements are decoded as soon as they are parsed
+    ## instead of after the whole response has been read.
+    stream_tag = None
+
+    ## Whether it is safe to resend the request if we cannot tell whether
+    ## the server acted on it, as is the case with most transport errors.
+    idempotent = True
+
+    ## The EWS operation of requests whose number of items is chosen by the
+    ## batch sizer of the service, and the keyword argument that holds that
+    ## number - or the list of things of that length.
+    batch_op = None
+    batch_arg = None
+
     def __init__ (self, ews, template=None):
         self.ews = ews
         self.template = template
         self.kwargs = None
         self.resp = None
 
+        ## Wire level byte counts and timings of the last round trip.
+        self.stats = None
+
+        ## Items decoded while the response was being streamed in
+        self.streamed_items = []
+
+        ## Set to an ews.columns.ItemColumns to have the items of the
+        ## response decoded into that instead of into item objects.
+        self.item_columns = None
+
+        ## Whether the item objects of the response decode their fields
+        ## lazily. See Item.__init__().
+        self.lazy_items = ews.lazy_items
+
+        ## Retry book keeping of the last call to request_server()
+        self.retry_stats = None
+
     ##
     ## Abstract methods
     ##
@@ -48,17 +97,135 @@ class Request(object):
     def execute (self):
         pass
 
+    @abstractmethod
+    def process_response (self, node):
+        """
+        Wrap the parsed response node in the right Response object, do any
+        post processing required, and return the Response object. This is
+        kept separate from execute() so that the same decoding can be used
+        irrespective of how the request was sent to the server.
+        """
+        pass
+
     ##
     ## Public methods
     ##
 
+    def render (self):
+        """
+        Return the body of the request to be sent to the server. It is built
+        directly by the envelope module where possible, and from the
+        template otherwise - or if the service has use_templates set.
+        """
+
+        if (not getattr(self.ews, 'use_templates', False) and
+            envelope.has_writer(self.template)):
+            return envelope.build(self.template, **self.kwargs)
+
+        return self.ews.loader.load(self.template).generate(**self.kwargs)
+
     def request_server (self, debug=False):
-        r = self.ews.loader.load(self.template).generate(**self.kwargs)
-        r = utils.pretty_xml(r)
+        """
+        Send the request to the server and return the parsed response node.
+        Throttled requests and transient transport errors are retried as
+        per the retry_policy of the service, if it has one.
+
+        If debug is True the exchange is written to the wire log (if that is
+        enabled) irrespective of its sample rate.
+        """
+
+        r = self.render()
+
+        policy = getattr(self.ews, 'retry_policy', None)
+        self.retry_stats = RetryStats()
+
+        while True:
+            node = err = None
+            try:
+                node = self._send(r, debug)
+            except (SoapConnectionError, SoapHTTPError) as e:
+                err = e
+
+            delay = None
+            if policy is not None:
+                delay = policy.evaluate(self.retry_stats, node=node, error=err,
+                                        idempotent=self.idempotent)
+            if delay is None:
+                self.observe_batch(node, err)
+                if err is not None:
+                    raise err
+                return node
+
+            time.sleep(delay)
+
+    def batch_count (self):
+        """The number of items in this request, as far as batching goes."""
+
+        if self.batch_arg is None:
+            return None
+
+        v = self.kwargs.get(self.batch_arg)
+        if v is None or isinstance(v, (int, long)):
+            return v
+        return len(v)
+
+    def batch_returned (self, node):
+        """
+        The number of items the server sent back in the response node, for
+        requests it may send fewer items for than were asked for. None if
+        that does not apply, or cannot be told.
+        """
+
+        return None
+
+    def observe_batch (self, node=None, err=None):
+        """
+        Let the batch sizer of the service know how the last round trip of
+        this request went - the parsed response node, or the transport error
+        it failed with.
+        """
+
+        sizer = getattr(self.ews, 'batch_sizer', None)
+        if sizer is None or self.batch_op is None:
+            return
+
+        latency = size = None
+        if self.stats is not None:
+            latency = self.stats.elapsed
+            size = self.stats.response_raw_bytes
 
-        if debug:
-            logging.debug('Request: %s', r)
-        return self.ews.send(r, debug)
+        sizer.observe(self.batch_op, self.batch_count(), latency=latency,
+                      response_bytes=size, node=node, error=err,
+                      retry_stats=self.retry_stats,
+                      returned=self.batch_returned(node))
+
+    def _send (self, r, debug):
+        self.stats = TransferStats()
+        self.streamed_items = []
+        if self.item_columns is not None:
+            self.item_columns.clear()
+
+        if self.stream_tag is not None and self.ews.soap.streaming:
+            return self.ews.send(r, debug, stats=self.stats,
+                                 stream_tag=self.stream_tag,
+                                 on_element=self.stream_element)
+
+        return self.ews.send(r, debug, stats=self.stats)
+
+    def stream_element (self, node):
+        """
+        Decode an item element handed over by the soap client while the
+        response is being streamed in. The element is freed right after
+        this returns, so the item should not hang on to it.
+        """
+
+        if self.item_columns is not None:
+            self.item_columns.add(node)
+            return
+
+        item = Contact(self.ews, resp_node=node)
+        item.resp_node = None
+        self.streamed_items.append(item)
 
     def assert_error (self):
         if self.resp is not None:
@@ -67,6 +234,84 @@ class Request(object):
         if self.has_errors():
             raise EWSResponseError(self.resp)
 
+##
+## Everything the Response classes look for in a response is found in a
+## single walk over the tree by a ResponseScan, rather than in a walk for
+## each. The walk does not go into the elements it collects, such as the
+## items, which make up the bulk of a large response.
+##
+
+## The elements collected without looking into them
+SCAN_LEAVES = [
+    QName_S('Fault'),
+    QName_M('SyncState'),
+    QName_M('IncludesLastItemInRange'),
+]
+
+## The elements collected and looked into. Response messages, the tags of
+## which all end in ResponseMessage, are collected and looked into as well.
+SCAN_NODES = [
+    QName_M('RootFolder'),
+    QName_T('Create'),
+    QName_T('Update'),
+    QName_T('Delete'),
+]
+
+## The item elements collected by default
+ITEM_TAGS = [
+    QName_T('Contact'),
+]
+
+MESSAGE_PREFIX = QName_M('')
+MESSAGE_SUFFIX = 'ResponseMessage'
+
+class ResponseScan(object):
+    """
+    The elements of interest of a response, found in one walk over it.
+    """
+
+    def __init__ (self, node, item_tags=ITEM_TAGS):
+        self.leaves = set(SCAN_LEAVES) | set(item_tags)
+        self.nodes = set(SCAN_NODES)
+        self.found = {}
+
+        leaves = self.leaves
+        nodes = self.nodes
+        found = self.found
+        prefix = MESSAGE_PREFIX
+        suffix = MESSAGE_SUFFIX
+
+        ## Depth first, with the children pushed in reverse so that the
+        ## elements are found in document order.
+        stack = [node]
+        while stack:
+            elem = stack.pop()
+            tag = elem.tag
+            if tag in leaves:
+                found.setdefault(tag, []).append(elem)
+                continue
+
+            if (tag in nodes or (tag.startswith(prefix) and
+                                 tag.endswith(suffix))):
+                found.setdefault(tag, []).append(elem)
+            stack.extend(reversed(elem))
+
+    def find_all (self, tag):
+        """
+        Return the list of elements with the given tag, in document order,
+        or None if the scan did not look for them.
+        """
+
+        ret = self.found.get(tag)
+        if ret is not None:
+            return ret
+
+        if (tag in self.leaves or tag in self.nodes or
+            (tag.startswith(MESSAGE_PREFIX) and tag.endswith(MESSAGE_SUFFIX))):
+            return []
+
+        return None
+
 class Response(object):
     def __init__ (self, req, node):
         self.req = req
@@ -75,19 +320,87 @@ class Response(object):
         self.suc_cnt = 0
         self.war_cnt = 0
         self.errors = {}
+        self.warnings = {}
 
         ## Useful for some response objects.
         self.includes_last = True
+        self.total_items = None
+
+        self.scan = ResponseScan(node) if node is not None else None
 
         self.parse_for_faults()
 
+    def decode_items (self, tag=QName_T('Contact')):
+        """
+        Return the list of items in the response. This includes those that
+        were decoded while the response was being streamed in and are hence
+        no longer present in self.node. If the request has item_columns the
+        items are decoded into those instead, and the list is empty.
+        """
+
+        items = list(self.req.streamed_items)
+        cols = self.req.item_columns
+        if cols is not None:
+            for cxml in self.find_all(tag):
+                cols.add(cxml)
+            return items
+
+        ## FIXME: As we support additional item types we will add more such
+        ## loops.
+        for cxml in self.find_all(tag):
+            items.append(Contact(self.req.ews, resp_node=cxml,
+                                 lazy=self.req.lazy_items))
+
+        return items
+
+    def find_all (self, tag):
+        """
+        Return the elements of the response with the given tag, in document
+        order. Those that the ResponseScan looked for are had from there,
+        any others from a walk over the tree.
+        """
+
+        ret = self.scan.find_all(tag) if self.scan is not None else None
+        return ret if ret is not None else list(self.node.iter(tag))
+
+    def find_text (self, tag):
+        """
+        Return the text of the first element with the given tag, or [] if
+        there is none - as SoapClient.find_first_child() does.
+        """
+
+        for elem in self.find_all(tag):
+            return elem.text
+
+        return []
+
     def snarf_includes_last (self):
-        gna = SoapClient.get_node_attribute
-        last = gna(self.node, 'RootFolder', 'IncludesLastItemInRange')
+        last = self._root_folder_attrib('IncludesLastItemInRange')
         self.includes_last = (last == 'true')
 
         return self.includes_last
 
+    def snarf_total_items (self):
+        total = self._root_folder_attrib('TotalItemsInView')
+        self.total_items = int(total) if total is not None else None
+
+        return self.total_items
+
+    def next_offset (self, offset):
+        """
+        Return the offset of the page that follows this page of a FindItem
+        view, which was asked for at offset. The server may send fewer items
+        than were asked for, so this is its IndexedPagingOffset rather than
+        offset plus the size of the page asked for - or, failing that,
+        offset plus the number of items that did come back.
+        """
+
+        nxt = self._root_folder_attrib('IndexedPagingOffset')
+        if nxt is not None:
+            return int(nxt)
+
+        return offset + len(self.items)
+
     def parse_for_faults (self):
         """
         Check the response xml for any Faults in the XML request. Faults are
@@ -96,7 +409,7 @@ class Response(object):
 
         self.has_faults = False
 
-        for fault in self.node.iter(QName_S('Fault')):
+        for fault in self.find_all(QName_S('Fault')):
             self.fault_code = fault.find('faultcode').text
             self.fault_str  = fault.find('faultstring').text
             self.has_faults = True
@@ -109,21 +422,23 @@ class Response(object):
         while looking for errors and warnings as well.
 
         Errors are when the server understood our message, but could not do
-        what was asked of it, for whatever reason.
+        what was asked of it, for whatever reason. Warnings are when it did
+        some of it, or none of it - as when it stopped processing a batch
+        part way through. Both are kept by the index of their message, in
+        errors and warnings respectively.
         """
 
         assert self.node is not None
 
         i = 0
-        for gfrm in self.node.iter(tag):
+        for gfrm in self.find_all(tag):
             resp_class = gfrm.attrib['ResponseClass']
             if resp_class == 'Error':
                 self.err_cnt += 1
                 self.errors.update({i: EWSErrorElement(gfrm)})
             elif resp_class == 'Warning':
                 self.war_cnt += 1
-                ## FIXME: Need to handle these
-                logging.error('Ignoring a warning response class.')
+                self.warnings.update({i: EWSErrorElement(gfrm)})
             else:
                 self.suc_cnt += 1
                 if succ_func is not None:
@@ -136,9 +451,110 @@ class Response(object):
             for ind, err in self.errors.iteritems():
                 logging.error('  Item num %02d - %s', ind, str(err))
 
+        for ind, warn in self.warnings.iteritems():
+            logging.warning('Response.parse: Warning for item num %02d - %s',
+                            ind, str(warn))
+
     def has_errors (self):
         return self.err_cnt > 0
 
+    def _root_folder_attrib (self, name):
+        for root in self.find_all(QName_M('RootFolder')):
+            return root.attrib.get(name)
+
+        return None
+
+class ItemList(list):
+    """
+    A list of items fetched from the server, in the order they were asked
+    for. errors maps the ids of the items that could not be fetched to
+    what went wrong: an EWSErrorElement if the server reported an error or
+    a warning without the item, or the exception raised if the whole
+    request it was part of failed. warnings maps the ids of the items the
+    server sent back with a warning to the EWSErrorElement of the warning.
+    """
+
+    def __init__ (self, items=[]):
+        list.__init__(self, items)
+        self.errors = {}
+        self.warnings = {}
+
+    def has_errors (self):
+        return len(self.errors) > 0
+
+    def has_warnings (self):
+        return len(self.warnings) > 0
+
+class ItemOutcome(object):
+    """
+    What became of a single item of a bulk operation. item is the item, or
+    item id, as it was handed in. error is None if all went well; otherwise
+    it is an EWSErrorElement if the server reported an error for the item,
+    or the exception raised if the whole request the item was part of
+    failed.
+    """
+
+    def __init__ (self, item, itemid=None, change_key=None, error=None):
+        self.item = item
+        self.itemid = itemid
+        self.change_key = change_key
+        self.error = error
+
+    @property
+    def ok (self):
+        return self.error is None
+
+    @property
+    def error_code (self):
+        """The EWS response code of the error, or the name of the exception
+        class for errors that did not come from the server."""
+
+        if self.error is None:
+            return None
+        if isinstance(self.error, EWSErrorElement):
+            return self.error.resp_code
+        return self.error.__class__.__name__
+
+    def __str__ (self):
+        if self.ok:
+            return 'OK: %s' % self.itemid
+        return 'Error: %s' % self.error
+
+class BulkOutcome(list):
+    """
+    A list of ItemOutcomes, one for each item handed to a bulk operation and
+    in the same order.
+    """
+
+    def has_errors (self):
+        return any(not x.ok for x in self)
+
+    def failed (self):
+        return [x for x in self if not x.ok]
+
+    def by_id (self):
+        """
+        Return an OrderedDict of item id -> ItemOutcome for the outcomes that
+        have an item id - which, for a DeleteItems(), is all of them.
+        """
+
+        return OrderedDict((x.itemid, x) for x in self if x.itemid is not None)
+
+    def failed_items (self):
+        """The items that did not make it, to retry them with."""
+
+        return [x.item for x in self if not x.ok]
+
+    def error_codes (self):
+        """Return a dictionary of error code -> number of items that failed
+        with it."""
+
+        ret = {}
+        for x in self:
+            if not x.ok:
+                ret[x.error_code] = ret.get(x.error_code, 0) + 1
+        return ret
+
 class EWSErrorElement(object):
     """
     Wraps an XML response element that represents an erorr response from the
@@ -164,6 +580,9 @@ class EWSErrorElement(object):
         t = node.find(QName_M('DescriptiveLinkKey'))
         self.des_link_key = t.text if t is not None else None
 
+        ## Set when the server is throttling us and says how long to wait
+        self.back_off_ms = backoff_ms(node)
+
     def __str__ (self):
         return 'Code: %s; Text: %s' % (self.resp_code, self.msg_text)
 
@@ -181,7 +600,11 @@ class GetFolderRequest(Request):
     ##
 
     def execute (self):
-        self.resp_node = self.request_server(debug=False)
+        node = self.request_server()
+        return self.process_response(node)
+
+    def process_response (self, node):
+        self.resp_node = node
         self.resp_obj = GetFolderResponse(self, self.resp_node)
 
         return self.resp_obj
@@ -208,6 +631,10 @@ class GetFolderResponse(Response):
 ##
 
 class CreateItemsRequest(Request):
+    idempotent = False
+    batch_op = OP_CREATE_ITEM
+    batch_arg = 'items'
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_CREATE_ITEM)
         self.kwargs = kwargs
@@ -217,7 +644,11 @@ class CreateItemsRequest(Request):
     ##
 
     def execute (self):
-        self.resp_node = self.request_server(debug=True)
+        node = self.request_server()
+        return self.process_response(node)
+
+    def process_response (self, node):
+        self.resp_node = node
         self.resp_obj = CreateItemsResponse(self, self.resp_node)
 
         return self.resp_obj
@@ -252,16 +683,25 @@ class CreateItemsResponse(Response):
 ##
 
 class DeleteItemsRequest(Request):
+    idempotent = False
+    batch_op = OP_DELETE_ITEM
+    batch_arg = 'itemids'
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_DELETE_ITEM)
         self.kwargs = kwargs
+        self.kwargs.setdefault('delete_type', DeleteType.MoveToDeletedItems)
 
     ##
     ## Implement the abstract methods
     ##
 
     def execute (self):
-        self.resp_node = self.request_server(debug=True)
+        node = self.request_server()
+        return self.process_response(node)
+
+    def process_response (self, node):
+        self.resp_node = node
         self.resp_obj = DeleteItemsResponse(self, self.resp_node)
 
         return self.resp_obj
@@ -294,7 +734,11 @@ class FindFoldersRequest(Request):
     ##
 
     def execute (self):
-        self.resp_node = self.request_server(debug=False)
+        node = self.request_server()
+        return self.process_response(node)
+
+    def process_response (self, node):
+        self.resp_node = node
         self.resp_obj = FindFoldersResponse(self, self.resp_node)
 
         return self.resp_obj
@@ -326,6 +770,10 @@ class FindFoldersResponse(Response):
 ##
 
 class FindItemsRequest(Request):
+    stream_tag = QName_T('Contact')
+    batch_op = OP_FIND_ITEM
+    batch_arg = 'batch_size'
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_FIND_ITEM)
         self.kwargs = kwargs
@@ -335,11 +783,18 @@ class FindItemsRequest(Request):
     ##
 
     def execute (self):
-        self.resp_node = self.request_server(debug=False)
+        node = self.request_server()
+        return self.process_response(node)
+
+    def process_response (self, node):
+        self.resp_node = node
         self.resp_obj = FindItemsResponse(self, self.resp_node)
 
         return self.resp_obj
 
+    def batch_returned (self, node):
+        return find_item_returned(node, self.kwargs.get('offset', 0))
+
 class FindItemsResponse(Response):
     def __init__ (self, req, node=None):
         Response.__init__(self, req, node)
@@ -352,19 +807,37 @@ class FindItemsResponse(Response):
         node is a parsed XML Element containing the response
         """
         self.snarf_includes_last()
+        self.snarf_total_items()
         self.parse_for_errors(QName_M('FindItemResponseMessage'))
 
-        self.items = []
-        ## FIXME: As we support additional item types we will add more such
-        ## loops.
-        for cxml in self.node.iter(QName_T('Contact')):
-            self.items.append(Contact(self, resp_node=cxml))
+        self.items = self.decode_items()
+
+def find_item_returned (node, offset):
+    """
+    Return the number of items in the FindItem response node to a request
+    for the page at offset, going by its IndexedPagingOffset. None if the
+    response has no RootFolder, such as when the request failed.
+    """
+
+    if node is None:
+        return None
+
+    root = node.find(FIND_ITEM_ROOT_FOLDER)
+    nxt = root.get('IndexedPagingOffset') if root is not None else None
+    if nxt is None:
+        return None
+
+    return int(nxt) - int(offset)
 
 ##
 ## FindItemsLMT
 ##
 
 class FindItemsLMTRequest(Request):
+    stream_tag = QName_T('Contact')
+    batch_op = OP_FIND_ITEM
+    batch_arg = 'batch_size'
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_FIND_ITEM_LMT)
         self.kwargs = kwargs
@@ -374,12 +847,18 @@ class FindItemsLMTRequest(Request):
     ##
 
     def execute (self):
-        print '*** WTF: ', self.kwargs
-        self.resp_node = self.request_server(debug=False)
+        node = self.request_server()
+        return self.process_response(node)
+
+    def process_response (self, node):
+        self.resp_node = node
         self.resp_obj = FindItemsLMTResponse(self, self.resp_node)
 
         return self.resp_obj
 
+    def batch_returned (self, node):
+        return find_item_returned(node, self.kwargs.get('offset', 0))
+
 class FindItemsLMTResponse(Response):
     def __init__ (self, req, node=None):
         Response.__init__(self, req, node)
@@ -392,29 +871,36 @@ class FindItemsLMTResponse(Response):
         node is a parsed XML Element containing the response
         """
         self.snarf_includes_last()
+        self.snarf_total_items()
         self.parse_for_errors(QName_M('FindItemResponseMessage'))
 
-        self.items = []
-        ## FIXME: As we support additional item types we will add more such
-        ## loops.
-        for cxml in self.node.iter(QName_T('Contact')):
-            self.items.append(Contact(self, resp_node=cxml))
+        self.items = self.decode_items()
 
 ##
 ## GetItems
 ##
 
 class GetItemsRequest(Request):
+    stream_tag = QName_T('Contact')
+    batch_op = OP_GET_ITEM
+    batch_arg = 'itemids'
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_GET_ITEM)
         self.kwargs = kwargs
+        self.kwargs.setdefault('custom_eprops_xml', [])
+        self.kwargs.setdefault('ids_only', False)
 
     ##
     ## Implement the abstract methods
     ##
 
     def execute (self):
-        self.resp_node = self.request_server(debug=True)
+        node = self.request_server()
+        return self.process_response(node)
+
+    def process_response (self, node):
+        self.resp_node = node
         self.resp_obj = GetItemsResponse(self, self.resp_node)
 
         return self.resp_obj
@@ -433,11 +919,7 @@ class GetItemsResponse(Response):
 
         self.parse_for_errors(QName_M('GetItemResponseMessage'))
 
-        self.items = []
-        ## FIXME: As we support additional item types we will add more such
-        ## loops.
-        for cxml in self.node.iter(QName_T('Contact')):
-            self.items.append(Contact(self, resp_node=cxml))
+        self.items = self.decode_items()
 
 ##
 ## UpdateItems
@@ -449,6 +931,10 @@ class UpdateItemsRequest(Request):
     returned changekeys back to the source item objects
     """
 
+    idempotent = False
+    batch_op = OP_UPDATE_ITEM
+    batch_arg = 'items'
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_UPDATE_ITEM)
         self.kwargs = kwargs
@@ -462,7 +948,11 @@ class UpdateItemsRequest(Request):
     ##
 
     def execute (self):
-        self.resp_node = self.request_server(debug=False)
+        node = self.request_server()
+        return self.process_response(node)
+
+    def process_response (self, node):
+        self.resp_node = node
         self.resp_obj = UpdateItemsResponse(self, self.resp_node)
         self.update_change_keys()
 
@@ -489,11 +979,7 @@ class UpdateItemsResponse(Response):
 
         self.parse_for_errors(QName_M('UpdateItemResponseMessage'))
 
-        self.items = []
-        ## FIXME: As we support additional item types we will add more such
-        ## loops.
-        for cxml in self.node.iter(QName_T('Contact')):
-            self.items.append(Contact(self, resp_node=cxml))
+        self.items = self.decode_items()
 
 ##
 ## SyncFolder
@@ -505,6 +991,9 @@ class SyncFolderItemsRequest(Request):
     returned changekeys back to the source item objects
     """
 
+    batch_op = OP_SYNC_FOLDER
+    batch_arg = 'batch_size'
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_SYNC_FOLDER)
         self.kwargs = kwargs
@@ -516,7 +1005,11 @@ class SyncFolderItemsRequest(Request):
     ##
 
     def execute (self):
-        self.resp_node = self.request_server(debug=False)
+        node = self.request_server()
+        return self.process_response(node)
+
+    def process_response (self, node):
+        self.resp_node = node
         self.resp_obj = SyncFolderItemsResponse(self, self.resp_node)
 
         return self.resp_obj
@@ -533,24 +1026,33 @@ class SyncFolderItemsResponse(Response):
         node is a parsed XML Element containing the response. FIXME
         """
 
-        find_child = SoapClient.find_first_child
-
         self.parse_for_errors(QName_M('SyncFolderItemsResponseMessage'))
-        self.snarf_includes_last()
-        self.sync_state = find_child(node, QName_M('SyncState'))
+        ## find_text() gives [] for a missing element, which is no state to
+        ## save or send back
+        self.sync_state = self.find_text(QName_M('SyncState')) or None
+
+        ## Unlike FindItem, this is an element of its own rather than an
+        ## attribute of a RootFolder
+        last = self.find_text(QName_M('IncludesLastItemInRange'))
+        self.includes_last = (last == 'true')
 
         self.news = []
         self.mods = []
         self.dels = []
 
-        for create in node.iter(QName_T('Create')):
-            for child in create:
-                self.news.append(Contact(self.req.ews, resp_node=child))
-
-        for create in node.iter(QName_T('Update')):
+        for create in self.find_all(QName_T('Create')):
             for child in create:
-                self.mods.append(Contact(self.req.ews, resp_node=child))
+                self.news.append(Contact(self.req.ews, resp_node=child,
+                                         lazy=self.req.lazy_items))
 
-        for create in node.iter(QName_T('Delete')):
+        for create in self.find_all(QName_T('Update')):
             for child in create:
-                self.dels.append(Contact(self.req.ews, resp_node=child))
+                self.mods.append(Contact(self.req.ews, resp_node=child,
+                                         lazy=self.req.lazy_items))
+
+        ## Deletes only have the ItemId of the item that is gone
+        for delete in self.find_all(QName_T('Delete')):
+            for child in delete:
+                con = Contact(self.req.ews)
+                con.itemid.set(child.attrib.get('Id'))
+                self.dels.append(con)
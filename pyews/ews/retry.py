@@ -0,0 +1,257 @@
+##
+## Created : Sun Oct 18 10:12:37 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Exchange throttles clients that send too much work its way. It does so
+## either with a HTTP 503, or with an ErrorServerBusy response code - as a
+## SOAP fault or as the response class of individual response messages. In
+## the latter cases the server also tells us how long to back off:
+##
+##   <t:MessageXml>
+##     <t:Value Name="BackOffMilliseconds">30000</t:Value>
+##   </t:MessageXml>
+##
+## The RetryPolicy below decides whether and when a request should be sent
+## again. The actual retry loops live with the code that sends requests.
+##
+
+import logging, random, time
+
+from   pyews.soap import SoapConnectionError, SoapHTTPError
+from   pyews.soap import QName_E, QName_M, QName_S, QName_T
+
+SERVER_BUSY = 'ErrorServerBusy'
+
+## HTTP status codes that indicate a transient problem on the server side
+RETRY_HTTP_CODES = (429, 502, 503, 504)
+
+class RetryStats(object):
+    """
+    Book keeping of the retries done for a single request.
+    """
+
+    def __init__ (self):
+        self.start = time.time()
+        self.attempts = 0
+        self.retries = 0
+        self.backoff_time = 0.0         # Total time spent sleeping
+        self.server_backoffs = 0        # Number of server supplied backoffs
+        self.reasons = []               # Reason for each retry
+        self.gave_up = False
+
+    @property
+    def elapsed (self):
+        return time.time() - self.start
+
+    def __str__ (self):
+        return ('Attempts: %d; Retries: %d; Backoff: %.3fs (%d from server); '
+                'Gave up: %s; Reasons: %s' % (self.attempts, self.retries,
+                                              self.backoff_time,
+                                              self.server_backoffs,
+                                              self.gave_up,
+                                              ', '.join(self.reasons)))
+
+class RetryPolicy(object):
+    """
+    Decides whether a request should be retried, and after how long.
+
+    Server supplied backoff times are always honoured. Transient transport
+    errors are retried with jittered exponential backoff. Either way no
+    request is retried more than max_retries times, or beyond max_total
+    seconds since it was first sent.
+    """
+
+    def __init__ (self, max_retries=5, base_delay=1.0, max_delay=60.0,
+                  max_total=300.0, jitter=0.5):
+        """
+        base_delay is the backoff in seconds before the first retry of a
+        transport error. It doubles with every subsequent retry, up to
+        max_delay. jitter is the fraction of the computed delay that is
+        randomly shaved off so that many clients failing at the same time do
+        not come back at the same time as well.
+        """
+
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_total = max_total
+        self.jitter = jitter
+
+    def evaluate (self, stats, node=None, error=None, idempotent=True):
+        """
+        Look at the outcome of an attempt - either the parsed response node
+        or the transport error raised - and return the number of seconds to
+        wait before retrying it, or None if it should not be retried. stats
+        is the RetryStats object for the request and is updated.
+
+        Requests that are not idempotent are not retried after transport
+        errors as the server may have acted on them before the connection
+        failed.
+        """
+
+        stats.attempts += 1
+
+        if error is not None:
+            reason, backoff = self.check_error(error, idempotent)
+        else:
+            reason, backoff = self.check_response(node)
+
+        if reason is None:
+            return None
+
+        delay = self.next_delay(stats, backoff)
+        if delay is None:
+            stats.gave_up = True
+            logging.warning('Giving up after %d attempts (%s)', stats.attempts,
+                            reason)
+            return None
+
+        stats.retries += 1
+        stats.backoff_time += delay
+        stats.reasons.append(reason)
+        if backoff is not None:
+            stats.server_backoffs += 1
+
+        logging.info('Retrying request in %.3fs (%s)', delay, reason)
+        return delay
+
+    def next_delay (self, stats, backoff_ms=None):
+        """
+        Return the delay before the next retry given the RetryStats so far
+        and the server supplied backoff if any. None means give up.
+        """
+
+        if stats.retries >= self.max_retries:
+            return None
+
+        if backoff_ms is not None:
+            delay = backoff_ms / 1000.0
+        else:
+            delay = min(self.max_delay, self.base_delay * (2 ** stats.retries))
+            delay *= 1 - self.jitter * random.random()
+
+        if stats.elapsed + delay > self.max_total:
+            return None
+
+        return delay
+
+    def check_error (self, error, idempotent=True):
+        """
+        Returns a (reason, backoff_ms) tuple for the given transport error.
+        reason is None if the error is not worth retrying.
+        """
+
+        if isinstance(error, SoapHTTPError):
+            if error.code not in RETRY_HTTP_CODES:
+                return None, None
+
+            backoff = None
+            if error.retry_after is not None:
+                try:
+                    backoff = int(error.retry_after) * 1000
+                except ValueError:
+                    pass
+
+            ## A 503 is the server refusing to do any work, so it is safe to
+            ## retry irrespective of the type of request.
+            if error.code == 503 or idempotent:
+                return 'HTTP %d' % error.code, backoff
+
+            return None, None
+
+        if isinstance(error, SoapConnectionError) and idempotent:
+            return 'Connection error: %s' % error, None
+
+        return None, None
+
+    def check_response (self, node):
+        """
+        Returns a (reason, backoff_ms) tuple if the response node says the
+        server is too busy to act on the request. reason is None otherwise.
+
+        A request is deemed throttled if it resulted in a SOAP Fault with
+        ErrorServerBusy, or if all of its response messages report
+        ErrorServerBusy. If only some of them do, the request was partially
+        processed and resending it as a whole is not an option.
+        """
+
+        return check_server_busy(node)
+
+def check_server_busy (node):
+    """
+    See RetryPolicy.check_response(). Only looks at the top few levels of
+    the tree, so this is cheap even for large responses.
+    """
+
+    if node is None:
+        return None, None
+
+    body = node.find(QName_S('Body'))
+    if body is None:
+        return None, None
+
+    for child in body:
+        if child.tag == QName_S('Fault'):
+            detail = child.find('detail')
+            if detail is None:
+                return None, None
+
+            code = detail.find(QName_E('ResponseCode'))
+            if code is not None and code.text == SERVER_BUSY:
+                return SERVER_BUSY, backoff_ms(detail)
+
+            return None, None
+
+        msgs = child.find(QName_M('ResponseMessages'))
+        if msgs is None:
+            continue
+
+        busy = 0
+        total = 0
+        backoff = None
+        for msg in msgs:
+            total += 1
+            code = msg.find(QName_M('ResponseCode'))
+            if code is None or code.text != SERVER_BUSY:
+                continue
+
+            busy += 1
+            b = backoff_ms(msg)
+            if b is not None and (backoff is None or b > backoff):
+                backoff = b
+
+        if total > 0 and busy == total:
+            return SERVER_BUSY, backoff
+
+    return None, None
+
+def backoff_ms (node):
+    """
+    Return the BackOffMilliseconds value from the MessageXml under the given
+    node, or None if there isn't one.
+    """
+
+    for val in node.iter(QName_T('Value')):
+        if val.attrib.get('Name') == 'BackOffMilliseconds':
+            try:
+                return int(val.text)
+            except (TypeError, ValueError):
+                return None
+
+    return None
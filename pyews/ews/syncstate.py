@@ -0,0 +1,274 @@
+##
+## Created : Sun Oct 18 21:14:48 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Persistent storage for SyncFolderItems sync states, keyed by mailbox and
+## folder id. A typical sync of a folder goes:
+##
+##   state = store.get(user, folder.Id)
+##   ews.sync_folder_items(folder.Id, state, on_changes,
+##                         checkpoint=store.checkpoint(user, folder.Id))
+##
+## Each (mailbox, folder) is saved on its own, atomically, so that saving
+## the state of one folder neither rewrites nor waits for the others.
+##
+
+import errno, hashlib, json, os, sqlite3, tempfile, threading, time
+
+from   abc import ABCMeta, abstractmethod
+
+class SyncStateStore(object):
+    """
+    The interface to a store of sync states. Implementations should be
+    safe to use from many threads at once.
+    """
+
+    __metaclass__ = ABCMeta
+
+    ##
+    ## Abstract methods
+    ##
+
+    @abstractmethod
+    def get (self, mailbox, folder_id):
+        """Return the saved sync state of the folder, or None."""
+        pass
+
+    @abstractmethod
+    def set (self, mailbox, folder_id, sync_state):
+        """Save the sync state of the folder, replacing what was there."""
+        pass
+
+    @abstractmethod
+    def delete (self, mailbox, folder_id):
+        """Forget the sync state of the folder, if there is one."""
+        pass
+
+    @abstractmethod
+    def folders (self, mailbox):
+        """Return the ids of the folders of mailbox with a saved state."""
+        pass
+
+    ##
+    ## Public methods
+    ##
+
+    def checkpoint (self, mailbox, folder_id):
+        """
+        Return a function that saves the sync state it is called with for
+        the given folder, to hand to ExchangeService.sync_folder_items().
+        """
+
+        def save (sync_state):
+            self.set(mailbox, folder_id, sync_state)
+
+        return save
+
+    def close (self):
+        pass
+
+class FileSyncStateStore(SyncStateStore):
+    """
+    Keeps each sync state in a small file of its own, in a directory per
+    mailbox under root. A state is saved by writing a new file and renaming
+    it over the old one, so readers see either the old state or the new
+    one, never a mix.
+    """
+
+    def __init__ (self, root, fsync=True):
+        """
+        If fsync is True the data is flushed to disk before the rename, so
+        a state that was saved survives a crash of the machine.
+        """
+
+        self.root = root
+        self.fsync = fsync
+
+    def get (self, mailbox, folder_id):
+        try:
+            with open(self._path(mailbox, folder_id)) as inf:
+                return json.load(inf).get('sync_state')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+
+    def set (self, mailbox, folder_id, sync_state):
+        mdir = self._mailbox_dir(mailbox)
+        try:
+            os.makedirs(mdir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        data = json.dumps({'mailbox'    : mailbox,
+                           'folder_id'  : folder_id,
+                           'sync_state' : sync_state,
+                           'updated'    : time.time()})
+
+        fd, tmp = tempfile.mkstemp(dir=mdir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w') as outf:
+                outf.write(data)
+                if self.fsync:
+                    outf.flush()
+                    os.fsync(outf.fileno())
+            self._rename(tmp, self._path(mailbox, folder_id))
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def delete (self, mailbox, folder_id):
+        try:
+            os.unlink(self._path(mailbox, folder_id))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def folders (self, mailbox):
+        mdir = self._mailbox_dir(mailbox)
+        try:
+            names = os.listdir(mdir)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return []
+            raise
+
+        ret = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(mdir, name)) as inf:
+                    ret.append(json.load(inf)['folder_id'])
+            except (IOError, ValueError, KeyError):
+                ## Deleted, or being replaced, under us
+                continue
+
+        return ret
+
+    ##
+    ## Internal methods
+    ##
+
+    def _mailbox_dir (self, mailbox):
+        return os.path.join(self.root, _digest(mailbox))
+
+    def _path (self, mailbox, folder_id):
+        ## Folder ids are long and may contain '/', so they do not make for
+        ## good file names themselves.
+        return os.path.join(self._mailbox_dir(mailbox),
+                            _digest(folder_id) + '.json')
+
+    def _rename (self, src, dst):
+        try:
+            os.rename(src, dst)
+        except OSError:
+            ## Windows does not let rename replace an existing file
+            if os.name != 'nt' or not os.path.exists(dst):
+                raise
+            os.unlink(dst)
+            os.rename(src, dst)
+
+class SQLiteSyncStateStore(SyncStateStore):
+    """
+    Keeps the sync states in a table of a SQLite database. Each thread gets
+    a connection of its own. The database is put in WAL mode so that readers
+    do not wait for the writer, and each state is saved in a transaction of
+    its own.
+    """
+
+    def __init__ (self, path, timeout=30.0):
+        """
+        timeout is how long in seconds a writer waits for another writer to
+        be done before giving up.
+        """
+
+        self.path = path
+        self.timeout = timeout
+
+        self._local = threading.local()
+        self._conns = []
+        self._lock = threading.Lock()
+
+        conn = self._conn()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS sync_state ('
+                         '  mailbox    TEXT NOT NULL,'
+                         '  folder_id  TEXT NOT NULL,'
+                         '  sync_state TEXT,'
+                         '  updated    REAL NOT NULL,'
+                         '  PRIMARY KEY (mailbox, folder_id))')
+
+    def get (self, mailbox, folder_id):
+        row = self._conn().execute('SELECT sync_state FROM sync_state WHERE '
+                                   'mailbox = ? AND folder_id = ?',
+                                   (mailbox, folder_id)).fetchone()
+        return row[0] if row is not None else None
+
+    def set (self, mailbox, folder_id, sync_state):
+        conn = self._conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO sync_state (mailbox, '
+                         'folder_id, sync_state, updated) VALUES (?, ?, ?, ?)',
+                         (mailbox, folder_id, sync_state, time.time()))
+
+    def delete (self, mailbox, folder_id):
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM sync_state WHERE mailbox = ? AND '
+                         'folder_id = ?', (mailbox, folder_id))
+
+    def folders (self, mailbox):
+        rows = self._conn().execute('SELECT folder_id FROM sync_state WHERE '
+                                    'mailbox = ?', (mailbox,))
+        return [r[0] for r in rows]
+
+    def close (self):
+        with self._lock:
+            conns, self._conns = self._conns, []
+
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+
+    ##
+    ## Internal methods
+    ##
+
+    def _conn (self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+
+        return conn
+
+def _digest (s):
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    return hashlib.sha1(s).hexdigest()
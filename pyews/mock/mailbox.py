@@ -0,0 +1,336 @@
+##
+## Created : Sun Oct 18 13:41:05 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## The in-memory store behind the mock EWS server: a folder hierarchy with
+## contacts in it, and a per folder change log from which SyncFolderItems
+## is answered.
+##
+## Synthetic contacts only remember their sequence number and generate their
+## fields on demand, so a mailbox can be seeded with hundreds of thousands
+## of them without using much memory. A contact gets a field dictionary of
+## its own the first time it is modified.
+##
+
+import base64, bisect, threading, time
+
+from   collections import OrderedDict
+
+## Tags of the contact fields that are dictionaries of Key -> value entries
+ENTRY_FIELDS = ('EmailAddresses', 'PhoneNumbers', 'ImAddresses')
+
+## Property tags of the extended properties that are computed rather than
+## stored.
+PR_LAST_MODIFICATION_TIME = 0x3008
+PR_GENDER                 = 0x3a4d
+
+def timestamp (t):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(t))
+
+def make_id (kind, n):
+    """
+    Return an opaque looking, but deterministic, EWS id for the n-th object
+    of the given kind.
+    """
+
+    return 'AAMk' + base64.b64encode('%s-%012d' % (kind, n))
+
+class MockContact(object):
+    """
+    A contact in the mock mailbox. fields maps the contact field tags to
+    their text value - or for ENTRY_FIELDS, to an OrderedDict of Key ->
+    value. eprops maps (PropertyTag, PropertyType) to the value of extended
+    properties.
+    """
+
+    __slots__ = ('n', 'id', 'folder', 'version', 'created', 'modified',
+                 'created_seq', 'seq', '_fields', '_eprops')
+
+    def __init__ (self, n, folder, created, fields=None, eprops=None):
+        self.n = n
+        self.id = make_id('item', n)
+        self.folder = folder
+        self.version = 1
+        self.created = created
+        self.modified = created
+
+        ## Sequence number of the first and latest changes to this contact
+        ## in its present folder
+        self.created_seq = None
+        self.seq = None
+
+        self._fields = fields
+        self._eprops = eprops
+
+    @property
+    def change_key (self):
+        return base64.b64encode('ck-%012d-%06d' % (self.n, self.version))
+
+    @property
+    def fields (self):
+        if self._fields is None:
+            return synthetic_fields(self.n)
+        return self._fields
+
+    @property
+    def eprops (self):
+        if self._eprops is None:
+            return {(PR_GENDER, 'Short') : str(1 + self.n % 3)}
+        return self._eprops
+
+    def materialize (self):
+        """Give this contact its own copy of the synthetic fields so that
+        they can be modified."""
+
+        if self._fields is None:
+            self._fields = synthetic_fields(self.n)
+        if self._eprops is None:
+            self._eprops = dict(self.eprops)
+
+    def display_name (self):
+        return self.fields.get('DisplayName')
+
+def synthetic_fields (n):
+    given = 'Given%d' % n
+    surname = 'Surname%d' % (n % 997)
+
+    return OrderedDict([
+        ('FileAs',         '%s, %s' % (surname, given)),
+        ('DisplayName',    '%s %s' % (given, surname)),
+        ('GivenName',      given),
+        ('Surname',        surname),
+        ('CompanyName',    'Company %d' % (n % 101)),
+        ('JobTitle',       'Engineer'),
+        ('Body',           'Synthetic contact number %d' % n),
+        ('EmailAddresses', OrderedDict([
+            ('EmailAddress1', 'given%d@example.com' % n)])),
+        ('PhoneNumbers',   OrderedDict([
+            ('MobilePhone',   '+91 98450 %05d' % (n % 100000)),
+            ('BusinessPhone', '+91 80 4000 %04d' % (n % 10000))])),
+    ])
+
+class MockFolder(object):
+    def __init__ (self, n, name, folder_class=None, parent=None):
+        self.n = n
+        self.id = make_id('folder', n)
+        self.change_key = base64.b64encode('fck-%012d' % n)
+        self.name = name
+        self.folder_class = folder_class
+        self.parent = parent
+        self.children = []
+
+        self.items = OrderedDict()
+
+        ## The change log. log_seqs and log_ids are parallel lists of the
+        ## sequence number of each change and the id of the item changed,
+        ## in increasing order of sequence numbers. tombstones maps the ids
+        ## of items that have left the folder to their (seq, created_seq).
+        self.log_seqs = []
+        self.log_ids = []
+        self.tombstones = {}
+
+        if parent is not None:
+            parent.children.append(self)
+
+    def descendants (self):
+        ret = []
+        for child in self.children:
+            ret.append(child)
+            ret.extend(child.descendants())
+        return ret
+
+    def log (self, seq, itemid):
+        self.log_seqs.append(seq)
+        self.log_ids.append(itemid)
+
+    def changes_since (self, since):
+        """
+        Return the list of (seq, kind, item_or_id) tuples for the net changes
+        made to this folder after the given sequence number, in order. kind
+        is one of 'Create', 'Update' or 'Delete'. For deletes, the id of the
+        item that is gone is returned in place of the item.
+        """
+
+        ret = []
+        i = bisect.bisect_right(self.log_seqs, since)
+        for seq, iid in zip(self.log_seqs[i:], self.log_ids[i:]):
+            item = self.items.get(iid)
+            if item is not None:
+                if item.seq != seq:
+                    continue
+                kind = 'Create' if item.created_seq > since else 'Update'
+                ret.append((seq, kind, item))
+            elif iid in self.tombstones:
+                dseq, created_seq = self.tombstones[iid]
+                if dseq == seq and created_seq <= since:
+                    ret.append((seq, 'Delete', iid))
+
+        return ret
+
+class Mailbox(object):
+    """
+    The folders and contacts of the mock server. All access from the server
+    is serialised by lock.
+    """
+
+    def __init__ (self):
+        self.lock = threading.RLock()
+        self.seq = 0
+
+        self.folders = {}
+        self.distinguished = {}
+        self.items = {}
+
+        self._next_folder = 0
+        self._next_item = 0
+
+        root = self.add_folder('Top of Information Store', None, None)
+        self.distinguished['msgfolderroot'] = root
+        self.distinguished['root'] = root
+
+        contacts = self.add_folder('Contacts', 'IPF.Contact', root)
+        self.distinguished['contacts'] = contacts
+
+        deleted = self.add_folder('Deleted Items', 'IPF.Note', root)
+        self.distinguished['deleteditems'] = deleted
+
+    @classmethod
+    def synthetic (self, contacts=100, folders=1):
+        """
+        Return a new Mailbox with the given number of contacts folders, each
+        holding the given number of synthetic contacts. The first folder is
+        the distinguished Contacts folder; the rest are created under it.
+        """
+
+        mb = Mailbox()
+        parent = mb.distinguished['contacts']
+        mb.add_synthetic_contacts(parent, contacts)
+        for i in range(1, folders):
+            f = mb.add_folder('Contacts %d' % i, 'IPF.Contact', parent)
+            mb.add_synthetic_contacts(f, contacts)
+
+        return mb
+
+    ##
+    ## Folders
+    ##
+
+    def add_folder (self, name, folder_class, parent):
+        with self.lock:
+            self._next_folder += 1
+            f = MockFolder(self._next_folder, name, folder_class, parent)
+            self.folders[f.id] = f
+            return f
+
+    def get_folder (self, fid=None, distinguished=None):
+        if distinguished is not None:
+            return self.distinguished.get(distinguished)
+        return self.folders.get(fid)
+
+    ##
+    ## Contacts
+    ##
+
+    def add_synthetic_contacts (self, folder, n):
+        with self.lock:
+            now = time.time()
+            for i in range(n):
+                self._add(MockContact(self._next_item, folder, now))
+
+    def create_contact (self, folder, fields, eprops):
+        with self.lock:
+            return self._add(MockContact(self._next_item, folder, time.time(),
+                                         fields, eprops))
+
+    def get_contact (self, itemid):
+        return self.items.get(itemid)
+
+    def touch (self, item):
+        """Record a modification of item."""
+
+        with self.lock:
+            item.version += 1
+            item.modified = time.time()
+            item.seq = self._next_seq()
+            item.folder.log(item.seq, item.id)
+
+    def delete_contact (self, item, move_to=None):
+        """
+        Remove item from its folder, and from the mailbox altogether unless
+        move_to is a folder to move it to.
+        """
+
+        with self.lock:
+            src = item.folder
+            del src.items[item.id]
+            seq = self._next_seq()
+            src.tombstones[item.id] = (seq, item.created_seq)
+            src.log(seq, item.id)
+
+            if move_to is None:
+                del self.items[item.id]
+            else:
+                item.folder = move_to
+                item.version += 1
+                self._link(item)
+
+    ##
+    ## Sync state
+    ##
+
+    def sync_state (self, folder, seq):
+        return base64.b64encode('%s:%d' % (folder.id, seq))
+
+    def parse_sync_state (self, folder, state):
+        """
+        Return the sequence number encoded in the given sync state, 0 for an
+        empty state, or None if the state is not valid for folder.
+        """
+
+        if not state:
+            return 0
+
+        try:
+            fid, seq = base64.b64decode(state).rsplit(':', 1)
+            seq = int(seq)
+        except (TypeError, ValueError):
+            return None
+
+        return seq if fid == folder.id else None
+
+    ##
+    ## Internal methods
+    ##
+
+    def _next_seq (self):
+        self.seq += 1
+        return self.seq
+
+    def _add (self, item):
+        self._next_item += 1
+        self.items[item.id] = item
+        self._link(item)
+        return item
+
+    def _link (self, item):
+        seq = self._next_seq()
+        item.created_seq = item.seq = seq
+        item.folder.items[item.id] = item
+        item.folder.tombstones.pop(item.id, None)
+        item.folder.log(seq, item.id)
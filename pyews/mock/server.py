@@ -0,0 +1,859 @@
+##
+## Created : Sun Oct 18 14:05:22 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## A stand-in EWS server for testing and benchmarking without a real
+## mailbox. It speaks enough of the protocol for everything pyews does with
+## contacts: GetFolder, FindFolder, FindItem (with paging), GetItem,
+## CreateItem, UpdateItem, DeleteItem and SyncFolderItems.
+##
+## Latency, throttling and partial errors can be injected through a Faults
+## object, with a seeded random number generator so that runs are
+## reproducible. Typical use:
+##
+##   mb  = Mailbox.synthetic(contacts=10000)
+##   srv = MockEWSServer(mb, faults=Faults(latency=0.05, busy_rate=0.01))
+##   srv.start()
+##   ews.Url = srv.url
+##   ...
+##   srv.stop()
+##
+## or from the command line: python -m pyews.mock.server --help
+##
+
+import BaseHTTPServer, SocketServer
+import argparse, logging, random, threading, time, zlib
+import xml.etree.ElementTree as ET
+
+from   collections        import OrderedDict
+from   xml.sax.saxutils   import escape
+from   pyews.soap         import QName_M, QName_S, QName_T, unQName
+from   pyews.soap         import E_NAMESPACE, M_NAMESPACE, S_NAMESPACE
+from   pyews.soap         import T_NAMESPACE
+from   pyews.mock.mailbox import Mailbox, ENTRY_FIELDS, timestamp
+from   pyews.mock.mailbox import PR_LAST_MODIFICATION_TIME
+
+EWS_PATH = '/EWS/Exchange.asmx'
+
+## Server side limits, with the defaults of Exchange Online
+FIND_COUNT_LIMIT = 1000                 # EWSFindCountLimit
+SYNC_MAX_CHANGES = 512
+
+## The order in which contact fields are written out, as per the schema.
+## Fields not listed here go at the end.
+CONTACT_FIELD_ORDER = [
+    'Body', 'FileAs', 'DisplayName', 'GivenName', 'Initials', 'MiddleName',
+    'Nickname', 'CompanyName', 'EmailAddresses', 'PhoneNumbers',
+    'AssistantName', 'Birthday', 'BusinessHomePage', 'Department',
+    'ImAddresses', 'JobTitle', 'Manager', 'SpouseName', 'Surname',
+    'WeddingAnniversary', 'Alias',
+]
+CONTACT_FIELD_RANK = dict((f, i) for i, f in enumerate(CONTACT_FIELD_ORDER))
+
+## IndexedFieldURI names of the entry fields
+INDEXED_FIELDS = {
+    'EmailAddress' : 'EmailAddresses',
+    'PhoneNumber'  : 'PhoneNumbers',
+    'ImAddress'    : 'ImAddresses',
+}
+
+class Faults(object):
+    """
+    What, if anything, should go wrong with requests to the mock server.
+
+    latency is the number of seconds every request is delayed by, plus a
+    random amount up to jitter. busy_rate is the fraction of requests that
+    are refused with an ErrorServerBusy SOAP fault asking the client to back
+    off for backoff_ms, and http_503_rate the fraction refused with a HTTP
+    503. error_rate is the fraction of individual response messages, in
+    requests that have one per item, that fail with a transient error.
+    """
+
+    def __init__ (self, latency=0.0, jitter=0.0, busy_rate=0.0,
+                  backoff_ms=100, http_503_rate=0.0, error_rate=0.0,
+                  seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.busy_rate = busy_rate
+        self.backoff_ms = backoff_ms
+        self.http_503_rate = http_503_rate
+        self.error_rate = error_rate
+
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._busy_next = 0
+
+    def busy_next (self, n=1):
+        """Throttle the next n requests irrespective of busy_rate."""
+
+        with self._lock:
+            self._busy_next += n
+
+    def delay (self):
+        d = self.latency
+        if self.jitter:
+            with self._lock:
+                d += self.jitter * self._random.random()
+        return d
+
+    def throttle (self):
+        """Return None, 'busy' or 503 for the request being processed."""
+
+        with self._lock:
+            if self._busy_next > 0:
+                self._busy_next -= 1
+                return 'busy'
+            if self.http_503_rate and self._random.random() < self.http_503_rate:
+                return 503
+            if self.busy_rate and self._random.random() < self.busy_rate:
+                return 'busy'
+        return None
+
+    def item_error (self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+class ServerStats(object):
+    def __init__ (self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.operations = {}
+        self.throttled = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record (self, op, bytes_in, bytes_out, throttled=False):
+        with self._lock:
+            self.requests += 1
+            self.operations[op] = self.operations.get(op, 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            if throttled:
+                self.throttled += 1
+
+    def __str__ (self):
+        ops = ', '.join('%s: %d' % (k, v) for k, v in
+                        sorted(self.operations.items()))
+        return ('Requests: %d (%s); Throttled: %d; In: %d bytes; Out: %d bytes'
+                % (self.requests, ops, self.throttled, self.bytes_in,
+                   self.bytes_out))
+
+class EWSError(Exception):
+    """Raised by operation handlers to fail a single response message."""
+
+    def __init__ (self, code, text=None):
+        Exception.__init__(self, code)
+        self.code = code
+        self.text = text if text is not None else code
+
+##
+## Building responses
+##
+
+ENVELOPE_START = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<s:Envelope xmlns:s="%s">'
+    '<s:Header><h:ServerVersionInfo MajorVersion="15" MinorVersion="1"'
+    ' MajorBuildNumber="0" MinorBuildNumber="0" Version="V2017_07_11"'
+    ' xmlns:h="%s"/></s:Header>'
+    '<s:Body>' % (S_NAMESPACE, T_NAMESPACE))
+ENVELOPE_END = '</s:Body></s:Envelope>'
+
+def response_xml (op, messages):
+    return ''.join([ENVELOPE_START,
+                    '<m:%sResponse xmlns:m="%s" xmlns:t="%s">' % (
+                        op, M_NAMESPACE, T_NAMESPACE),
+                    '<m:ResponseMessages>'] + messages +
+                   ['</m:ResponseMessages></m:%sResponse>' % op,
+                    ENVELOPE_END])
+
+def success_xml (op, content=''):
+    return ('<m:%sResponseMessage ResponseClass="Success">'
+            '<m:ResponseCode>NoError</m:ResponseCode>%s'
+            '</m:%sResponseMessage>' % (op, content, op))
+
+def error_xml (op, code, text, backoff_ms=None):
+    mxml = ''
+    if backoff_ms is not None:
+        mxml = ('<m:MessageXml><t:Value Name="BackOffMilliseconds">%d'
+                '</t:Value></m:MessageXml>' % backoff_ms)
+
+    return ('<m:%sResponseMessage ResponseClass="Error">'
+            '<m:MessageText>%s</m:MessageText>'
+            '<m:ResponseCode>%s</m:ResponseCode>'
+            '<m:DescriptiveLinkKey>0</m:DescriptiveLinkKey>%s'
+            '</m:%sResponseMessage>' % (op, escape(text), code, mxml, op))
+
+def fault_xml (code, text, backoff_ms=None):
+    mxml = ''
+    if backoff_ms is not None:
+        mxml = ('<t:MessageXml xmlns:t="%s"><t:Value Name="BackOffMilliseconds">'
+                '%d</t:Value></t:MessageXml>' % (T_NAMESPACE, backoff_ms))
+
+    return ''.join([ENVELOPE_START,
+                    '<s:Fault>'
+                    '<faultcode xmlns:a="%s">a:%s</faultcode>' % (E_NAMESPACE,
+                                                                 code),
+                    '<faultstring xml:lang="en-US">%s</faultstring>' % (
+                        escape(text)),
+                    '<detail>'
+                    '<e:ResponseCode xmlns:e="%s">%s</e:ResponseCode>' % (
+                        E_NAMESPACE, code),
+                    '<e:Message xmlns:e="%s">%s</e:Message>' % (E_NAMESPACE,
+                                                               escape(text)),
+                    mxml,
+                    '</detail></s:Fault>',
+                    ENVELOPE_END])
+
+def folder_xml (f, tag=None):
+    if tag is None:
+        tag = 'ContactsFolder' if f.folder_class == 'IPF.Contact' else 'Folder'
+
+    parent = ''
+    if f.parent is not None:
+        parent = '<t:ParentFolderId Id="%s" ChangeKey="%s"/>' % (
+            f.parent.id, f.parent.change_key)
+
+    fclass = ''
+    if f.folder_class is not None:
+        fclass = '<t:FolderClass>%s</t:FolderClass>' % f.folder_class
+
+    return ('<t:%s><t:FolderId Id="%s" ChangeKey="%s"/>%s%s'
+            '<t:DisplayName>%s</t:DisplayName>'
+            '<t:TotalCount>%d</t:TotalCount>'
+            '<t:ChildFolderCount>%d</t:ChildFolderCount>'
+            '</t:%s>' % (tag, f.id, f.change_key, parent, fclass,
+                         escape(f.name), len(f.items), len(f.children), tag))
+
+class ItemShape(object):
+    """
+    The properties to be returned for each item: the base shape along with
+    any additional FieldURIs and extended properties asked for.
+    """
+
+    def __init__ (self, node=None, base='AllProperties'):
+        self.base = base
+        self.fields = set()
+        self.eprops = []
+
+        if node is None:
+            return
+
+        b = node.find(QName_T('BaseShape'))
+        if b is not None:
+            self.base = b.text
+
+        add = node.find(QName_T('AdditionalProperties'))
+        if add is None:
+            return
+
+        for prop in add:
+            tag = unQName(prop.tag)
+            if tag == 'FieldURI':
+                self.fields.add(prop.attrib['FieldURI'].split(':')[-1])
+            elif tag == 'ExtendedFieldURI':
+                ptag = prop.attrib.get('PropertyTag')
+                if ptag is not None:
+                    self.eprops.append((int(ptag, 16),
+                                        prop.attrib.get('PropertyType')))
+
+    def all (self):
+        return self.base != 'IdOnly'
+
+def eprop_value (item, ptag, ptype):
+    if ptag == PR_LAST_MODIFICATION_TIME:
+        return timestamp(item.modified)
+    return item.eprops.get((ptag, ptype))
+
+def contact_xml (item, shape):
+    out = ['<t:Contact><t:ItemId Id="%s" ChangeKey="%s"/>' % (item.id,
+                                                             item.change_key)]
+
+    if shape.all():
+        out.append('<t:ParentFolderId Id="%s" ChangeKey="%s"/>'
+                   '<t:ItemClass>IPM.Contact</t:ItemClass>'
+                   '<t:DateTimeCreated>%s</t:DateTimeCreated>' % (
+                       item.folder.id, item.folder.change_key,
+                       timestamp(item.created)))
+
+    for ptag, ptype in shape.eprops:
+        v = eprop_value(item, ptag, ptype)
+        if v is not None:
+            out.append('<t:ExtendedProperty><t:ExtendedFieldURI '
+                       'PropertyTag="0x%x" PropertyType="%s"/>'
+                       '<t:Value>%s</t:Value></t:ExtendedProperty>' % (
+                           ptag, ptype, escape(v)))
+
+    fields = item.fields
+    tags = [t for t in fields if shape.all() or t in shape.fields]
+    tags.sort(key=lambda t: CONTACT_FIELD_RANK.get(t, len(CONTACT_FIELD_RANK)))
+
+    for tag in tags:
+        v = fields[tag]
+        if tag in ENTRY_FIELDS:
+            out.append('<t:%s>' % tag)
+            for key, val in v.iteritems():
+                out.append('<t:Entry Key="%s">%s</t:Entry>' % (key,
+                                                              escape(val)))
+            out.append('</t:%s>' % tag)
+        elif tag == 'Body':
+            out.append('<t:Body BodyType="Text">%s</t:Body>' % escape(v))
+        else:
+            out.append('<t:%s>%s</t:%s>' % (tag, escape(v), tag))
+
+    if shape.all() and ('GivenName' in fields or 'Surname' in fields):
+        given = fields.get('GivenName', '')
+        surname = fields.get('Surname', '')
+        out.append('<t:CompleteName><t:FirstName>%s</t:FirstName>'
+                   '<t:LastName>%s</t:LastName>'
+                   '<t:FullName>%s</t:FullName></t:CompleteName>' % (
+                       escape(given), escape(surname),
+                       escape(('%s %s' % (given, surname)).strip())))
+
+    out.append('</t:Contact>')
+    return ''.join(out)
+
+##
+## Parsing requests
+##
+
+def parse_contact_fields (node, fields, eprops):
+    """
+    Merge the properties in the given t:Contact element into the fields and
+    eprops dictionaries of a contact.
+    """
+
+    for child in node:
+        tag = unQName(child.tag)
+        if tag in ('ItemId', 'ParentFolderId', 'ItemClass', 'CompleteName'):
+            continue
+        elif tag == 'ExtendedProperty':
+            uri = child.find(QName_T('ExtendedFieldURI'))
+            val = child.find(QName_T('Value'))
+            ptag = uri.attrib.get('PropertyTag') if uri is not None else None
+            if ptag is None or val is None:
+                continue
+            key = (int(ptag, 16), uri.attrib.get('PropertyType'))
+            if key[0] != PR_LAST_MODIFICATION_TIME:
+                eprops[key] = val.text
+        elif tag in ENTRY_FIELDS:
+            entries = fields.setdefault(tag, OrderedDict())
+            for entry in child:
+                entries[entry.attrib['Key']] = entry.text or ''
+        elif child.text is not None:
+            fields[tag] = child.text
+
+def delete_contact_field (node, fields, eprops):
+    """Apply the DeleteItemField element node."""
+
+    for uri in node:
+        tag = unQName(uri.tag)
+        if tag == 'FieldURI':
+            fields.pop(uri.attrib['FieldURI'].split(':')[-1], None)
+        elif tag == 'IndexedFieldURI':
+            name = INDEXED_FIELDS.get(uri.attrib['FieldURI'].split(':')[-1])
+            fields.get(name, {}).pop(uri.attrib['FieldIndex'], None)
+        elif tag == 'ExtendedFieldURI':
+            ptag = uri.attrib.get('PropertyTag')
+            if ptag is not None:
+                eprops.pop((int(ptag, 16), uri.attrib.get('PropertyType')),
+                           None)
+
+def folder_ids (node):
+    """
+    Return a list of (id, distinguished_name) tuples for the FolderId and
+    DistinguishedFolderId children of node.
+    """
+
+    ret = []
+    if node is None:
+        return ret
+
+    for child in node:
+        tag = unQName(child.tag)
+        if tag == 'FolderId':
+            ret.append((child.attrib['Id'], None))
+        elif tag == 'DistinguishedFolderId':
+            ret.append((None, child.attrib['Id']))
+
+    return ret
+
+def item_ids (node):
+    if node is None:
+        return []
+    return [(x.attrib['Id'], x.attrib.get('ChangeKey'))
+            for x in node.iter(QName_T('ItemId'))]
+
+##
+## The server
+##
+
+class MockEWSHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST (self):
+        srv = self.server
+
+        n = int(self.headers.get('Content-Length', 0))
+        data = self.rfile.read(n)
+        bytes_in = len(data)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+        if self.path != EWS_PATH:
+            self._reply(404, 'Not Found', ctype='text/plain')
+            return
+
+        time.sleep(srv.faults.delay())
+
+        try:
+            root = ET.fromstring(data)
+            body = root.find(QName_S('Body'))
+            op_node = body[0]
+            op = unQName(op_node.tag)
+        except Exception as e:
+            self._reply(500, fault_xml('ErrorInvalidRequest',
+                                       'Could not parse request: %s' % e))
+            srv.stats.record('Invalid', bytes_in, 0)
+            return
+
+        throttle = srv.faults.throttle()
+        if throttle == 503:
+            self._reply(503, '', ctype='text/plain',
+                        headers={'Retry-After' : '1'})
+            srv.stats.record(op, bytes_in, 0, throttled=True)
+            return
+        elif throttle == 'busy':
+            resp = fault_xml('ErrorServerBusy',
+                             'The server cannot service this request right '
+                             'now. Try again later.',
+                             backoff_ms=srv.faults.backoff_ms)
+            sent = self._reply(500, resp)
+            srv.stats.record(op, bytes_in, sent, throttled=True)
+            return
+
+        handler = getattr(srv, 'op_%s' % op, None)
+        if handler is None:
+            sent = self._reply(500, fault_xml('ErrorInvalidRequest',
+                                              'Operation %s is not supported '
+                                              'by the mock server' % op))
+        else:
+            try:
+                with srv.mailbox.lock:
+                    resp = response_xml(op, handler(op_node))
+                sent = self._reply(200, resp)
+            except Exception as e:
+                logging.exception('MockEWSServer: %s failed', op)
+                sent = self._reply(500, fault_xml('ErrorInternalServerError',
+                                                  str(e)))
+
+        srv.stats.record(op, bytes_in, sent)
+
+    def _reply (self, code, body, ctype='text/xml; charset=utf-8',
+                headers={}):
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+
+        accept = self.headers.get('Accept-Encoding', '')
+        enc = None
+        if self.server.compress and body and 'gzip' in accept:
+            c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = c.compress(body) + c.flush()
+            enc = 'gzip'
+
+        self.send_response(code)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        if enc is not None:
+            self.send_header('Content-Encoding', enc)
+        for k, v in headers.iteritems():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+        return len(body)
+
+    def log_message (self, fmt, *args):
+        logging.debug('MockEWSServer: ' + fmt, *args)
+
+class MockEWSServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A multi threaded HTTP server answering EWS requests from a Mailbox.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__ (self, mailbox=None, host='127.0.0.1', port=0, faults=None,
+                  compress=True):
+        """
+        port 0 picks a free port; the url attribute has the endpoint to
+        point an ExchangeService at. If compress is True responses are
+        gzipped for clients that accept it.
+        """
+
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), MockEWSHandler)
+
+        self.mailbox = mailbox if mailbox is not None else Mailbox()
+        self.faults = faults if faults is not None else Faults()
+        self.compress = compress
+        self.stats = ServerStats()
+        self.find_count_limit = FIND_COUNT_LIMIT
+        self.sync_max_changes = SYNC_MAX_CHANGES
+
+        self._thread = None
+
+    @property
+    def url (self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d%s' % (host, port, EWS_PATH)
+
+    def start (self):
+        """Serve requests from a background thread."""
+
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop (self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    ##
+    ## Operation handlers. Each gets the operation element of the request,
+    ## and returns the list of response messages.
+    ##
+
+    def op_GetFolder (self, node):
+        ret = []
+        for fid, dname in folder_ids(node.find(QName_M('FolderIds'))):
+            f = self.mailbox.get_folder(fid, dname)
+            if f is None:
+                ret.append(error_xml('GetFolder', 'ErrorFolderNotFound',
+                                     'The specified folder could not be '
+                                     'found in the store.'))
+            else:
+                ret.append(success_xml('GetFolder', '<m:Folders>%s</m:Folders>'
+                                       % folder_xml(f, 'Folder')))
+        return ret
+
+    def op_FindFolder (self, node):
+        deep = node.attrib.get('Traversal') == 'Deep'
+
+        ret = []
+        for fid, dname in folder_ids(node.find(QName_M('ParentFolderIds'))):
+            f = self.mailbox.get_folder(fid, dname)
+            if f is None:
+                ret.append(error_xml('FindFolder', 'ErrorFolderNotFound',
+                                     'The specified folder could not be '
+                                     'found in the store.'))
+                continue
+
+            folders = f.descendants() if deep else f.children
+            ret.append(success_xml('FindFolder',
+                '<m:RootFolder TotalItemsInView="%d" '
+                'IncludesLastItemInRange="true"><t:Folders>%s</t:Folders>'
+                '</m:RootFolder>' % (len(folders),
+                                     ''.join(folder_xml(x) for x in folders))))
+        return ret
+
+    def op_FindItem (self, node):
+        shape = ItemShape(node.find(QName_M('ItemShape')))
+
+        view = node.find(QName_M('IndexedPageItemView'))
+        offset = 0
+        limit = self.find_count_limit
+        from_end = False
+        if view is not None:
+            offset = int(view.attrib.get('Offset', 0))
+            if 'MaxEntriesReturned' in view.attrib:
+                limit = min(limit, int(view.attrib['MaxEntriesReturned']))
+            from_end = view.attrib.get('BasePoint') == 'End'
+
+        newer_than = self._lmt_restriction(node.find(QName_M('Restriction')))
+
+        ret = []
+        for fid, dname in folder_ids(node.find(QName_M('ParentFolderIds'))):
+            f = self.mailbox.get_folder(fid, dname)
+            if f is None:
+                ret.append(error_xml('FindItem', 'ErrorFolderNotFound',
+                                     'The specified folder could not be '
+                                     'found in the store.'))
+                continue
+
+            items = f.items.values()
+            if newer_than is not None:
+                items = [x for x in items if timestamp(x.modified) > newer_than]
+
+            total = len(items)
+            if from_end:
+                start = max(total - offset - limit, 0)
+                page = items[start:total - offset]
+            else:
+                start = offset
+                page = items[offset:offset + limit]
+            last = (start + len(page) >= total) if not from_end else start == 0
+
+            ret.append(success_xml('FindItem',
+                '<m:RootFolder IndexedPagingOffset="%d" TotalItemsInView="%d" '
+                'IncludesLastItemInRange="%s"><t:Items>%s</t:Items>'
+                '</m:RootFolder>' % (start + len(page), total,
+                                     'true' if last else 'false',
+                                     ''.join(contact_xml(x, shape)
+                                             for x in page))))
+        return ret
+
+    def op_GetItem (self, node):
+        shape = ItemShape(node.find(QName_M('ItemShape')))
+
+        ret = []
+        for iid, ck in item_ids(node.find(QName_M('ItemIds'))):
+            item = self.mailbox.get_contact(iid)
+            if item is None:
+                ret.append(error_xml('GetItem', 'ErrorItemNotFound',
+                                     'The specified object was not found in '
+                                     'the store.'))
+            elif self.faults.item_error():
+                ret.append(self._transient_error('GetItem'))
+            else:
+                ret.append(success_xml('GetItem', '<m:Items>%s</m:Items>'
+                                       % contact_xml(item, shape)))
+        return ret
+
+    def op_CreateItem (self, node):
+        fids = folder_ids(node.find(QName_M('SavedItemFolderId')))
+        folder = None
+        if fids:
+            folder = self.mailbox.get_folder(*fids[0])
+        else:
+            folder = self.mailbox.get_folder(distinguished='contacts')
+
+        items = node.find(QName_M('Items'))
+        items = list(items) if items is not None else []
+
+        ret = []
+        for child in items:
+            if folder is None:
+                ret.append(error_xml('CreateItem', 'ErrorFolderNotFound',
+                                     'The specified folder could not be '
+                                     'found in the store.'))
+            elif unQName(child.tag) != 'Contact':
+                ret.append(error_xml('CreateItem', 'ErrorInvalidRequest',
+                                     'The mock server only supports '
+                                     'contacts.'))
+            elif self.faults.item_error():
+                ret.append(self._transient_error('CreateItem'))
+            else:
+                fields = OrderedDict()
+                eprops = {}
+                parse_contact_fields(child, fields, eprops)
+                item = self.mailbox.create_contact(folder, fields, eprops)
+                ret.append(success_xml('CreateItem', '<m:Items>%s</m:Items>'
+                                       % contact_xml(item,
+                                                     ItemShape(base='IdOnly'))))
+        return ret
+
+    def op_UpdateItem (self, node):
+        resolution = node.attrib.get('ConflictResolution', 'AutoResolve')
+        changes = node.find(QName_M('ItemChanges'))
+        changes = list(changes) if changes is not None else []
+
+        ret = []
+        for change in changes:
+            try:
+                item = self._update_item(change, resolution)
+            except EWSError as e:
+                ret.append(error_xml('UpdateItem', e.code, e.text))
+                continue
+
+            ret.append(success_xml('UpdateItem',
+                '<m:Items>%s</m:Items><m:ConflictResults><t:Count>0</t:Count>'
+                '</m:ConflictResults>' % contact_xml(item,
+                                                     ItemShape(base='IdOnly'))))
+        return ret
+
+    def op_DeleteItem (self, node):
+        delete_type = node.attrib.get('DeleteType', 'HardDelete')
+        move_to = None
+        if delete_type == 'MoveToDeletedItems':
+            move_to = self.mailbox.get_folder(distinguished='deleteditems')
+
+        ret = []
+        for iid, ck in item_ids(node.find(QName_M('ItemIds'))):
+            item = self.mailbox.get_contact(iid)
+            if item is None:
+                ret.append(error_xml('DeleteItem', 'ErrorItemNotFound',
+                                     'The specified object was not found in '
+                                     'the store.'))
+            elif self.faults.item_error():
+                ret.append(self._transient_error('DeleteItem'))
+            elif item.folder is move_to:
+                ret.append(success_xml('DeleteItem'))
+            else:
+                self.mailbox.delete_contact(item, move_to)
+                ret.append(success_xml('DeleteItem'))
+        return ret
+
+    def op_SyncFolderItems (self, node):
+        op = 'SyncFolderItems'
+        shape = ItemShape(node.find(QName_M('ItemShape')), base='IdOnly')
+
+        fids = folder_ids(node.find(QName_M('SyncFolderId')))
+        f = self.mailbox.get_folder(*fids[0]) if fids else None
+        if f is None:
+            return [error_xml(op, 'ErrorFolderNotFound', 'The specified '
+                              'folder could not be found in the store.')]
+
+        state = node.find(QName_M('SyncState'))
+        since = self.mailbox.parse_sync_state(f, state.text if state
+                                              is not None else None)
+        if since is None:
+            return [error_xml(op, 'ErrorInvalidSyncStateData', 'Synchronization'
+                              ' state data is corrupt or otherwise invalid.')]
+
+        max_changes = node.find(QName_M('MaxChangesReturned'))
+        max_changes = (int(max_changes.text) if max_changes is not None
+                       else self.sync_max_changes)
+        max_changes = min(max_changes, self.sync_max_changes)
+
+        changes = f.changes_since(since)
+        last = len(changes) <= max_changes
+        changes = changes[:max_changes]
+        seq = changes[-1][0] if not last else max(self.mailbox.seq, since)
+
+        out = []
+        for cseq, kind, x in changes:
+            if kind == 'Delete':
+                out.append('<t:Delete><t:ItemId Id="%s"/></t:Delete>' % x)
+            else:
+                out.append('<t:%s>%s</t:%s>' % (kind, contact_xml(x, shape),
+                                                kind))
+
+        return [success_xml(op, '<m:SyncState>%s</m:SyncState>'
+                            '<m:IncludesLastItemInRange>%s'
+                            '</m:IncludesLastItemInRange>'
+                            '<m:Changes>%s</m:Changes>' % (
+                                self.mailbox.sync_state(f, seq),
+                                'true' if last else 'false', ''.join(out)))]
+
+    ##
+    ## Internal methods
+    ##
+
+    def _transient_error (self, op):
+        return error_xml(op, 'ErrorInternalServerTransientError',
+                         'An internal server error occurred. Try again '
+                         'later.')
+
+    def _lmt_restriction (self, node):
+        """
+        Return the timestamp of a 'last modified time greater than'
+        restriction, which is the only kind pyews uses.
+        """
+
+        if node is None:
+            return None
+
+        for cond in node:
+            if unQName(cond.tag) not in ('IsGreaterThan',
+                                         'IsGreaterThanOrEqualTo'):
+                continue
+            const = cond.find('.//' + QName_T('Constant'))
+            if const is not None:
+                return const.attrib.get('Value')
+
+        return None
+
+    def _update_item (self, change, resolution):
+        iid, ck = item_ids(change)[0]
+        item = self.mailbox.get_contact(iid)
+        if item is None:
+            raise EWSError('ErrorItemNotFound',
+                           'The specified object was not found in the store.')
+
+        if (ck is not None and ck != item.change_key and
+            resolution == 'NeverOverwrite'):
+            raise EWSError('ErrorIrresolvableConflict',
+                           'The send or update operation could not be '
+                           'performed because the change key passed in the '
+                           'request does not match the current change key '
+                           'for the item.')
+
+        if self.faults.item_error():
+            raise EWSError('ErrorInternalServerTransientError',
+                           'An internal server error occurred. Try again '
+                           'later.')
+
+        item.materialize()
+        updates = change.find(QName_T('Updates'))
+        for upd in (updates if updates is not None else []):
+            tag = unQName(upd.tag)
+            if tag in ('SetItemField', 'AppendToItemField'):
+                contact = upd.find(QName_T('Contact'))
+                if contact is not None:
+                    parse_contact_fields(contact, item._fields, item._eprops)
+            elif tag == 'DeleteItemField':
+                delete_contact_field(upd, item._fields, item._eprops)
+
+        self.mailbox.touch(item)
+        return item
+
+def main (argv=None):
+    parser = argparse.ArgumentParser(description='Mock EWS server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--contacts', type=int, default=1000,
+                        help='Number of contacts per folder')
+    parser.add_argument('--folders', type=int, default=1,
+                        help='Number of contacts folders')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--busy-rate', type=float, default=0.0)
+    parser.add_argument('--backoff-ms', type=int, default=100)
+    parser.add_argument('--http-503-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    faults = Faults(latency=args.latency, jitter=args.jitter,
+                    busy_rate=args.busy_rate, backoff_ms=args.backoff_ms,
+                    http_503_rate=args.http_503_rate,
+                    error_rate=args.error_rate, seed=args.seed)
+    mb = Mailbox.synthetic(contacts=args.contacts, folders=args.folders)
+    srv = MockEWSServer(mb, host=args.host, port=args.port, faults=faults)
+
+    logging.info('Serving %d contacts in %d folder(s) at %s', args.contacts,
+                 args.folders, srv.url)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging.info('%s', srv.stats)
+        srv.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -24,13 +24,23 @@ import utils
 from   utils            import pretty_xml
 from   ews.autodiscover import EWSAutoDiscover, ExchangeAutoDiscoverError
 from   ews.data         import DistinguishedFolderId, WellKnownFolderName
-from   ews.data         import FolderClass
+from   ews.data         import FolderClass, DeleteType
 from   ews.errors       import EWSMessageError, EWSCreateFolderError
-from   ews.errors       import EWSDeleteFolderError
+from   ews.errors       import EWSDeleteFolderError, EWSResponseError
 from   ews.folder       import Folder
+from   ews.retry        import RetryPolicy, RetryStats
+from   ews.executor     import RequestExecutor
+from   ews.batching     import BatchSizer, OP_FIND_ITEM, OP_GET_ITEM
+from   ews.batching     import OP_SYNC_FOLDER, OP_CREATE_ITEM, OP_UPDATE_ITEM
+from   ews.batching     import OP_DELETE_ITEM
+from   ews.batching     import DEFAULT_BATCH_SIZE, MAX_REQUEST_BYTES
+from   ews.envelope     import item_xml
+from   ews.errors       import EWSNoResponseError
 from   ews.contact      import Contact
+from   ews.columns      import ItemColumns
 
-from ews.request_response import GetItemsRequest, GetItemsResponse
+from ews.request_response import GetItemsRequest, GetItemsResponse, ItemList
+from ews.request_response import ItemOutcome, BulkOutcome
 from ews.request_response import FindItemsRequest, FindItemsResponse
 from ews.request_response import CreateItemsRequest, CreateItemsResponse
 from ews.request_response import DeleteItemsRequest, DeleteItemsResponse
@@ -38,13 +48,18 @@ from ews.request_response import FindItemsLMTRequest, FindItemsLMTResponse
 from ews.request_response import UpdateItemsRequest, UpdateItemsResponse
 from ews.request_response import SyncFolderItemsRequest, SyncFolderItemsResponse
 
-from   tornado import template
-from   soap import SoapClient, SoapMessageError, QName_T
+from   tornado import gen, template
+from   soap import SoapClient, AsyncSoapClient, SoapMessageError, QName_T
+from   soap import SoapConnectionError, SoapHTTPError
+from   soap import TransferStats
 
 USER = u''
 PWD  = u''
 EWS_URL = u''
 
+## The response code for an update with a stale ChangeKey
+ERROR_CONFLICT = 'ErrorIrresolvableConflict'
+
 ##
 ## Note: There is a feeeble attemp to mimick the names of classes and methods
 ## used in the EWS Managed Services API. However the similiarities are merely
@@ -66,6 +81,36 @@ class ExchangeService(object):
         self.root_folder = None
         self.loader = template.Loader(utils.REQUESTS_DIR)
 
+        ## Requests are normally built directly by ews.envelope. Set this to
+        ## True to render them from the templates instead.
+        self.use_templates = False
+
+        ## Governs the resending of throttled requests. Set to None to turn
+        ## off retries altogether.
+        self.retry_policy = RetryPolicy()
+
+        ## Used by bulk operations to send independent requests concurrently.
+        ## Replace with a RequestExecutor with a different max_workers to
+        ## change the concurrency.
+        self.executor = RequestExecutor()
+
+        ## The number of FindItem pages FindItems() and FindItemsLMT() may
+        ## have in flight at the same time. With 1 the pages are fetched one
+        ## after the other.
+        self.page_prefetch = 1
+
+        ## Chooses the number of items in each FindItem page, GetItem chunk,
+        ## SyncFolderItems call, etc., and adapts it to how the server copes.
+        ## See batch_size(). Set to None for fixed batches of 100.
+        self.batch_sizer = BatchSizer()
+
+        ## Set to True to have the items returned by FindItems(), GetItems()
+        ## and sync_folder_items() decode their fields only as they are first
+        ## looked up, for jobs that read just a few fields of each item. See
+        ## Item.__init__(). Items of streamed responses are always decoded
+        ## in full, as their elements are not kept.
+        self.lazy_items = False
+
     ##
     ## First the methods that are similar to the EWS Managed API. The names might
     ## be similar but please note that there is no effort made to really be a
@@ -120,7 +165,8 @@ class ExchangeService(object):
 
         return resp
 
-    def FindItems (self, folder, eprops_xml=[], ids_only=False):
+    def FindItems (self, folder, eprops_xml=[], ids_only=False,
+                   prefetch=None, pipeline=False):
         """
         Fetch all the items in the given folder.  folder is an object of type
         ews.folder.Folder. This method will first find all the ItemIds of
@@ -131,29 +177,33 @@ class ExchangeService(object):
         eprops_xml is an array of xml representation for additional extended
         properites that need to be fetched
 
+        prefetch is the number of pages of ItemIds to fetch concurrently. It
+        defaults to the page_prefetch of the service.
+
+        If pipeline is True the items of each page of ItemIds are fetched
+        while the next page of ItemIds is being looked up, instead of after
+        all of the ItemIds are in. prefetch does not apply then.
         """
 
         logging.info('pimdb_ex:FindItems() - fetching items in folder %s...',
                      folder.DisplayName)
 
-        i = 0
-        ret = []
-        while True:
-            req = FindItemsRequest(self, batch_size=self.batch_size(),
-                                   offset=i, folder_id=folder.Id)
-            resp = req.execute()
-            shells = resp.items
-            if shells is not None and len(shells) > 0:
-                ret += shells
+        if pipeline and not ids_only:
+            ret = ItemList()
+            for page in self._iter_pages(folder, eprops_xml):
+                ret.extend(page)
+                ret.errors.update(page.errors)
+                ret.warnings.update(page.warnings)
 
-            if resp.includes_last:
-                break
+            logging.info('pimdb_ex:FindItems() - fetching items in folder '
+                         '%s...done', folder.DisplayName)
+            return ret
 
-            i += self.batch_size()
-            ## just a safety net to avoid inifinite loops
-            if i >= folder.TotalCount:
-                logging.warning('pimdb_ex.FindItems(): Breaking strange loop')
-                break
+        def new_req (offset, count):
+            return FindItemsRequest(self, batch_size=count, offset=offset,
+                                    folder_id=folder.Id)
+
+        ret = self._find_item_shells(folder, new_req, prefetch)
 
         logging.info('pimdb_ex:FindItems() - fetching items in folder %s...done',
                      folder.DisplayName)
@@ -164,7 +214,7 @@ class ExchangeService(object):
         else:
             return ret
 
-    def FindItemsLMT (self, folder, lmt):
+    def FindItemsLMT (self, folder, lmt, prefetch=None):
         """
         Fetch all the items in the given folder that were last modified at or
         after the provided timestamp (lmt). We return an array of Item objects
@@ -175,82 +225,216 @@ class ExchangeService(object):
         - DisplayName (if it is a contact)
         - Last Modified time
 
+        prefetch is as for FindItems().
         """
 
         logging.info('pimdb_ex:FindItemsLMT() - fetching items in folder %s...',
                      folder.DisplayName)
 
-        i = 0
-        ret = []
-        while True:
-            req = FindItemsLMTRequest(self, batch_size=self.batch_size(),
-                                      offset=i, folder_id=folder.Id, lmt=lmt)
-            resp = req.execute()
-            shells = resp.items
-            if shells is not None and len(shells) > 0:
-                ret += shells
-
-            if resp.includes_last:
-                break
+        def new_req (offset, count):
+            return FindItemsLMTRequest(self, batch_size=count, offset=offset,
+                                       folder_id=folder.Id, lmt=lmt)
 
-            i += self.batch_size()
-            ## just a safety net to avoid inifinite loops
-            if i >= folder.TotalCount:
-                logging.warning('pimdb_ex.FindItemsLMT(): Breaking strange loop')
-                break
+        ret = self._find_item_shells(folder, new_req, prefetch)
 
         logging.info('pimdb_ex:FindItemsLMT() - fetching items in folder %s...done',
                      folder.DisplayName)
 
         return ret
 
-    def GetItems (self, itemids, eprops_xml=[]):
+    def iter_items (self, folder, eprops_xml=[], batch_size=None,
+                    pipeline=True):
+        """
+        A generator over the items in the given folder, each of them fully
+        populated as by FindItems(). Unlike FindItems() the items are fetched
+        a page at a time, as they are consumed. So only one page of items
+        needs to be held in memory at a time, and nothing beyond the next
+        page is fetched if the caller stops early.
+
+        batch_size is the number of items in a page, and defaults to the
+        batch_size() of the service. If pipeline is True the ids of the next
+        page are looked up while the items of the current page are being
+        fetched.
         """
-        itemids is an array of itemids, and we will fetch that stuff and
-        return an array of Item objects.
 
-        FIXME: Need to make this work in batches to ensure data is not too
-        much.
+        for page in self._iter_pages(folder, eprops_xml, batch_size,
+                                     pipeline):
+            for item in page:
+                yield item
+
+    def GetItems (self, itemids, eprops_xml=[], chunk_size=None,
+                  ids_only=False):
+        """
+        itemids is an array of itemids, and we will fetch that stuff and
+        return an array of Item objects. If ids_only is True only the ItemId
+        and ChangeKey of each item are fetched.
+
+        The ids are split into chunks of chunk_size - by default the GetItem
+        batch_size() of the service - and the chunks are fetched
+        concurrently. The returned ItemList has the items in the order of
+        itemids. Items that could not be fetched are left out, and what went
+        wrong with each of them is in the errors of the ItemList. Items the
+        server sent back with a warning are in it, and the warnings in its
+        warnings.
         """
 
         logging.info('pimdb_ex:GetItems() - fetching items....')
-        req = GetItemsRequest(self, itemids=itemids,
-                              custom_eprops_xml=eprops_xml)
-        resp = req.execute()
+
+        chunks = self._get_items_chunks(itemids, chunk_size)
+
+        def fetch (chunk):
+            req = GetItemsRequest(self, itemids=chunk, ids_only=ids_only,
+                                  custom_eprops_xml=eprops_xml)
+            return req.execute()
+
+        res = self.executor.map(fetch, chunks)
+        outcomes = [res.errors.get(i, resp) for i, resp in enumerate(res)]
+        ret = self._merge_get_items(chunks, outcomes)
+
         logging.info('pimdb_ex:GetItems() - fetching items...done')
 
-        return resp.items
+        return ret
 
-    def CreateItems (self, folder_id, items):
-        """Create items in the exchange store."""
+    def GetItemColumns (self, itemids, columns=None, eprops_xml=[],
+                        chunk_size=None):
+        """
+        Fetch the items with the given ids as GetItems() does, but return
+        them as an ews.columns.ItemColumns table with the given columns -
+        all of ews.columns.COLUMNS by default - instead of as item objects.
+        Only the requested columns are decoded, and the extended properties
+        they need are asked for.
+        """
 
-        logging.info('pimdb_ex:CreateItems() - creating items....')
-        req = CreateItemsRequest(self, folder_id=folder_id, items=items)
-        resp = req.execute()
+        chunks = self._get_items_chunks(itemids, chunk_size)
+        reqs = self._item_columns_reqs(chunks, columns, eprops_xml)
+
+        res = self.executor.map(lambda req: req.execute(), reqs)
+        outcomes = [res.errors.get(i, resp) for i, resp in enumerate(res)]
+        return self._merge_item_columns(columns, chunks, reqs, outcomes)
+
+    def FindItemColumns (self, folder, columns=None, eprops_xml=[],
+                         prefetch=None):
+        """
+        Fetch all the items in the given folder as an ews.columns.ItemColumns
+        table. See FindItems() and GetItemColumns().
+        """
+
+        def new_req (offset, count):
+            req = FindItemsRequest(self, batch_size=count, offset=offset,
+                                   folder_id=folder.Id)
+            ## Only the ItemIds are looked at
+            req.lazy_items = True
+            return req
+
+        shells = self._find_item_shells(folder, new_req, prefetch)
+        return self.GetItemColumns([x.itemid.value for x in shells], columns,
+                                   eprops_xml)
+
+    def CreateItems (self, folder_id, items, chunk_size=None,
+                     max_bytes=MAX_REQUEST_BYTES):
+        """
+        Create items in the exchange store, in the folder with the given id.
+
+        The items are split into chunks of at most chunk_size items - by
+        default the CreateItem batch_size() of the service - and at most
+        max_bytes of XML, and the chunks are sent concurrently. The ItemId
+        and ChangeKey of each item that is created are set on it.
+
+        Returns a BulkOutcome with the outcome of each item, in order. The
+        failed_items() of that can be handed back to CreateItems() to try
+        them again. Note that items of a chunk that failed in transit may
+        have been created by the server all the same.
+        """
+
+        logging.info('pimdb_ex:CreateItems() - creating %d items....',
+                     len(items))
 
-        logging.info('pimdb_ex:CreateItems() - creating items....done')
+        xmls = [item_xml(x) for x in items]
+        chunks = self._create_items_chunks(xmls, chunk_size, max_bytes)
 
-    def DeleteItems (self, itemids):
-        """Delete items in the exchange store."""
+        def create (chunk):
+            req = CreateItemsRequest(self, folder_id=folder_id,
+                                     items=[items[i] for i in chunk],
+                                     items_xml=[xmls[i] for i in chunk])
+            return req.execute()
 
-        logging.info('pimdb_ex:DeleteItems() - deleting items....')
-        req = DeleteItemsRequest(self, itemids=itemids)
-        logging.info('pimdb_ex:DeleteItems() - deleting items....done')
+        res = self.executor.map(create, chunks)
+        outcomes = [res.errors.get(i, resp) for i, resp in enumerate(res)]
+        ret = self._merge_outcomes(items, chunks, outcomes)
 
-        return req.execute()
+        logging.info('pimdb_ex:CreateItems() - creating items....done '
+                     '(%d failed)', len(ret.failed()))
 
-    def UpdateItems (self, items):
+        return ret
+
+    def DeleteItems (self, itemids, delete_type=DeleteType.MoveToDeletedItems,
+                     chunk_size=None):
         """
-        Fetch updates from the specified folder_id.  items in the exchange store.
+        Delete items in the exchange store. delete_type is one of the
+        values in ews.data.DeleteType.
+
+        The ids are split into chunks of chunk_size - by default the
+        DeleteItem batch_size() of the service - and the chunks are sent
+        concurrently. Returns a BulkOutcome with the outcome of each id, in
+        order; its by_id() is the map of item id -> ItemOutcome.
         """
 
-        logging.info('pimdb_ex:UpdateItems() - updating items....')
+        logging.info('pimdb_ex:DeleteItems() - deleting %d items....',
+                     len(itemids))
 
-        req = UpdateItemsRequest(self, items=items)
-        resp = req.execute()
+        ids = self._delete_items_ids(itemids, delete_type)
+        chunks = self._index_chunks(len(ids), chunk_size, OP_DELETE_ITEM)
+
+        def delete (chunk):
+            req = DeleteItemsRequest(self, itemids=[ids[i] for i in chunk],
+                                     delete_type=delete_type)
+            return req.execute()
+
+        res = self.executor.map(delete, chunks)
+        outcomes = [res.errors.get(i, resp) for i, resp in enumerate(res)]
+        ret = self._merge_outcomes(ids, chunks, outcomes)
+
+        logging.info('pimdb_ex:DeleteItems() - deleting items....done '
+                     '(%d failed)', len(ret.failed()))
+
+        return ret
 
-        logging.info('pimdb_ex:UpdateItems() - updating items....done')
-        return resp.items
+    def UpdateItems (self, items, chunk_size=None):
+        """
+        Save the changes made to the given items in the exchange store.
+
+        The items are split into chunks of chunk_size - by default the
+        UpdateItem batch_size() of the service - and the chunks are sent
+        concurrently. The new ChangeKey of each item that is updated is set
+        on it.
+
+        Items that were changed on the server since they were fetched, and
+        thus have a stale ChangeKey, have their ChangeKey refreshed with an
+        IdOnly GetItem and are sent once more. So for the fields being
+        updated, the changes made here win over those made elsewhere.
+
+        Returns a BulkOutcome with the outcome of each item, in order.
+        """
+
+        logging.info('pimdb_ex:UpdateItems() - updating %d items....',
+                     len(items))
+
+        ret = self._update_items(items, chunk_size)
+        stale = [i for i, x in enumerate(ret) if x.error_code == ERROR_CONFLICT]
+        if len(stale) > 0:
+            logging.info('UpdateItems: refreshing %d stale ChangeKeys',
+                         len(stale))
+            fresh = self.GetItems([items[i].itemid.value for i in stale],
+                                  ids_only=True)
+            again = self._refresh_change_keys(items, stale, fresh, ret)
+            res = self._update_items([items[i] for i in again], chunk_size)
+            for i, outcome in zip(again, res):
+                ret[i] = outcome
+
+        logging.info('pimdb_ex:UpdateItems() - updating items....done '
+                     '(%d failed)', len(ret.failed()))
+
+        return ret
 
     def SyncFolderItems (self, folder_id, sync_state):
         """
@@ -259,15 +443,38 @@ class ExchangeService(object):
 
         logging.info('pimdb_ex:SyncFolder() - fetching state...')
 
+        bs = self.batch_size(OP_SYNC_FOLDER)
         req = SyncFolderItemsRequest(self, folder_id=folder_id,
-                                     sync_state=sync_state,
-                                     batch_size=self.batch_size())
+                                     sync_state=sync_state, batch_size=bs)
         resp = req.execute()
 
         logging.info('pimdb_ex:SyncFolder() - fetching state...done')
 
         return resp
 
+    def sync_folder_items (self, folder_id, sync_state=None, on_changes=None,
+                           checkpoint=None):
+        """
+        Fetch all the changes made to the folder with the given id since
+        sync_state, however many SyncFolderItems calls that takes, and return
+        the final sync state. A sync_state of None fetches everything in the
+        folder.
+
+        on_changes(news, mods, dels) is called with the changes in each page
+        as it comes in, and then checkpoint(sync_state) with the sync state
+        after that page. If we die part way through, calling this again with
+        the last checkpointed state picks up from there. The page that was
+        being handled at the time is delivered again, so on_changes should
+        not mind seeing the same changes twice.
+        """
+
+        state = sync_state
+        more = True
+        while more:
+            resp = self.SyncFolderItems(folder_id, state)
+            state, more = self._sync_page(resp, state, on_changes, checkpoint)
+
+        return state
     ##
     ## Some internal messages
     ##
@@ -276,16 +483,42 @@ class ExchangeService(object):
     ## Other external methods
     ##
 
-    def init_soap_client (self):
+    def init_soap_client (self, pool=None, compress_responses=False,
+                          compress_requests_min=None, streaming=False,
+                          wire_log=None):
+        """
+        pool is an optional soap.SessionPool to send requests through. By
+        default all services talking to the same host share one pool of
+        keep-alive connections.
+
+        See soap.SoapClient for the meaning of the compression, streaming
+        and wire_log options.
+        """
+
         self.soap = SoapClient(self.Url, user=self.credentials.user,
-                               pwd=self.credentials.pwd)
+                               pwd=self.credentials.pwd, pool=pool,
+                               compress_responses=compress_responses,
+                               compress_requests_min=compress_requests_min,
+                               streaming=streaming, wire_log=wire_log)
 
-    def send (self, req, debug=False):
+    def send (self, req, debug=False, stats=None, stream_tag=None,
+              on_element=None):
         """
         Will raise a SoapConnectionError if there is a connection problem.
         """
 
-        return self.soap.send(req, debug)
+        return self.soap.send(req, debug, stats=stats, stream_tag=stream_tag,
+                              on_element=on_element)
+
+    def execute_requests (self, reqs):
+        """
+        Execute the given independent Request objects concurrently, and
+        return a executor.BulkResult with the Response objects in the same
+        order. A request that fails does not affect the others; its
+        exception is in the errors of the returned BulkResult.
+        """
+
+        return self.executor.execute(reqs)
 
     def get_distinguished_folder (self, name):
         elem = u'<t:DistinguishedFolderId Id="%s"/>' % name
@@ -299,13 +532,465 @@ class ExchangeService(object):
                                            WellKnownFolderName.MsgFolderRoot)
         return self.root_folder
 
-    def batch_size (self):
-        return 100
+    def batch_size (self, op=OP_FIND_ITEM):
+        """
+        Return the number of items to put in the next request of the given
+        EWS operation - one of the OP_* names in ews.batching.
+        """
+
+        if self.batch_sizer is None:
+            return DEFAULT_BATCH_SIZE
+        return self.batch_sizer.batch_size(op)
 
     ##
     ## Internal routines
     ##
 
+    def _find_item_shells (self, folder, new_req, prefetch=None):
+        """
+        Page through a FindItem view of folder and return the items in it.
+        new_req(offset, count) should return the Request for the count items
+        starting at the given offset.
+        """
+
+        if prefetch is None:
+            prefetch = self.page_prefetch
+
+        if prefetch <= 1:
+            return self._find_pages_serial(folder, new_req)
+
+        ret, consistent = self._find_pages_parallel(new_req, prefetch)
+        if ret is not None and not consistent:
+            ## Items were added or removed while we were at it, which shifts
+            ## the offsets of everything after them. Items may thus have
+            ## been skipped, so go over the whole view once more, and take
+            ## whatever is seen in either pass.
+            logging.warning('FindItems: folder %s changed during the scan; '
+                            'rescanning', folder.DisplayName)
+            again, consistent = self._find_pages_parallel(new_req, prefetch)
+            if again is None:
+                ret = None
+            elif consistent:
+                ret = again
+            else:
+                ret = self._dedupe_items(again + ret)
+
+        if ret is None:
+            logging.warning('FindItems: the server cut pages of folder %s '
+                            'short; paging through it serially',
+                            folder.DisplayName)
+            return self._find_pages_serial(folder, new_req)
+
+        return ret
+
+    def _find_pages_serial (self, folder, new_req):
+        i = 0
+        ret = []
+        while True:
+            bs = self.batch_size()
+            req = new_req(i, bs)
+            resp = req.execute()
+            shells = resp.items
+            if shells is not None and len(shells) > 0:
+                ret += shells
+
+            if resp.includes_last:
+                break
+
+            nxt = resp.next_offset(i)
+            ## just a safety net to avoid inifinite loops
+            if nxt <= i:
+                logging.warning('pimdb_ex.FindItems(): Breaking strange loop')
+                break
+            i = nxt
+
+        return ret
+
+    def _find_pages_parallel (self, new_req, prefetch):
+        """
+        Fetch the first page to learn the size of the view, then the rest of
+        the pages concurrently with at most prefetch of them in flight.
+        Returns a tuple (items, consistent). The items are in view order,
+        without duplicates. consistent is False if the view was seen to
+        change while the pages were being fetched. items is None if the
+        server sent a page short of what was asked for, other than the last
+        one, in which case the view has to be paged through serially.
+
+        Each page is fetched with one item more than the batch size, which
+        should be the first item of the next page. If it is not, items were
+        added or removed in front of that page boundary between the fetches
+        of the two pages, and items around the boundary may have been
+        skipped.
+        """
+
+        bs = self.batch_size()
+
+        first = new_req(0, bs + 1).execute()
+        if first.has_errors():
+            raise EWSResponseError(first)
+
+        total = first.total_items
+        if first.includes_last or total is None:
+            return self._dedupe_items(first.items), True
+
+        ## The server caps the number of items in a page (EWSFindCountLimit)
+        ## and may have sent fewer than we asked for; size the rest of the
+        ## pages to what it did send.
+        if len(first.items) < bs + 1:
+            if len(first.items) < 2:
+                return None, False
+            bs = len(first.items) - 1
+
+        pages = {0 : (first.items, False)}
+
+        totals = set([total])
+        nxt = bs
+        inflight = []
+
+        while nxt < total or len(inflight) > 0:
+            while nxt < total and len(inflight) < prefetch:
+                req = new_req(nxt, bs + 1)
+                inflight.append((nxt, self.executor.submit(req.execute)))
+                nxt += bs
+
+            offset, fut = inflight.pop(0)
+            resp = fut.result()
+            if resp.has_errors():
+                raise EWSResponseError(resp)
+
+            pages[offset] = (resp.items, resp.includes_last)
+            if resp.total_items is not None:
+                totals.add(resp.total_items)
+                ## Go on until the end of the view as it is now; if it has
+                ## grown there are more pages than we knew of.
+                total = max(total, resp.total_items)
+
+        consistent = len(totals) == 1
+        ret = []
+        offsets = sorted(pages.keys())
+        for i, offset in enumerate(offsets):
+            items, last = pages[offset]
+            if len(items) <= bs:
+                if not last:
+                    ## Cut short by the server rather than by the end of
+                    ## the view, so the items after it are missing
+                    return None, False
+                ret += items
+                continue
+
+            ret += items[:bs]
+            nxt = pages.get(offset + bs, ((), False))[0]
+            if nxt and nxt[0].itemid.value != items[bs].itemid.value:
+                consistent = False
+
+        items = self._dedupe_items(ret)
+        return items, consistent and len(items) == len(ret)
+
+    def _iter_pages (self, folder, eprops_xml=[], batch_size=None,
+                     pipeline=True):
+        """
+        A generator of ItemLists with the fully populated items of each
+        FindItem page of folder. If pipeline is True the FindItem request
+        for page N+1 is sent off before the GetItem requests for page N, so
+        that the two overlap and the first page of items is available after
+        a single FindItem round trip.
+
+        The offset of page N+1 is taken from the response for page N, as
+        the server may have sent fewer items than were asked for. So the
+        request for it is never sent before that response is in, and no
+        more than one FindItem request is ever ahead of the GetItems.
+        """
+
+        bs = batch_size if batch_size is not None else self.batch_size()
+
+        def find (offset):
+            req = FindItemsRequest(self, batch_size=bs, offset=offset,
+                                   folder_id=folder.Id)
+            return req.execute()
+
+        i = 0
+        resp = find(i)
+        while True:
+            more = not resp.includes_last
+            nxt = resp.next_offset(i)
+            ids = [x.itemid for x in resp.items]
+
+            ## Only the ids are needed from here on; let go of the rest of
+            ## the page before fetching the items.
+            del resp
+
+            ## just a safety net to avoid inifinite loops
+            if more and nxt <= i:
+                logging.warning('ExchangeService.iter_items(): Breaking '
+                                'strange loop')
+                more = False
+            i = nxt
+
+            pending = None
+            if more and pipeline:
+                pending = self.executor.submit(find, i)
+
+            if len(ids) > 0:
+                yield self.GetItems(ids, eprops_xml=eprops_xml)
+
+            if not more:
+                break
+
+            resp = pending.result() if pending is not None else find(i)
+
+    def _get_items_chunks (self, itemids, chunk_size=None):
+        if chunk_size is None:
+            chunk_size = self.batch_size(OP_GET_ITEM)
+
+        ids = [getattr(x, 'value', x) for x in itemids]
+        return [ids[i:i+chunk_size] for i in range(0, len(ids), chunk_size)]
+
+    def _merge_get_items (self, chunks, outcomes):
+        """
+        Put together the ItemList for a GetItems() call. outcomes has, for
+        each chunk of ids, either the GetItemsResponse for it or the
+        exception raised when fetching it.
+        """
+
+        ret = ItemList()
+        for chunk, resp in zip(chunks, outcomes):
+            if isinstance(resp, Exception):
+                logging.error('GetItems: failed to fetch %d items: %s',
+                              len(chunk), resp)
+                for iid in chunk:
+                    ret.errors[iid] = resp
+                continue
+
+            ## There is one response message per id, in the same order. A
+            ## message with a warning may or may not have its item, so the
+            ## items are matched to the ids by their ItemIds rather than by
+            ## their position.
+            items = dict((x.itemid.value, x) for x in resp.items)
+            for i, iid in enumerate(chunk):
+                item = items.get(iid)
+                if i in resp.errors:
+                    ret.errors[iid] = resp.errors[i]
+                elif item is not None:
+                    ret.append(item)
+                    if i in resp.warnings:
+                        ret.warnings[iid] = resp.warnings[i]
+                elif i in resp.warnings:
+                    ret.errors[iid] = resp.warnings[i]
+                else:
+                    ## No message for it at all, or one without the item
+                    ret.errors[iid] = EWSNoResponseError()
+
+        return ret
+
+    def _item_columns_reqs (self, chunks, columns, eprops_xml):
+        """
+        Return a GetItemsRequest for each chunk of ids that decodes the
+        items into an ItemColumns of its own.
+        """
+
+        reqs = []
+        for chunk in chunks:
+            cols = ItemColumns(columns)
+            req = GetItemsRequest(self, itemids=chunk,
+                                  ids_only=cols.ids_only(),
+                                  custom_eprops_xml=(list(eprops_xml) +
+                                                     cols.eprops_xml()))
+            req.item_columns = cols
+            reqs.append(req)
+
+        return reqs
+
+    def _merge_item_columns (self, columns, chunks, reqs, outcomes):
+        """
+        Put together the ItemColumns for a GetItemColumns() call, as
+        _merge_get_items() does for GetItems().
+        """
+
+        ret = ItemColumns(columns)
+        for chunk, req, resp in zip(chunks, reqs, outcomes):
+            if isinstance(resp, Exception):
+                logging.error('GetItemColumns: failed to fetch %d items: %s',
+                              len(chunk), resp)
+                for iid in chunk:
+                    ret.errors[iid] = resp
+                continue
+
+            ret.extend(req.item_columns)
+            for i, err in resp.errors.iteritems():
+                ret.errors[chunk[i]] = err
+
+        return ret
+
+    def _sync_page (self, resp, state, on_changes, checkpoint):
+        """
+        Hand a page of changes fetched by sync_folder_items() with the given
+        sync state to the callbacks. Returns a tuple (sync_state, more) with
+        the sync state after the page and whether there are more pages.
+        """
+
+        if resp.has_errors():
+            raise EWSResponseError(resp)
+
+        if on_changes is not None:
+            on_changes(resp.news, resp.mods, resp.dels)
+
+        if resp.sync_state is None:
+            ## Nothing to go on from. Checkpointing None would throw away the
+            ## state saved so far, so keep that one; the next sync delivers
+            ## this page again.
+            logging.error('ExchangeService.sync_folder_items(): No sync '
+                          'state in the response; stopping')
+            return state, False
+
+        if checkpoint is not None:
+            checkpoint(resp.sync_state)
+
+        more = not resp.includes_last
+        n = len(resp.news) + len(resp.mods) + len(resp.dels)
+        ## just a safety net to avoid inifinite loops
+        if more and n == 0 and resp.sync_state == state:
+            logging.warning('ExchangeService.sync_folder_items(): Breaking '
+                            'strange loop')
+            more = False
+
+        return resp.sync_state, more
+
+    def _create_items_chunks (self, xmls, chunk_size=None,
+                              max_bytes=MAX_REQUEST_BYTES):
+        """
+        Split the items whose XML is in xmls into chunks of no more than
+        chunk_size items and max_bytes of XML each, and return the list of
+        the indices of the items in each chunk. An item larger than
+        max_bytes goes in a chunk by itself.
+        """
+
+        if chunk_size is None:
+            chunk_size = self.batch_size(OP_CREATE_ITEM)
+
+        chunks = []
+        cur = []
+        size = 0
+        for i, x in enumerate(xmls):
+            if cur and (len(cur) >= chunk_size or size + len(x) > max_bytes):
+                chunks.append(cur)
+                cur = []
+                size = 0
+            cur.append(i)
+            size += len(x)
+
+        if cur:
+            chunks.append(cur)
+
+        return chunks
+
+    def _update_items (self, items, chunk_size=None):
+        """
+        Send one round of UpdateItem requests for the given items, and
+        return the BulkOutcome.
+        """
+
+        chunks = self._index_chunks(len(items), chunk_size, OP_UPDATE_ITEM)
+
+        def update (chunk):
+            req = UpdateItemsRequest(self, items=[items[i] for i in chunk])
+            return req.execute()
+
+        res = self.executor.map(update, chunks)
+        outcomes = [res.errors.get(i, resp) for i, resp in enumerate(res)]
+        return self._merge_outcomes(items, chunks, outcomes)
+
+    def _refresh_change_keys (self, items, stale, fresh, outcomes):
+        """
+        fresh is the ItemList from an IdOnly GetItems() of the items at the
+        indices stale. Set the ChangeKeys in there on those items, and
+        return the indices of the ones that can be sent again. The others
+        have what went wrong fetching them recorded in outcomes.
+        """
+
+        cks = dict((x.itemid.value, x.change_key.value) for x in fresh)
+        ret = []
+        for i in stale:
+            iid = items[i].itemid.value
+            if iid in cks:
+                items[i].change_key.set(cks[iid])
+                ret.append(i)
+            elif iid in fresh.errors:
+                outcomes[i] = ItemOutcome(items[i], error=fresh.errors[iid])
+
+        return ret
+
+    def _delete_items_ids (self, itemids, delete_type):
+        if delete_type not in DeleteType.all:
+            raise ValueError('Unknown delete_type: %s' % delete_type)
+
+        return [getattr(x, 'value', x) for x in itemids]
+
+    def _index_chunks (self, n, chunk_size, op):
+        """
+        Return the list of indices in each chunk of n things split into
+        chunks of chunk_size, or the batch_size() of op if that is None.
+        """
+
+        if chunk_size is None:
+            chunk_size = self.batch_size(op)
+
+        return [range(i, min(i + chunk_size, n))
+                for i in range(0, n, chunk_size)]
+
+    def _merge_outcomes (self, items, chunks, outcomes):
+        """
+        Put together the BulkOutcome of a CreateItems(), UpdateItems() or
+        DeleteItems() call. items are the items - or for DeleteItems(), the
+        item ids - handed in. chunks has the list of indices into items of
+        each request sent, and outcomes, for each of them, either the
+        Response or the exception raised when sending it.
+        """
+
+        ret = BulkOutcome()
+        for chunk, resp in zip(chunks, outcomes):
+            if isinstance(resp, Exception):
+                logging.error('Bulk request for %d items failed: %s',
+                              len(chunk), resp)
+                nmsgs = 0
+            else:
+                nmsgs = resp.suc_cnt + resp.err_cnt + resp.war_cnt
+
+            for i, idx in enumerate(chunk):
+                item = items[idx]
+                iid = item if isinstance(item, basestring) else None
+                if isinstance(resp, Exception):
+                    err = resp
+                elif i in resp.errors:
+                    err = resp.errors[i]
+                elif i in resp.warnings:
+                    ## Such as ErrorBatchProcessingStopped: not done
+                    err = resp.warnings[i]
+                elif i >= nmsgs:
+                    err = EWSNoResponseError()
+                else:
+                    err = None
+
+                if iid is not None:
+                    ret.append(ItemOutcome(item, iid, error=err))
+                elif err is None:
+                    ret.append(ItemOutcome(item, item.itemid.value,
+                                           item.change_key.value))
+                else:
+                    ret.append(ItemOutcome(item, error=err))
+
+        return ret
+
+    def _dedupe_items (self, items):
+        seen = set()
+        ret = []
+        for item in items:
+            iid = item.itemid.value
+            if iid not in seen:
+                seen.add(iid)
+                ret.append(item)
+
+        return ret
+
     def _wsdl_url (self, url=None):
         if not url:
             url = self.Url
@@ -337,3 +1022,274 @@ class ExchangeService(object):
     def Url (self, url):
         self._Url = url
         self.wsdl_url = self._wsdl_url()
+
+class AsyncExchangeService(ExchangeService):
+    """
+    An ExchangeService whose request methods do not block. Each of them is a
+    tornado coroutine returning a Future, which can be yielded from another
+    coroutine or awaited on an asyncio event loop. This allows a single
+    thread to drive a large number of mailboxes at the same time.
+
+    The requests are built and the responses decoded by the very same
+    Request and Response classes as the blocking ExchangeService; only the
+    transport differs.
+    """
+
+    def init_soap_client (self, http_client=None, max_clients=100,
+                          compress_responses=False, compress_requests_min=None,
+                          wire_log=None):
+        """
+        See soap.AsyncSoapClient for the meaning of the parameters.
+        """
+
+        self.soap = AsyncSoapClient(self.Url, user=self.credentials.user,
+                                    pwd=self.credentials.pwd,
+                                    http_client=http_client,
+                                    max_clients=max_clients,
+                                    compress_responses=compress_responses,
+                                    compress_requests_min=compress_requests_min,
+                                    wire_log=wire_log)
+
+    @gen.coroutine
+    def execute_request (self, req, debug=False):
+        """
+        Send the given Request object to the server and return the decoded
+        Response object.
+        """
+
+        body = req.render()
+
+        req.retry_stats = RetryStats()
+        while True:
+            node = err = None
+            req.stats = TransferStats()
+            try:
+                node = yield self.soap.send(body, debug, stats=req.stats)
+            except (SoapConnectionError, SoapHTTPError) as e:
+                err = e
+
+            delay = None
+            if self.retry_policy is not None:
+                delay = self.retry_policy.evaluate(req.retry_stats, node=node,
+                                                   error=err,
+                                                   idempotent=req.idempotent)
+            if delay is None:
+                req.observe_batch(node, err)
+                if err is not None:
+                    raise err
+                break
+
+            yield gen.sleep(delay)
+
+        raise gen.Return(req.process_response(node))
+
+    ##
+    ## The asynchronous versions of the ExchangeService methods. See there for
+    ## documentation.
+    ##
+
+    @gen.coroutine
+    def BindFolder (self, wkfn):
+        folder = yield Folder.bind_async(self, wkfn)
+        raise gen.Return(folder)
+
+    @gen.coroutine
+    def FindFolders (self, folder, types=None, recursive=False):
+        folders = yield folder.FindFoldersAsync(types=types,
+                                                recursive=recursive)
+        raise gen.Return(folders)
+
+    @gen.coroutine
+    def FindItems (self, folder, eprops_xml=[], ids_only=False):
+        logging.info('pimdb_ex:FindItems() - fetching items in folder %s...',
+                     folder.DisplayName)
+
+        ret = yield self._find_shells(folder)
+
+        logging.info('pimdb_ex:FindItems() - fetching items in folder %s...done',
+                     folder.DisplayName)
+
+        if len(ret) > 0 and ids_only == False:
+            items = yield self.GetItems([x.itemid for x in ret],
+                                        eprops_xml=eprops_xml)
+            raise gen.Return(items)
+        else:
+            raise gen.Return(ret)
+
+    @gen.coroutine
+    def _find_shells (self, folder, lazy=None):
+        """
+        Page through a FindItem view of folder and return the items in it.
+        If lazy is given it overrides the lazy_items of the service for
+        these items.
+        """
+
+        i = 0
+        ret = []
+        while True:
+            bs = self.batch_size()
+            req = FindItemsRequest(self, batch_size=bs, offset=i,
+                                   folder_id=folder.Id)
+            if lazy is not None:
+                req.lazy_items = lazy
+            resp = yield self.execute_request(req)
+            shells = resp.items
+            if shells is not None and len(shells) > 0:
+                ret += shells
+
+            if resp.includes_last:
+                break
+
+            nxt = resp.next_offset(i)
+            ## just a safety net to avoid inifinite loops
+            if nxt <= i:
+                logging.warning('pimdb_ex.FindItems(): Breaking strange loop')
+                break
+            i = nxt
+
+        raise gen.Return(ret)
+
+    @gen.coroutine
+    def FindItemsLMT (self, folder, lmt):
+        logging.info('pimdb_ex:FindItemsLMT() - fetching items in folder %s...',
+                     folder.DisplayName)
+
+        i = 0
+        ret = []
+        while True:
+            bs = self.batch_size()
+            req = FindItemsLMTRequest(self, batch_size=bs, offset=i,
+                                      folder_id=folder.Id, lmt=lmt)
+            resp = yield self.execute_request(req)
+            shells = resp.items
+            if shells is not None and len(shells) > 0:
+                ret += shells
+
+            if resp.includes_last:
+                break
+
+            nxt = resp.next_offset(i)
+            ## just a safety net to avoid inifinite loops
+            if nxt <= i:
+                logging.warning('pimdb_ex.FindItemsLMT(): Breaking strange loop')
+                break
+            i = nxt
+
+        logging.info('pimdb_ex:FindItemsLMT() - fetching items in folder %s...done',
+                     folder.DisplayName)
+
+        raise gen.Return(ret)
+
+    @gen.coroutine
+    def GetItems (self, itemids, eprops_xml=[], chunk_size=None,
+                  ids_only=False):
+        chunks = self._get_items_chunks(itemids, chunk_size)
+        reqs = [GetItemsRequest(self, itemids=chunk, ids_only=ids_only,
+                                custom_eprops_xml=eprops_xml)
+                for chunk in chunks]
+        outcomes = yield [self._send_chunk(req) for req in reqs]
+        raise gen.Return(self._merge_get_items(chunks, outcomes))
+
+    @gen.coroutine
+    def GetItemColumns (self, itemids, columns=None, eprops_xml=[],
+                        chunk_size=None):
+        chunks = self._get_items_chunks(itemids, chunk_size)
+        reqs = self._item_columns_reqs(chunks, columns, eprops_xml)
+        outcomes = yield [self._send_chunk(req) for req in reqs]
+        raise gen.Return(self._merge_item_columns(columns, chunks, reqs,
+                                                  outcomes))
+
+    @gen.coroutine
+    def FindItemColumns (self, folder, columns=None, eprops_xml=[]):
+        shells = yield self._find_shells(folder, lazy=True)
+        cols = yield self.GetItemColumns([x.itemid.value for x in shells],
+                                         columns, eprops_xml)
+        raise gen.Return(cols)
+
+    @gen.coroutine
+    def CreateItems (self, folder_id, items, chunk_size=None,
+                     max_bytes=MAX_REQUEST_BYTES):
+        xmls = [item_xml(x) for x in items]
+        chunks = self._create_items_chunks(xmls, chunk_size, max_bytes)
+        reqs = [CreateItemsRequest(self, folder_id=folder_id,
+                                   items=[items[i] for i in chunk],
+                                   items_xml=[xmls[i] for i in chunk])
+                for chunk in chunks]
+        outcomes = yield [self._send_chunk(req) for req in reqs]
+        raise gen.Return(self._merge_outcomes(items, chunks, outcomes))
+
+    @gen.coroutine
+    def DeleteItems (self, itemids, delete_type=DeleteType.MoveToDeletedItems,
+                     chunk_size=None):
+        ids = self._delete_items_ids(itemids, delete_type)
+        chunks = self._index_chunks(len(ids), chunk_size, OP_DELETE_ITEM)
+        reqs = [DeleteItemsRequest(self, itemids=[ids[i] for i in chunk],
+                                   delete_type=delete_type)
+                for chunk in chunks]
+        outcomes = yield [self._send_chunk(req) for req in reqs]
+        raise gen.Return(self._merge_outcomes(ids, chunks, outcomes))
+
+    @gen.coroutine
+    def UpdateItems (self, items, chunk_size=None):
+        ret = yield self._update_items(items, chunk_size)
+        stale = [i for i, x in enumerate(ret) if x.error_code == ERROR_CONFLICT]
+        if len(stale) > 0:
+            fresh = yield self.GetItems([items[i].itemid.value for i in stale],
+                                        ids_only=True)
+            again = self._refresh_change_keys(items, stale, fresh, ret)
+            res = yield self._update_items([items[i] for i in again],
+                                           chunk_size)
+            for i, outcome in zip(again, res):
+                ret[i] = outcome
+
+        raise gen.Return(ret)
+
+    @gen.coroutine
+    def SyncFolderItems (self, folder_id, sync_state):
+        bs = self.batch_size(OP_SYNC_FOLDER)
+        req = SyncFolderItemsRequest(self, folder_id=folder_id,
+                                     sync_state=sync_state, batch_size=bs)
+        resp = yield self.execute_request(req)
+        raise gen.Return(resp)
+
+    @gen.coroutine
+    def sync_folder_items (self, folder_id, sync_state=None, on_changes=None,
+                           checkpoint=None):
+        state = sync_state
+        more = True
+        while more:
+            resp = yield self.SyncFolderItems(folder_id, state)
+            state, more = self._sync_page(resp, state, on_changes, checkpoint)
+
+        raise gen.Return(state)
+
+    @gen.coroutine
+    def get_root_folder (self):
+        if not self.root_folder:
+            self.root_folder = yield Folder.bind_async(
+                self, WellKnownFolderName.MsgFolderRoot)
+        raise gen.Return(self.root_folder)
+
+    ##
+    ## Internal routines
+    ##
+
+    @gen.coroutine
+    def _update_items (self, items, chunk_size=None):
+        chunks = self._index_chunks(len(items), chunk_size, OP_UPDATE_ITEM)
+        reqs = [UpdateItemsRequest(self, items=[items[i] for i in chunk])
+                for chunk in chunks]
+        outcomes = yield [self._send_chunk(req) for req in reqs]
+        raise gen.Return(self._merge_outcomes(items, chunks, outcomes))
+
+    @gen.coroutine
+    def _send_chunk (self, req):
+        """Execute one request of a bulk operation, returning the exception
+        instead of raising it if that fails."""
+
+        try:
+            resp = yield self.execute_request(req)
+        except Exception as e:
+            raise gen.Return(e)
+
+        raise gen.Return(resp)
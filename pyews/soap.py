@@ -17,20 +17,36 @@
 ## You should have a copy of the license in the doc/ directory of pyews.  If
 ## not, see <http://www.gnu.org/licenses/>.
 
-import logging, re, requests
+import Cookie, logging, requests, threading, time, zlib
+from   contextlib    import contextmanager
+from   cookielib     import DefaultCookiePolicy
 from   requests.auth import HTTPBasicAuth
+from   requests.adapters import HTTPAdapter
+from   requests.cookies  import RequestsCookieJar
+from   requests.packages.urllib3.exceptions import ProtocolError
+from   requests.packages.urllib3.exceptions import ReadTimeoutError
+from   urlparse      import urlparse
+from   tornado       import gen
+from   tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPError
 import xml.etree.ElementTree as ET
-import utils
-from   utils import pretty_xml
+import utils, wirelog
 
 E_NAMESPACE = 'http://schemas.microsoft.com/exchange/services/2006/errors'
 M_NAMESPACE = 'http://schemas.microsoft.com/exchange/services/2006/messages'
 S_NAMESPACE = 'http://schemas.xmlsoap.org/soap/envelope/'
 T_NAMESPACE = 'http://schemas.microsoft.com/exchange/services/2006/types'
 
+## Default value of the EWSMaxConcurrency throttling policy setting, i.e. the
+## number of concurrent connections a user may have open against EWS, for
+## Exchange 2013 onwards and Exchange Online.
+EWS_MAX_CONCURRENCY = 27
+
 def unQName (name):
-    res = re.match('{.*}(.*)', name)
-    return name if res is None else res.group(1)
+    if name[:1] == '{':
+        i = name.rfind('}')
+        if i > 0:
+            return name[i+1:]
+    return name
 
 def QName (namespace, name):
     return '{%s}%s' % (namespace, name)
@@ -60,32 +76,536 @@ class SoapMessageError(Exception):
 class SoapConnectionError(Exception):
     pass
 
+class SoapHTTPError(Exception):
+    """
+    Raised when the server answers with a HTTP error status that does not
+    carry a SOAP response (i.e. anything other than a 500, which is how
+    SOAP faults are returned).
+    """
+
+    def __init__ (self, code, retry_after=None):
+        """code is the HTTP status code. retry_after is the value of the
+        Retry-After header if the server sent one."""
+
+        Exception.__init__(self, code, retry_after)
+        self.code = code
+        self.retry_after = retry_after
+
+    def __str__ (self):
+        return 'HTTP error %s' % self.code
+
+    @staticmethod
+    def check (code, headers):
+        if code >= 400 and code != 500:
+            raise SoapHTTPError(code, headers.get('Retry-After'))
+
+class TransferStats(object):
+    """
+    Byte counts and timings for a single request/response exchange. An
+    object of this type can be handed to SoapClient.send() which will fill
+    it in.
+    """
+
+    def __init__ (self):
+        self.request_bytes = 0          # request body as sent on the wire
+        self.request_raw_bytes = 0      # request body before compression
+        self.request_encoding = None
+        self.compress_time = 0.0
+
+        self.response_bytes = 0         # response body as read off the wire
+        self.response_raw_bytes = 0     # response body after decompression
+        self.response_encoding = None
+        self.decompress_time = 0.0
+
+        self.elapsed = 0.0              # wall clock time for the round trip
+
+    def __str__ (self):
+        s  = 'Request : %d bytes sent (%d raw, encoding: %s)' % (
+            self.request_bytes, self.request_raw_bytes, self.request_encoding)
+        s += '\nResponse: %d bytes received (%d raw, encoding: %s)' % (
+            self.response_bytes, self.response_raw_bytes,
+            self.response_encoding)
+        s += '\nTimes   : %.3fs total, %.3fs compress, %.3fs decompress' % (
+            self.elapsed, self.compress_time, self.decompress_time)
+
+        return s
+
+class StreamReader(object):
+    """
+    A minimal file-like wrapper around a streamed HTTP response body. It
+    undoes any Content-Encoding as the bytes come off the socket and keeps
+    the TransferStats up to date, so that it can be fed straight into an
+    incremental XML parser.
+    """
+
+    def __init__ (self, raw, encoding, stats, chunk_size=16384,
+                  length=None):
+        """
+        length is the Content-Length of the response, if it had one. The
+        connection is taken to have dropped if the body ends short of it.
+        """
+
+        self.chunks = raw.stream(chunk_size, decode_content=False)
+        self.stats = stats
+        self.buf = ''
+        self.eof = False
+        self.length = length
+        self.received = 0
+
+        encoding = encoding.strip().lower() if encoding else None
+        stats.response_encoding = encoding
+
+        if encoding == 'gzip':
+            self.decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self.decomp = zlib.decompressobj()
+        else:
+            self.decomp = None
+        self.raw_deflate = (encoding == 'deflate')
+
+    def read (self, n=-1):
+        while not self.eof and (n < 0 or len(self.buf) < n):
+            try:
+                chunk = next(self.chunks)
+            except StopIteration:
+                self.eof = True
+                chunk = None
+                if self.length is not None and self.received < self.length:
+                    raise SoapConnectionError(
+                        'Connection closed after %d of %d bytes' % (
+                            self.received, self.length))
+
+            self.buf += self._decode(chunk)
+
+        if n < 0 or n >= len(self.buf):
+            ret, self.buf = self.buf, ''
+        else:
+            ret, self.buf = self.buf[:n], self.buf[n:]
+
+        return ret
+
+    def _decode (self, chunk):
+        if chunk is not None:
+            self.received += len(chunk)
+            self.stats.response_bytes += len(chunk)
+
+        if self.decomp is None:
+            data = chunk or ''
+        else:
+            t = time.time()
+            if chunk is None:
+                data = self.decomp.flush()
+            else:
+                try:
+                    data = self.decomp.decompress(chunk)
+                except zlib.error:
+                    ## Some servers send a raw deflate stream without the
+                    ## zlib header; that can only show up on the first chunk
+                    if not self.raw_deflate:
+                        raise
+                    self.decomp = zlib.decompressobj(-zlib.MAX_WBITS)
+                    data = self.decomp.decompress(chunk)
+                self.raw_deflate = False
+            self.stats.decompress_time += time.time() - t
+
+        self.stats.response_raw_bytes += len(data)
+        return data
+
+class SessionPool(object):
+    """
+    A pool of persistent HTTP sessions with keep-alive. Each session is used
+    by one thread at a time, so the underlying TCP/TLS connection survives
+    from one SOAP call to the next instead of being set up afresh for every
+    request.
+
+    Pools are usually obtained through for_host() so that all the
+    SoapClients (and hence ExchangeService objects) talking to the same
+    server end up sharing the same set of connections. Sessions do not keep
+    any cookies; those are tracked per SoapClient as they are specific to a
+    mailbox.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__ (self, max_size=EWS_MAX_CONCURRENCY, idle_timeout=300):
+        """
+        max_size is the maximum number of sessions (and hence concurrent
+        connections) the pool will hand out. A thread asking for a session
+        when all of them are busy will block till one is returned.
+
+        idle_timeout is the time in seconds after which a session that has
+        not been used is closed and dropped from the pool. If it is None
+        idle sessions are never evicted.
+        """
+
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+
+        self._cond = threading.Condition()
+        self._idle = []                  # (session, last_used) tuples, LIFO
+        self._in_use = 0
+
+        self.sessions_created = 0
+        self.sessions_evicted = 0
+        self.sessions_reused = 0
+
+        ## Connection counts harvested from sessions that have been closed
+        self._closed_requests = 0
+        self._closed_connections = 0
+        self._live = set()
+
+    @classmethod
+    def for_host (cls, url, **kwargs):
+        """
+        Return the shared pool for the host in the given url, creating one
+        with the given keyword arguments if there isn't one already.
+        """
+
+        u = urlparse(url)
+        key = (u.scheme.lower(), u.netloc.lower())
+
+        with cls._shared_lock:
+            pool = cls._shared.get(key)
+            if pool is None:
+                pool = cls(**kwargs)
+                cls._shared[key] = pool
+
+        return pool
+
+    ##
+    ## Public methods
+    ##
+
+    def checkout (self):
+        with self._cond:
+            self._evict_idle()
+            while True:
+                if len(self._idle) > 0:
+                    sess, _ = self._idle.pop()
+                    self.sessions_reused += 1
+                    break
+
+                if self._in_use < self.max_size:
+                    sess = self._new_session()
+                    break
+
+                self._cond.wait()
+
+            self._in_use += 1
+
+        return sess
+
+    def checkin (self, sess):
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((sess, time.time()))
+            self._evict_idle()
+            self._cond.notify()
+
+    @contextmanager
+    def session (self):
+        sess = self.checkout()
+        try:
+            yield sess
+        finally:
+            self.checkin(sess)
+
+    def evict_idle (self):
+        with self._cond:
+            self._evict_idle()
+
+    def close (self):
+        """Close all the idle sessions. Sessions in use are not affected."""
+
+        with self._cond:
+            while len(self._idle) > 0:
+                sess, _ = self._idle.pop()
+                self._close_session(sess)
+
+    def stats (self):
+        """
+        Return a dictionary of counters describing how well sessions and the
+        underlying connections are being reused.
+        """
+
+        with self._cond:
+            reqs  = self._closed_requests
+            conns = self._closed_connections
+            for sess in self._live:
+                r, c = self._conn_counts(sess)
+                reqs  += r
+                conns += c
+
+            return {
+                'sessions_created'   : self.sessions_created,
+                'sessions_evicted'   : self.sessions_evicted,
+                'sessions_reused'    : self.sessions_reused,
+                'sessions_idle'      : len(self._idle),
+                'sessions_in_use'    : self._in_use,
+                'requests'           : reqs,
+                'connections_opened' : conns,
+                'connections_reused' : max(reqs - conns, 0),
+            }
+
+    ##
+    ## Internal methods. These expect self._cond to be held
+    ##
+
+    def _new_session (self):
+        sess = requests.Session()
+        sess.cookies = RequestsCookieJar(policy=DefaultCookiePolicy(
+            allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        sess.mount('https://', adapter)
+        sess.mount('http://', adapter)
+
+        self.sessions_created += 1
+        self._live.add(sess)
+        return sess
+
+    def _close_session (self, sess):
+        r, c = self._conn_counts(sess)
+        self._closed_requests += r
+        self._closed_connections += c
+        self._live.discard(sess)
+        self.sessions_evicted += 1
+        sess.close()
+
+    def _evict_idle (self):
+        if self.idle_timeout is None:
+            return
+
+        cutoff = time.time() - self.idle_timeout
+        keep = []
+        for sess, last in self._idle:
+            if last < cutoff:
+                self._close_session(sess)
+            else:
+                keep.append((sess, last))
+        self._idle = keep
+
+    @staticmethod
+    def _conn_counts (sess):
+        """
+        Return the (requests, connections) tuple summed over all the urllib3
+        connection pools of the given session.
+        """
+
+        reqs = conns = 0
+        for adapter in set(sess.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                p = pools.get(key)
+                if p is not None:
+                    reqs  += p.num_requests
+                    conns += p.num_connections
+
+        return reqs, conns
+
 class SoapClient(object):
-    def __init__ (self, service_url, user, pwd):
+    def __init__ (self, service_url, user, pwd, pool=None,
+                  compress_responses=False, compress_requests_min=None,
+                  streaming=False, wire_log=None):
+        """
+        pool is the SessionPool to send requests through. If None, the pool
+        shared by all clients of the service_url host is used.
+
+        If compress_responses is True the server is always told we accept
+        gzip and deflate encoded responses. Otherwise the Accept-Encoding
+        header is left as the HTTP library sets it, which for requests also
+        asks for gzip and deflate. Compressed responses are decoded either
+        way.
+
+        compress_requests_min is a size in bytes; request bodies at least
+        this large are sent gzip compressed. Leave it at None unless the
+        server is known to accept compressed requests.
+
+        If streaming is True, requests that know which elements of the
+        response they are interested in have those elements handed over as
+        soon as they are parsed, and the raw response is never held in
+        memory in full. See send() for details.
+
+        wire_log is the wirelog.WireLogger to log the traffic through. The
+        module wide wirelog.default is used if it is None.
+        """
+
         self.url = service_url
         self.user = user
         self.pwd = pwd
         self.auth = HTTPBasicAuth(user, pwd)
+        self.pool = pool if pool is not None else SessionPool.for_host(service_url)
+        self.cookies = RequestsCookieJar()
+
+        self.compress_responses = compress_responses
+        self.compress_requests_min = compress_requests_min
+        self.streaming = streaming
+        self.wire_log = wire_log if wire_log is not None else wirelog.default
 
-    def send (self, request, debug=False):
+    def send (self, request, debug=False, stats=None, stream_tag=None,
+              on_element=None):
         """
         Send the given rquest to the server, and return the response text as
         well as a parsed node object as a (resp.text, node) tuple.
 
         The response text is the raw xml including the soap headers and stuff.
+
+        If stats is a TransferStats object it is filled in with the byte
+        counts and timings of this exchange.
+
+        If stream_tag is not None the response is parsed incrementally as it
+        is read off the socket. Every element with that tag is passed to
+        on_element as soon as it is complete, after which it is cleared and
+        dropped from the tree. The returned node then contains everything
+        except those elements.
+
+        The exchange is logged if the wire logger is enabled and either
+        samples it or debug is True.
         """
 
+        if stats is None:
+            stats = TransferStats()
+
+        logged = self.wire_log.sample(force=debug)
+        if logged:
+            self.wire_log.request(self.url, request)
+
+        start = time.time()
+        body, headers = self._prepare_body(request, stats)
+
         try:
-            r = requests.post(self.url, auth=self.auth, data=request,
-                              headers={'Content-Type':'text/xml; charset=utf-8',
-                                       "Accept": "text/xml"})
-        except requests.exceptions.ConnectionError as e:
+            with self.pool.session() as sess:
+                r = sess.post(self.url, auth=self.auth, data=body,
+                              cookies=self.cookies, headers=headers,
+                              stream=True)
+                try:
+                    SoapHTTPError.check(r.status_code, r.headers)
+                    if stream_tag is None:
+                        data = r.raw.read(decode_content=False)
+                    else:
+                        node = self._parse_stream(r, stats, stream_tag,
+                                                  on_element)
+                except Exception:
+                    r.close()
+                    raise
+                r.raw.release_conn()
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
+            raise SoapConnectionError(e)
+        except (ProtocolError, ReadTimeoutError) as e:
+            ## The connection dropped, or stalled, part way through the
+            ## body, which requests leaves to urllib3 to report when the
+            ## body is read off the raw response.
             raise SoapConnectionError(e)
 
-        if debug:
-            logging.debug('%s', pretty_xml(r.text))
+        self.cookies.update(r.cookies)
+
+        if stream_tag is not None:
+            stats.elapsed = time.time() - start
+            if logged:
+                self.wire_log.response(self.url, '<!-- streamed -->', stats)
+            return node
+
+        data = self._decode_body(data, r.headers.get('Content-Encoding'),
+                                 stats)
+        stats.elapsed = time.time() - start
+
+        if logged:
+            self.wire_log.response(self.url, data, stats)
+
+        return SoapClient.parse_xml(data)
+
+    def _prepare_body (self, request, stats):
+        """
+        Return the (body, headers) to post for the given request, compressing
+        the body if it is large enough.
+        """
+
+        if isinstance(request, unicode):
+            request = request.encode('utf-8')
+
+        headers = {'Content-Type' : 'text/xml; charset=utf-8',
+                   'Accept'       : 'text/xml'}
+        if self.compress_responses:
+            headers['Accept-Encoding'] = 'gzip, deflate'
+
+        stats.request_raw_bytes = len(request)
+        if (self.compress_requests_min is not None and
+            len(request) >= self.compress_requests_min):
+            t = time.time()
+            c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            request = c.compress(request) + c.flush()
+            stats.compress_time = time.time() - t
+            stats.request_encoding = 'gzip'
+            headers['Content-Encoding'] = 'gzip'
+
+        stats.request_bytes = len(request)
+        return request, headers
+
+    @staticmethod
+    def _parse_stream (r, stats, tag, on_element):
+        """
+        Incrementally parse the streamed response r, handing over and then
+        freeing every element with the given tag. Returns the root of what
+        is left of the tree.
+        """
+
+        length = r.headers.get('Content-Length')
+        reader = StreamReader(r.raw, r.headers.get('Content-Encoding'), stats,
+                              length=int(length) if length else None)
+
+        root = None
+        stack = []
+        try:
+            for event, elem in ET.iterparse(reader, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = elem
+                    stack.append(elem)
+                    continue
+
+                stack.pop()
+                if elem.tag == tag:
+                    on_element(elem)
+                    elem.clear()
+                    if len(stack) > 0:
+                        stack[-1].remove(elem)
+        except ET.ParseError as e:
+            ## A body cut short without a Content-Length to tell, such as
+            ## one delimited by the connection closing, only shows up as
+            ## XML that ends part way through.
+            if reader.eof and len(stack) > 0:
+                raise SoapConnectionError(e)
+            raise
+
+        return root
+
+    @staticmethod
+    def _decode_body (data, encoding, stats):
+        """
+        Undo any Content-Encoding applied to the response body data.
+        """
+
+        stats.response_bytes = len(data)
+        stats.response_encoding = encoding
+
+        if encoding:
+            encoding = encoding.strip().lower()
+
+        t = time.time()
+        if encoding == 'gzip':
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            ## Some servers send a raw deflate stream without the zlib
+            ## header, despite what the RFC says.
+            try:
+                data = zlib.decompress(data)
+            except zlib.error:
+                data = zlib.decompress(data, -zlib.MAX_WBITS)
+        stats.decompress_time = time.time() - t
 
-        return SoapClient.parse_xml(r.text)
+        stats.response_raw_bytes = len(data)
+        return data
 
     @staticmethod
     def parse_xml (soap_resp):
@@ -141,3 +661,92 @@ class SoapClient(object):
                 return (i.text, i.attrib, root)
 
         return (None, None, root)
+
+class AsyncSoapClient(SoapClient):
+    """
+    A non-blocking flavour of SoapClient built on tornado's AsyncHTTPClient.
+    send() returns a Future that resolves to the parsed response node, so it
+    can be yielded from a tornado coroutine, or awaited on an asyncio event
+    loop (tornado >= 5 runs on top of asyncio under python 3).
+
+    Connection reuse is left to the http client. The curl based client
+    (AsyncHTTPClient.configure('tornado.curl_httpclient.CurlAsyncHTTPClient'))
+    keeps connections alive, the default simple client does not.
+    """
+
+    def __init__ (self, service_url, user, pwd, http_client=None,
+                  max_clients=100, compress_responses=False,
+                  compress_requests_min=None, request_timeout=120,
+                  wire_log=None):
+        """
+        max_clients is the maximum number of requests in flight at any time
+        on a http_client created by us; it is ignored if http_client is
+        given. See SoapClient for the compression and wire_log options.
+        """
+
+        self.url = service_url
+        self.user = user
+        self.pwd = pwd
+        self.cookies = Cookie.SimpleCookie()
+
+        self.compress_responses = compress_responses
+        self.compress_requests_min = compress_requests_min
+        self.streaming = False
+        self.request_timeout = request_timeout
+        self.wire_log = wire_log if wire_log is not None else wirelog.default
+
+        if http_client is None:
+            http_client = AsyncHTTPClient(force_instance=True,
+                                          max_clients=max_clients)
+        self.http = http_client
+
+    @gen.coroutine
+    def send (self, request, debug=False, stats=None):
+        """
+        Send the given request to the server and return a Future for the
+        parsed response node. stats is as for SoapClient.send(). Streaming
+        parse is not supported.
+        """
+
+        if stats is None:
+            stats = TransferStats()
+
+        logged = self.wire_log.sample(force=debug)
+        if logged:
+            self.wire_log.request(self.url, request)
+
+        start = time.time()
+        body, headers = self._prepare_body(request, stats)
+
+        cookie = '; '.join(['%s=%s' % (k, m.value) for k, m in
+                            self.cookies.items()])
+        if cookie:
+            headers['Cookie'] = cookie
+
+        req = HTTPRequest(self.url, method='POST', body=body, headers=headers,
+                          auth_username=self.user, auth_password=self.pwd,
+                          auth_mode='basic', decompress_response=False,
+                          request_timeout=self.request_timeout)
+        try:
+            r = yield self.http.fetch(req, raise_error=False)
+        except (HTTPError, IOError) as e:
+            raise SoapConnectionError(e)
+
+        if r.code == 599:
+            raise SoapConnectionError(r.error)
+        SoapHTTPError.check(r.code, r.headers)
+
+        for c in r.headers.get_list('Set-Cookie'):
+            self.cookies.load(c)
+
+        data = self._decode_body(r.body, r.headers.get('Content-Encoding'),
+                                 stats)
+        stats.elapsed = time.time() - start
+
+        if logged:
+            self.wire_log.response(self.url, data, stats)
+
+        raise gen.Return(SoapClient.parse_xml(data))
+
+    def close (self):
+        self.http.close()
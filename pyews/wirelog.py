@@ -0,0 +1,138 @@
+##
+## Created : Sun Oct 18 11:48:09 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Logging of the raw SOAP traffic. Requests go out exactly as rendered, and
+## nothing is formatted unless it is actually going to be written somewhere:
+## either the 'pyews.wire' logger is enabled for DEBUG, or a capture file has
+## been configured. Pretty printing in particular only happens when a log
+## record is emitted.
+##
+
+import logging, random, threading, time
+
+from   utils import pretty_xml
+
+class LazyXml(object):
+    """
+    Wraps a XML payload so that it is truncated and pretty printed only when
+    it is converted to a string, i.e. when a log record is formatted.
+    """
+
+    def __init__ (self, data, max_bytes=None, pretty=True):
+        self.data = data
+        self.max_bytes = max_bytes
+        self.pretty = pretty
+
+    def __str__ (self):
+        data = self.data
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            return '%s... [%d bytes truncated]' % (data[:self.max_bytes],
+                                                   len(data) - self.max_bytes)
+
+        if self.pretty:
+            try:
+                return pretty_xml(data).encode('utf-8')
+            except Exception:
+                pass
+
+        return data
+
+class WireLogger(object):
+    """
+    Logs SOAP requests and responses to a logger and/or a capture file.
+    Only a sample_rate fraction of exchanges are logged, and payloads larger
+    than max_bytes are truncated.
+    """
+
+    def __init__ (self, logger='pyews.wire', level=logging.DEBUG,
+                  sample_rate=1.0, max_bytes=64*1024, capture_file=None,
+                  pretty=True):
+        """
+        logger is the name of the logger to write to, at the given
+        level. capture_file is a file name or an open file object to which
+        the payloads are written verbatim (modulo truncation), irrespective
+        of whether the logger is enabled.
+        """
+
+        self.logger = logging.getLogger(logger)
+        self.level = level
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.pretty = pretty
+
+        self._lock = threading.Lock()
+        self.capture = None
+        if capture_file is not None:
+            self.set_capture_file(capture_file)
+
+    def set_capture_file (self, capture_file):
+        with self._lock:
+            if isinstance(capture_file, basestring):
+                capture_file = open(capture_file, 'ab')
+            self.capture = capture_file
+
+    def enabled (self):
+        return (self.capture is not None or
+                self.logger.isEnabledFor(self.level))
+
+    def sample (self, force=False):
+        """
+        Decide whether the exchange about to take place is to be logged. If
+        force is True the sample rate is ignored, but nothing is logged
+        unless a destination is enabled.
+        """
+
+        if not self.enabled():
+            return False
+
+        return force or self.sample_rate >= 1.0 or \
+            random.random() < self.sample_rate
+
+    def request (self, url, body):
+        self._write('Request', url, body)
+
+    def response (self, url, body, stats=None):
+        self._write('Response', url, body, stats)
+
+    ##
+    ## Internal methods
+    ##
+
+    def _write (self, what, url, body, stats=None):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, '%s (%s): %s', what, url,
+                            LazyXml(body, self.max_bytes, self.pretty))
+            if stats is not None:
+                self.logger.log(self.level, '%s', stats)
+
+        if self.capture is not None:
+            data = str(LazyXml(body, self.max_bytes, pretty=False))
+            with self._lock:
+                self.capture.write('### %s %s %s (%d bytes)\n' % (
+                    time.strftime('%Y-%m-%dT%H:%M:%S'), what, url, len(body)))
+                self.capture.write(data)
+                self.capture.write('\n')
+                self.capture.flush()
+
+## The wire logger used by soap clients that are not given one of their own
+default = WireLogger()
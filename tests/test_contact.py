@@ -0,0 +1,110 @@
+##
+## Created : Mon Oct 19 01:41:36 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Decoding of contacts from response elements, eagerly and lazily. Run
+## from the top level directory as:
+##
+##   python -m unittest discover tests
+##
+
+import unittest
+
+from   pyews.soap         import SoapClient, T_NAMESPACE
+from   pyews.ews          import mapitags
+from   pyews.ews.contact  import Contact
+from   pyews.ews.data     import ews_pt, ews_pid
+
+def eprop_xml (ptag, value):
+    return ('<t:ExtendedProperty><t:ExtendedFieldURI PropertyType="%s" '
+            'PropertyTag="%s"/><t:Value>%s</t:Value></t:ExtendedProperty>' % (
+                ews_pt(ptag), ews_pid(ptag), value))
+
+CONTACT_XML = ''.join([
+    '<t:Contact xmlns:t="%s">' % T_NAMESPACE,
+    '<t:ItemId Id="AAMkId" ChangeKey="EQAAAB"/>',
+    '<t:ParentFolderId Id="AAMkFolder" ChangeKey="AQAAAA"/>',
+    '<t:ItemClass>IPM.Contact</t:ItemClass>',
+    '<t:Body BodyType="Text">Met at the conference</t:Body>',
+    '<t:DateTimeCreated>2014-03-01T10:00:00Z</t:DateTimeCreated>',
+    eprop_xml(mapitags.PR_GENDER, '2'),
+    eprop_xml(mapitags.PR_LAST_MODIFICATION_TIME, '2014-03-02T10:00:00Z'),
+    '<t:FileAs>Xu, Gus</t:FileAs>',
+    '<t:DisplayName>Gus Xu</t:DisplayName>',
+    '<t:GivenName>Gus</t:GivenName>',
+    '<t:Initials>GX</t:Initials>',
+    '<t:CompleteName><t:Title>Dr</t:Title><t:FirstName>Gustav</t:FirstName>',
+    '<t:MiddleName>Q</t:MiddleName><t:LastName>Xu</t:LastName>',
+    '<t:Suffix>Jr</t:Suffix><t:FullName>Gustav Q Xu</t:FullName>',
+    '<t:Nickname>Gussie</t:Nickname></t:CompleteName>',
+    '<t:CompanyName>Acme</t:CompanyName>',
+    '<t:EmailAddresses><t:Entry Key="EmailAddress1">gus@example.com',
+    '</t:Entry></t:EmailAddresses>',
+    '<t:PhoneNumbers><t:Entry Key="MobilePhone">+1 555 0100</t:Entry>',
+    '</t:PhoneNumbers>',
+    '<t:JobTitle>Engineer</t:JobTitle>',
+    '<t:SpouseName>Ann</t:SpouseName>',
+    '<t:Surname>Xu</t:Surname>',
+    '</t:Contact>',
+])
+
+NAME_PARTS = ['title', 'given_name', 'first_name', 'middle_name',
+              'last_name', 'surname', 'suffix', 'initials', 'nickname',
+              'full_name']
+
+def summary (c):
+    cn = c.complete_name
+    return ([getattr(cn, x).value for x in NAME_PARTS] +
+            [c.itemid.value, c.change_key.value, c.parent_fid.value,
+             c.display_name.value, c.file_as.value, c.company_name.value,
+             c.job_title.value, c.spouse_name.value, c.notes.value,
+             str(c.emails), str(c.phones), c.gender.value,
+             c.last_modified_time.value, c._firstname, c._lastname,
+             c._displayname])
+
+class TestContactDecoding(unittest.TestCase):
+    def setUp (self):
+        self.node = SoapClient.parse_xml(CONTACT_XML)
+
+    def test_complete_name (self):
+        cn = Contact(None, resp_node=self.node).complete_name
+        self.assertEqual([getattr(cn, x).value for x in NAME_PARTS],
+                         ['Dr', 'Gus', 'Gustav', 'Q', 'Xu', 'Xu', 'Jr', 'GX',
+                          'Gussie', 'Gustav Q Xu'])
+
+    def test_initials_without_complete_name (self):
+        node = SoapClient.parse_xml(CONTACT_XML.replace('<t:Initials>GX',
+                                                        '<t:Initials>GQX'))
+        for child in node.findall('{%s}CompleteName' % T_NAMESPACE):
+            node.remove(child)
+
+        for lazy in (False, True):
+            c = Contact(None, resp_node=node, lazy=lazy)
+            self.assertEqual(c.complete_name.initials.value, 'GQX')
+
+    def test_lazy_same_as_eager (self):
+        eager = Contact(None, resp_node=self.node)
+        lazy = Contact(None, resp_node=self.node, lazy=True)
+
+        self.assertEqual(summary(lazy), summary(eager))
+        self.assertEqual(str(lazy), str(eager))
+        self.assertEqual(lazy.write_to_xml(), eager.write_to_xml())
+
+if __name__ == '__main__':
+    unittest.main()
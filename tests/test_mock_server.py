@@ -0,0 +1,342 @@
+##
+## Created : Mon Oct 19 01:05:22 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Offline tests of the bulk operations of ExchangeService against the mock
+## server. Run from the top level directory as:
+##
+##   python -m unittest discover tests
+##
+
+import logging, re, unittest
+
+from   pyews.pyews                  import ExchangeService, WebCredentials
+from   pyews.soap                   import SessionPool, QName_M
+from   pyews.ews.batching           import OP_FIND_ITEM
+from   pyews.ews.data               import DeleteType
+from   pyews.ews.folder             import Folder
+from   pyews.ews.request_response   import ItemList, BulkOutcome
+from   pyews.mock.mailbox           import Mailbox
+from   pyews.mock.server            import MockEWSServer, error_xml, item_ids
+
+NUM_CONTACTS = 120
+
+class MockServerTestCase(unittest.TestCase):
+    """
+    Starts a mock server with a fresh mailbox of NUM_CONTACTS contacts for
+    each test, and an ExchangeService talking to it.
+    """
+
+    def setUp (self):
+        self.mailbox = Mailbox.synthetic(contacts=NUM_CONTACTS)
+        self.server = MockEWSServer(self.mailbox)
+        self.server.start()
+
+        self.ews = ExchangeService()
+        self.ews.credentials = WebCredentials('user', 'pwd')
+        self.ews.Url = self.server.url
+        ## A pool of our own, so that its keep-alive connections can be
+        ## closed before the server is stopped
+        self.pool = SessionPool()
+        self.ews.init_soap_client(pool=self.pool)
+
+        self.contacts = Folder.bind(self.ews, 'contacts')
+
+    def tearDown (self):
+        self.pool.close()
+        self.server.stop()
+
+    def mock_ids (self, distinguished='contacts'):
+        f = self.mailbox.get_folder(distinguished=distinguished)
+        return set(f.items.keys())
+
+    def check_all (self, items):
+        """Check that items are all the contacts, each of them once."""
+
+        ids = [x.itemid.value for x in items]
+        self.assertEqual(len(ids), NUM_CONTACTS)
+        self.assertEqual(set(ids), self.mock_ids())
+
+class TestFindItems(MockServerTestCase):
+    def setUp (self):
+        MockServerTestCase.setUp(self)
+        ## Several pages, the last of them short
+        self.ews.batch_sizer.set_bounds(OP_FIND_ITEM, 25, 25)
+
+    def test_serial (self):
+        items = self.ews.FindItems(self.contacts, prefetch=1)
+        self.check_all(items)
+        self.assertTrue(all(x.display_name.value for x in items))
+
+    def test_prefetch (self):
+        self.check_all(self.ews.FindItems(self.contacts, prefetch=4))
+
+    def test_ids_only (self):
+        self.check_all(self.ews.FindItems(self.contacts, ids_only=True,
+                                          prefetch=3))
+
+    def test_pipeline (self):
+        self.check_all(self.ews.FindItems(self.contacts, pipeline=True))
+
+class TestCappedFindItems(MockServerTestCase):
+    """
+    Paging against a server that sends fewer items in a page than are
+    asked for, as Exchange does beyond its EWSFindCountLimit.
+    """
+
+    def setUp (self):
+        MockServerTestCase.setUp(self)
+        self.ews.batch_sizer.set_bounds(OP_FIND_ITEM, 50, 50)
+        self.server.find_count_limit = 20
+
+    def cap_later_pages (self, limit):
+        """Have the server cap the pages after the first one to limit."""
+
+        server = self.server
+        find = server.op_FindItem
+        first_limit = server.find_count_limit
+
+        def op_FindItem (node):
+            view = node.find(QName_M('IndexedPageItemView'))
+            first = view is None or view.attrib.get('Offset') == '0'
+            server.find_count_limit = first_limit if first else limit
+            return find(node)
+
+        server.op_FindItem = op_FindItem
+
+    def test_serial (self):
+        self.check_all(self.ews.FindItems(self.contacts, ids_only=True,
+                                          prefetch=1))
+
+    def test_prefetch (self):
+        self.check_all(self.ews.FindItems(self.contacts, ids_only=True,
+                                          prefetch=4))
+
+    def test_prefetch_short_later_pages (self):
+        ## The parallel scan sizes its pages to the first one, finds the
+        ## later ones short, and goes over the view serially
+        self.cap_later_pages(12)
+        self.check_all(self.ews.FindItems(self.contacts, ids_only=True,
+                                          prefetch=4))
+
+    def test_iter_items (self):
+        self.check_all(list(self.ews.iter_items(self.contacts,
+                                                pipeline=False)))
+
+    def test_iter_items_batch_size (self):
+        self.check_all(list(self.ews.iter_items(self.contacts, batch_size=30,
+                                                pipeline=False)))
+
+    def test_iter_items_pipeline (self):
+        self.check_all(list(self.ews.iter_items(self.contacts,
+                                                pipeline=True)))
+
+    def test_pipeline (self):
+        self.check_all(self.ews.FindItems(self.contacts, pipeline=True))
+
+    def test_pipeline_short_later_pages (self):
+        self.cap_later_pages(7)
+        self.check_all(self.ews.FindItems(self.contacts, pipeline=True))
+
+    def find_sizes (self, limit, times=3):
+        """
+        Find the contacts a few times with the batch size free to move from
+        30 and the server capping pages at limit. Return the size after.
+        """
+
+        self.ews.batch_sizer.set_bounds(OP_FIND_ITEM, 10, 1000, size=30)
+        self.server.find_count_limit = limit
+        for i in range(times):
+            self.check_all(self.ews.FindItems(self.contacts, ids_only=True,
+                                              prefetch=1))
+
+        return self.ews.batch_size(OP_FIND_ITEM)
+
+    def test_no_growth_past_cap (self):
+        ## Every page comes back short, so none of them is a reason to grow
+        self.assertEqual(self.find_sizes(20), 30)
+
+    def test_growth_without_cap (self):
+        self.assertTrue(self.find_sizes(1000) > 30)
+
+class TestGetItems(MockServerTestCase):
+    def test_errors_by_id (self):
+        shells = self.ews.FindItems(self.contacts, ids_only=True)
+        ids = [x.itemid.value for x in shells[:6]]
+        asked = ids[:2] + ['bogus-1'] + ids[2:4] + ['bogus-2'] + ids[4:]
+
+        items = self.ews.GetItems(asked, chunk_size=3)
+        self.assertTrue(isinstance(items, ItemList))
+        self.assertEqual([x.itemid.value for x in items], ids)
+        self.assertTrue(items.has_errors())
+        self.assertEqual(sorted(items.errors.keys()), ['bogus-1', 'bogus-2'])
+        self.assertEqual(items.errors['bogus-1'].resp_code,
+                         'ErrorItemNotFound')
+
+    def warn (self, ids, code, with_item):
+        """
+        Have the server send a warning with the given code in place of the
+        messages for ids, with their items if with_item is True.
+        """
+
+        server = self.server
+        get = server.op_GetItem
+
+        def op_GetItem (node):
+            asked = [iid for iid, ck in item_ids(node.find(QName_M(
+                'ItemIds')))]
+            msgs = get(node)
+            for i, iid in enumerate(asked):
+                if iid not in ids:
+                    continue
+                if with_item:
+                    msgs[i] = re.sub(r'"Success"><m:ResponseCode>NoError<',
+                                     '"Warning"><m:ResponseCode>%s<' % code,
+                                     msgs[i])
+                else:
+                    msgs[i] = error_xml('GetItem', code, 'Warned').replace(
+                        'ResponseClass="Error"', 'ResponseClass="Warning"')
+            return msgs
+
+        server.op_GetItem = op_GetItem
+
+    def test_warning_without_item (self):
+        ## As when the server stops processing a batch part way through
+        shells = self.ews.FindItems(self.contacts, ids_only=True)
+        ids = [x.itemid.value for x in shells[:6]]
+        self.warn(ids[2:4], 'ErrorBatchProcessingStopped', False)
+
+        items = self.ews.GetItems(ids, chunk_size=6)
+        self.assertEqual([x.itemid.value for x in items], ids[:2] + ids[4:])
+        self.assertEqual(sorted(items.errors.keys()), sorted(ids[2:4]))
+        self.assertEqual(items.errors[ids[2]].resp_code,
+                         'ErrorBatchProcessingStopped')
+        self.assertFalse(items.has_warnings())
+
+    def test_warning_with_item (self):
+        shells = self.ews.FindItems(self.contacts, ids_only=True)
+        ids = [x.itemid.value for x in shells[:6]]
+        self.warn(ids[1:2], 'ErrorCorruptData', True)
+
+        items = self.ews.GetItems(ids, chunk_size=6)
+        self.assertEqual([x.itemid.value for x in items], ids)
+        self.assertFalse(items.has_errors())
+        self.assertEqual(items.warnings.keys(), ids[1:2])
+        self.assertEqual(items.warnings[ids[1]].resp_code, 'ErrorCorruptData')
+
+class TestUpdateItems(MockServerTestCase):
+    def test_change_key_conflict (self):
+        shells = self.ews.FindItems(self.contacts, ids_only=True)
+        items = self.ews.GetItems([x.itemid.value for x in shells[:4]])
+
+        ## Change two of them behind our back, which makes their ChangeKeys
+        ## stale
+        stale = [self.mailbox.get_contact(x.itemid.value) for x in items[:2]]
+        for mock in stale:
+            self.mailbox.touch(mock)
+
+        for i, item in enumerate(items):
+            item.job_title.value = 'Title %d' % i
+
+        ops = self.server.stats.operations
+        before = dict(ops)
+        res = self.ews.UpdateItems(items)
+        self.assertTrue(isinstance(res, BulkOutcome))
+        self.assertFalse(res.has_errors(), res.error_codes())
+
+        ## The stale ones were refreshed and sent again
+        self.assertEqual(ops['UpdateItem'] - before.get('UpdateItem', 0), 2)
+        self.assertEqual(ops['GetItem'] - before['GetItem'], 1)
+
+        for i, item in enumerate(items):
+            mock = self.mailbox.get_contact(item.itemid.value)
+            self.assertEqual(mock.fields.get('JobTitle'), 'Title %d' % i)
+            self.assertEqual(item.change_key.value, mock.change_key)
+
+class TestDeleteItems(MockServerTestCase):
+    def delete (self, delete_type):
+        ids = sorted(self.mock_ids())[:5]
+        res = self.ews.DeleteItems(ids + ['bogus'], delete_type=delete_type,
+                                   chunk_size=2)
+
+        self.assertTrue(isinstance(res, BulkOutcome))
+        self.assertEqual(res.by_id().keys(), ids + ['bogus'])
+        self.assertEqual(res.error_codes(), {'ErrorItemNotFound' : 1})
+        self.assertEqual(self.mock_ids() & set(ids), set())
+
+        return ids
+
+    def test_hard_delete (self):
+        ids = self.delete(DeleteType.HardDelete)
+        self.assertTrue(all(self.mailbox.get_contact(x) is None for x in ids))
+
+    def test_soft_delete (self):
+        ids = self.delete(DeleteType.SoftDelete)
+        self.assertTrue(all(self.mailbox.get_contact(x) is None for x in ids))
+
+    def test_move_to_deleted_items (self):
+        ids = self.delete(DeleteType.MoveToDeletedItems)
+        self.assertEqual(self.mock_ids('deleteditems'), set(ids))
+
+    def test_unknown_delete_type (self):
+        self.assertRaises(ValueError, self.ews.DeleteItems, ['x'],
+                          delete_type='Shred')
+
+class TestSyncFolderItems(MockServerTestCase):
+    def setUp (self):
+        MockServerTestCase.setUp(self)
+        self.server.sync_max_changes = 50
+
+    def sync (self, state):
+        pages = []
+        states = []
+
+        def on_changes (news, mods, dels):
+            pages.append((news, mods, dels))
+
+        state = self.ews.sync_folder_items(self.contacts.Id, state,
+                                           on_changes, states.append)
+        return state, pages, states
+
+    def test_drain (self):
+        state, pages, states = self.sync(None)
+
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(states[-1], state)
+        news = [x.itemid.value for p in pages for x in p[0]]
+        self.assertEqual(len(news), NUM_CONTACTS)
+        self.assertEqual(set(news), self.mock_ids())
+
+        ## Nothing more until something changes
+        state, pages, states = self.sync(state)
+        self.assertEqual([len(x) for p in pages for x in p], [0, 0, 0])
+
+        ids = sorted(self.mock_ids())
+        self.mailbox.touch(self.mailbox.get_contact(ids[0]))
+        self.ews.DeleteItems([ids[1]], delete_type=DeleteType.HardDelete)
+
+        state, pages, states = self.sync(state)
+        news, mods, dels = [sum(p, []) for p in zip(*pages)]
+        self.assertEqual(news, [])
+        self.assertEqual([x.itemid.value for x in mods], [ids[0]])
+        self.assertEqual([x.itemid.value for x in dels], [ids[1]])
+
+if __name__ == '__main__':
+    logging.disable(logging.ERROR)
+    unittest.main()
@@ -0,0 +1,213 @@
+##
+## Created : Mon Oct 19 02:22:40 IST 2026
+##
+## Copyright (C) 2014 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Tests of the sync state stores, on their own and as the checkpoint of
+## ExchangeService.sync_folder_items() against the mock server. Run from
+## the top level directory as:
+##
+##   python -m unittest discover tests
+##
+
+import logging, os, re, shutil, tempfile, threading, unittest
+
+from   pyews.ews.syncstate  import FileSyncStateStore, SQLiteSyncStateStore
+from   test_mock_server     import MockServerTestCase, NUM_CONTACTS
+
+MAILBOX = u'j\xfcrgen@example.com'
+FOLDER  = u'AAMkAD/\u0444\u043e\u043b\u0434\u0435\u0440=='
+
+class StoreTests(object):
+    """
+    Tests common to all the stores. Subclasses make self.store in setUp()
+    with new_store(), and close it in tearDown().
+    """
+
+    def setUp (self):
+        self.tmp = tempfile.mkdtemp(prefix='pyews-test-')
+        self.store = self.new_store()
+
+    def tearDown (self):
+        self.store.close()
+        shutil.rmtree(self.tmp)
+
+    def test_missing (self):
+        self.assertEqual(self.store.get(MAILBOX, FOLDER), None)
+        self.assertEqual(self.store.folders(MAILBOX), [])
+
+    def test_round_trip (self):
+        self.store.set(MAILBOX, FOLDER, u'H4sIAAAA\u2603')
+        self.assertEqual(self.store.get(MAILBOX, FOLDER), u'H4sIAAAA\u2603')
+
+        self.store.set(MAILBOX, FOLDER, u'H4sIAAAB')
+        self.assertEqual(self.store.get(MAILBOX, FOLDER), u'H4sIAAAB')
+
+        ## Seen by a store opened afresh on the same data
+        other = self.new_store()
+        try:
+            self.assertEqual(other.get(MAILBOX, FOLDER), u'H4sIAAAB')
+        finally:
+            other.close()
+
+    def test_delete_and_folders (self):
+        for fid in [FOLDER, u'contacts', u'calendar']:
+            self.store.set(MAILBOX, fid, u'state-' + fid)
+        self.store.set(u'other@example.com', u'inbox', u'state')
+
+        self.assertEqual(sorted(self.store.folders(MAILBOX)),
+                         sorted([FOLDER, u'contacts', u'calendar']))
+
+        self.store.delete(MAILBOX, FOLDER)
+        self.store.delete(MAILBOX, u'no-such-folder')
+        self.assertEqual(self.store.get(MAILBOX, FOLDER), None)
+        self.assertEqual(sorted(self.store.folders(MAILBOX)),
+                         [u'calendar', u'contacts'])
+        self.assertEqual(self.store.folders(u'other@example.com'),
+                         [u'inbox'])
+
+    def test_concurrent_writers (self):
+        nthreads = 8
+        nwrites = 25
+        errors = []
+
+        def write (t):
+            try:
+                for i in range(nwrites):
+                    ## One folder of its own, and one shared by all
+                    state = u'%d-%d' % (t, i)
+                    self.store.set(MAILBOX, u'folder-%d' % t, state)
+                    self.store.set(MAILBOX, FOLDER, state)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(t,))
+                   for t in range(nthreads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        for t in range(nthreads):
+            self.assertEqual(self.store.get(MAILBOX, u'folder-%d' % t),
+                             u'%d-%d' % (t, nwrites - 1))
+
+        ## Whichever write came last, whole
+        last = [u'%d-%d' % (t, nwrites - 1) for t in range(nthreads)]
+        self.assertTrue(self.store.get(MAILBOX, FOLDER) in last)
+        self.assertEqual(len(self.store.folders(MAILBOX)), nthreads + 1)
+
+class TestFileSyncStateStore(StoreTests, unittest.TestCase):
+    def new_store (self):
+        return FileSyncStateStore(os.path.join(self.tmp, 'states'),
+                                  fsync=False)
+
+class TestSQLiteSyncStateStore(StoreTests, unittest.TestCase):
+    def new_store (self):
+        return SQLiteSyncStateStore(os.path.join(self.tmp, 'states.db'))
+
+class TestCheckpoint(MockServerTestCase):
+    def setUp (self):
+        MockServerTestCase.setUp(self)
+        self.server.sync_max_changes = 50
+
+        self.tmp = tempfile.mkdtemp(prefix='pyews-test-')
+        self.stores = [FileSyncStateStore(os.path.join(self.tmp, 'states'),
+                                          fsync=False),
+                       SQLiteSyncStateStore(os.path.join(self.tmp,
+                                                         'states.db'))]
+
+    def tearDown (self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.tmp)
+        MockServerTestCase.tearDown(self)
+
+    def sync (self, store, fail_at=None):
+        """
+        Sync the contacts folder from the state saved in store, and return
+        the ids of the new items seen. If fail_at is given, on_changes fails
+        on that page, as if the process died there.
+        """
+
+        fid = self.contacts.Id
+        news = []
+        pages = []
+
+        def on_changes (n, m, d):
+            if len(pages) == fail_at:
+                raise RuntimeError('Died on page %d' % fail_at)
+            pages.append(n)
+            news.extend(x.itemid.value for x in n)
+
+        try:
+            self.ews.sync_folder_items(fid, store.get(MAILBOX, fid),
+                                       on_changes,
+                                       store.checkpoint(MAILBOX, fid))
+        except RuntimeError:
+            pass
+
+        return news
+
+    def test_resume (self):
+        fid = self.contacts.Id
+        for store in self.stores:
+            ## Two pages of 50 made it, the third did not
+            first = self.sync(store, fail_at=2)
+            self.assertEqual(len(first), 100)
+            self.assertTrue(store.get(MAILBOX, fid) is not None)
+
+            rest = self.sync(store)
+            self.assertEqual(len(rest), NUM_CONTACTS - 100)
+            self.assertEqual(set(first + rest), self.mock_ids())
+            self.assertEqual(store.folders(MAILBOX), [fid])
+
+            ## All caught up
+            self.assertEqual(self.sync(store), [])
+
+    def test_missing_sync_state (self):
+        ## A response without a SyncState neither saves one nor throws away
+        ## the one saved before
+        server = self.server
+        sync = server.op_SyncFolderItems
+        strip = [False]
+
+        def op_SyncFolderItems (node):
+            msgs = sync(node)
+            if strip[0]:
+                msgs = [re.sub(r'<m:SyncState>[^<]*</m:SyncState>', '', x)
+                        for x in msgs]
+            return msgs
+
+        server.op_SyncFolderItems = op_SyncFolderItems
+
+        fid = self.contacts.Id
+        for store in self.stores:
+            strip[0] = False
+            self.sync(store, fail_at=1)
+            saved = store.get(MAILBOX, fid)
+            self.assertTrue(saved is not None)
+
+            strip[0] = True
+            self.assertEqual(len(self.sync(store)), 50)
+            self.assertEqual(store.get(MAILBOX, fid), saved)
+
+if __name__ == '__main__':
+    logging.disable(logging.ERROR)
+    unittest.main()